@@ -0,0 +1,149 @@
+'''
+Pooled asyncio HTTP transport for the asyncio pScheduler clients. Requires aiohttp.
+'''
+
+import asyncio
+import json
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+from .transport import create_ca_context
+from .utils import http_request_args
+
+
+class AsyncResponse(object):
+    '''
+    Fully read aiohttp response with the parts of the requests Response interface the
+    pScheduler clients use (ok, status_code, reason, text and json()), so response
+    handling can be shared with the synchronous clients.
+    '''
+
+    def __init__(self, status_code, reason, text):
+        self.status_code = status_code
+        self.reason = reason
+        self.text = text
+
+    @property
+    def ok(self):
+        return self.status_code < 400
+
+    def json(self):
+        return json.loads(self.text)
+
+    def close(self):
+        pass
+
+
+class AsyncStreamResponse(object):
+    '''
+    aiohttp response whose body has not been read yet, returned when send_http_request is
+    given stream=True. iter_content() is an async iterator over the body, and close() must
+    be called once done with it, same as a streamed requests Response.
+    '''
+
+    def __init__(self, resp):
+        self._resp = resp
+        self.status_code = resp.status
+        self.reason = resp.reason
+
+    @property
+    def ok(self):
+        return self.status_code < 400
+
+    def iter_content(self, chunk_size=65536):
+        return self._resp.content.iter_chunked(chunk_size)
+
+    def close(self):
+        self._resp.close()
+
+
+class AsyncHttpTransport(object):
+    '''
+    Keeps an aiohttp ClientSession per local bind address and verify setting, each with its own
+    keep-alive connection pool. limit caps the connections open at once across all leads
+    of a session and limit_per_host caps them per lead (0 means no per-lead limit).
+    Create and use it from within a running event loop and call close() when done.
+    '''
+
+    def __init__(self, **kwargs):
+        if aiohttp is None:
+            raise ImportError("aiohttp is required for the asyncio pScheduler client")
+        self.limit = kwargs.get('limit', 500)
+        self.limit_per_host = kwargs.get('limit_per_host', 0)
+        self._sessions = {}
+        self._ssl_contexts = {}
+
+    async def send_http_request(self, **kwargs):
+        '''
+        Accepts the same arguments and returns the same dict as Utils.send_http_request.
+        With stream=True a successful response is an AsyncStreamResponse whose body is read
+        by the caller, error responses are always read whole.
+        '''
+        args = http_request_args(**kwargs)
+        resp = None
+        try:
+            session = self.session(bind_address=args['bind_address'],
+                                   verify=kwargs.get('ca_certificate_file', kwargs.get('verify_hostname', False)))
+            resp = await session.request(
+                kwargs.get('connection_type'),
+                args['url'],
+                params=args['params'],
+                json=kwargs.get('data'),
+                headers=kwargs.get('headers'),
+                timeout=aiohttp.ClientTimeout(total=args['timeout']),
+                allow_redirects=kwargs.get('allow_redirects', True)
+            )
+            if kwargs.get('stream') and resp.status < 400:
+                response = AsyncStreamResponse(resp)
+                resp = None
+                return {'response': response, 'exception': None}
+            text = await resp.text()
+            return {'response': AsyncResponse(resp.status, resp.reason, text), 'exception': None}
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            return {'response': None, 'exception': e}
+        finally:
+            if resp is not None:
+                resp.release()
+
+    def session(self, bind_address=None, verify=False):
+        '''
+        Returns the session for the given bind address and verify setting, creating it if
+        needed. verify is a CA file or directory, True to use the system CAs, or a false
+        value to skip verification, same as the synchronous transport.
+        '''
+        if not (verify and isinstance(verify, str)):
+            verify = bool(verify)
+        key = (bind_address or '', verify)
+        session = self._sessions.get(key)
+        if session is None or session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                local_addr=(bind_address, 0) if bind_address else None,
+                ssl=self._ssl(verify)
+            )
+            session = aiohttp.ClientSession(connector=connector)
+            self._sessions[key] = session
+        return session
+
+    def _ssl(self, verify):
+        #aiohttp takes an SSLContext, True for default verification or False to skip it
+        if isinstance(verify, str):
+            context = self._ssl_contexts.get(verify)
+            if context is None:
+                context = create_ca_context(verify)
+                self._ssl_contexts[verify] = context
+            return context
+        return bool(verify)
+
+    async def close(self):
+        '''Closes all sessions and their pooled connections'''
+        sessions = list(self._sessions.values())
+        self._sessions = {}
+        for session in sessions:
+            await session.close()
@@ -0,0 +1,223 @@
+'''
+Dual-stack connection racing (RFC 8305 "Happy Eyeballs") for the HTTP transport
+'''
+
+from ipaddress import ip_address
+import errno
+import selectors
+import socket
+import threading
+import time
+
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import ConnectTimeoutError, NameResolutionError, NewConnectionError
+from urllib3.util.timeout import _DEFAULT_TIMEOUT
+
+
+class FamilyCache(object):
+    '''
+    Remembers which address family (socket.AF_INET or socket.AF_INET6) last won the race
+    for a host so the next connection tries it first. Safe to use from multiple threads.
+    '''
+
+    def __init__(self):
+        self._families = {}
+        self._lock = threading.Lock()
+
+    def get(self, host, source_address=None):
+        with self._lock:
+            return self._families.get((host, source_address or ''))
+
+    def set(self, host, source_address, family):
+        with self._lock:
+            self._families[(host, source_address or '')] = family
+
+    def to_json(self):
+        '''Returns the winning family of each host as "ipv4" or "ipv6"'''
+        with self._lock:
+            return {
+                (host if not source else "{} (bind {})".format(host, source)): ('ipv6' if family == socket.AF_INET6 else 'ipv4')
+                for (host, source), family in self._families.items()
+            }
+
+
+def sort_addresses(addrinfo, preferred_family=None):
+    '''
+    Orders getaddrinfo results by interleaving address families, starting with
+    preferred_family, or IPv6 if not given (RFC 8305 section 4).
+    '''
+    if preferred_family is None:
+        preferred_family = socket.AF_INET6
+    first = [a for a in addrinfo if a[0] == preferred_family]
+    rest = [a for a in addrinfo if a[0] != preferred_family]
+    ordered = []
+    for i in range(max(len(first), len(rest))):
+        if i < len(first):
+            ordered.append(first[i])
+        if i < len(rest):
+            ordered.append(rest[i])
+    return ordered
+
+
+def create_connection(address, timeout=None, source_address=None, socket_options=None,
+                      delay=0.25, family_cache=None):
+    '''
+    Connects to address (host, port) like urllib3's create_connection, but when the host
+    has several addresses a new attempt is started every delay seconds without abandoning
+    the earlier ones, and the first to connect wins. If source_address is set only
+    addresses of the same family are tried. The winning family is remembered in
+    family_cache. Raises socket.gaierror if the host can't be resolved, socket.timeout if
+    nothing connects within timeout and OSError for other failures.
+    '''
+    host, port = address
+    if host.startswith('['):
+        host = host.strip('[]')
+    source_host = source_address[0] if source_address else None
+
+    family = socket.AF_UNSPEC
+    if source_host:
+        try:
+            family = socket.AF_INET6 if ip_address(source_host).version == 6 else socket.AF_INET
+        except ValueError:
+            #hostname as bind address, let the OS sort it out
+            pass
+    addrinfo = socket.getaddrinfo(host, port, family, socket.SOCK_STREAM)
+    if not addrinfo:
+        raise OSError("getaddrinfo returns an empty list")
+    preferred = family_cache.get(host, source_host) if family_cache is not None else None
+    addrinfo = sort_addresses(addrinfo, preferred)
+
+    #timeout may also be None (wait forever) or urllib3's default sentinel
+    deadline = None
+    if isinstance(timeout, (int, float)):
+        deadline = time.monotonic() + timeout
+
+    selector = selectors.DefaultSelector()
+    pending = {}
+    error = None
+    try:
+        next_attempt = 0
+        while True:
+            now = time.monotonic()
+            if deadline is not None and now >= deadline:
+                raise socket.timeout("timed out")
+
+            #start a new attempt if nothing is in flight or the last one has had delay seconds
+            if next_attempt < len(addrinfo) and (not pending or now >= next_start):
+                af, socktype, proto, canonname, sa = addrinfo[next_attempt]
+                next_attempt += 1
+                sock = None
+                try:
+                    sock = socket.socket(af, socktype, proto)
+                    if socket_options:
+                        for opt in socket_options:
+                            sock.setsockopt(*opt)
+                    if source_address:
+                        sock.bind(source_address)
+                    sock.setblocking(False)
+                    result = sock.connect_ex(sa)
+                    if result not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EAGAIN):
+                        raise OSError(result, "Connect call failed {}".format(sa))
+                    selector.register(sock, selectors.EVENT_WRITE, af)
+                    pending[sock] = sa
+                except OSError as e:
+                    error = e
+                    if sock is not None:
+                        sock.close()
+                    #try the next address right away
+                    continue
+                next_start = time.monotonic() + delay
+
+            if not pending:
+                if next_attempt >= len(addrinfo):
+                    break
+                continue
+
+            #wait until a connection completes, the next attempt is due or time runs out
+            wait = None
+            if next_attempt < len(addrinfo):
+                wait = max(0, next_start - time.monotonic())
+            if deadline is not None:
+                remaining = max(0, deadline - time.monotonic())
+                wait = remaining if wait is None else min(wait, remaining)
+            for key, _ in selector.select(wait):
+                sock = key.fileobj
+                result = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                selector.unregister(sock)
+                sa = pending.pop(sock)
+                if result:
+                    error = OSError(result, "Connect call failed {}".format(sa))
+                    sock.close()
+                    continue
+                #winner, hand back a blocking socket like socket.create_connection does
+                pending_socks = list(pending.keys())
+                pending.clear()
+                for other in pending_socks:
+                    selector.unregister(other)
+                    other.close()
+                sock.setblocking(True)
+                if timeout is not _DEFAULT_TIMEOUT:
+                    sock.settimeout(timeout)
+                if family_cache is not None:
+                    family_cache.set(host, source_host, key.data)
+                return sock
+
+        if error is not None:
+            raise error
+        raise OSError("Unable to connect to {}".format(host))
+    finally:
+        for sock in pending:
+            sock.close()
+        selector.close()
+
+
+class HappyEyeballsHTTPConnection(HTTPConnection):
+    '''HTTPConnection that races the addresses of dual-stack hosts'''
+
+    #set on the subclasses made by connection_pool_classes
+    family_cache = None
+    delay = 0.25
+
+    def _new_conn(self):
+        try:
+            sock = create_connection(
+                (self._dns_host, self.port),
+                self.timeout,
+                source_address=self.source_address,
+                socket_options=self.socket_options,
+                delay=self.delay,
+                family_cache=self.family_cache
+            )
+        except socket.gaierror as e:
+            raise NameResolutionError(self.host, self, e) from e
+        except socket.timeout as e:
+            raise ConnectTimeoutError(
+                self,
+                "Connection to {} timed out. (connect timeout={})".format(self.host, self.timeout),
+            ) from e
+        except OSError as e:
+            raise NewConnectionError(
+                self, "Failed to establish a new connection: {}".format(e)
+            ) from e
+
+        return sock
+
+
+class HappyEyeballsHTTPSConnection(HappyEyeballsHTTPConnection, HTTPSConnection):
+    '''HTTPSConnection that races the addresses of dual-stack hosts'''
+    pass
+
+
+def connection_pool_classes(family_cache, delay=0.25):
+    '''
+    Returns urllib3 pool classes by scheme, for PoolManager.pool_classes_by_scheme, whose
+    connections race addresses and share family_cache
+    '''
+    attrs = {'family_cache': family_cache, 'delay': delay}
+    http_conn = type('HappyEyeballsHTTPConnection', (HappyEyeballsHTTPConnection,), attrs)
+    https_conn = type('HappyEyeballsHTTPSConnection', (HappyEyeballsHTTPSConnection,), attrs)
+    return {
+        'http': type('HappyEyeballsHTTPConnectionPool', (HTTPConnectionPool,), {'ConnectionCls': http_conn}),
+        'https': type('HappyEyeballsHTTPSConnectionPool', (HTTPSConnectionPool,), {'ConnectionCls': https_conn})
+    }
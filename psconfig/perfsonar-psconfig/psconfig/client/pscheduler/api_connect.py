@@ -9,9 +9,10 @@ from .api_filters import ApiFilters
 from .test import Test
 from .task import Task
 from .tool import Tool
-from ..utils import Utils, build_err_msg, extract_url_uuid
+from ..utils import Utils, build_err_msg, extract_url_uuid, iter_json_array
+from .capability_cache import CapabilityCache
+from concurrent.futures import ThreadPoolExecutor
 import json
-from ..utils import Utils
 
 class ApiConnect(object):
 
@@ -21,32 +22,69 @@ class ApiConnect(object):
         self.bind_map = kwargs.get('bind_map', {})
         self.lead_address_map = kwargs.get('lead_address_map', {})
         self.filters = kwargs.get('filters', ApiFilters())
+        #shared HttpTransport, None uses the process-wide default
+        self.transport = kwargs.get('transport')
+        #optional CapabilityCache for metadata lookups, None to always ask the server
+        self.capability_cache = kwargs.get('capability_cache')
+        #number of test or tool details fetched at once
+        self.workers = kwargs.get('workers', 8)
+        #whether the last cacheable lookup was answered from the cache
+        self.cache_hit = False
+        #whether the last iter_tasks() failed to read the whole list, not just a task in it
+        self.listing_failed = False
         self.error = ''
 
     def get_tasks(self):
-        tasks_url = self.url
-        tasks_url = tasks_url.strip()
-        if not tasks_url.endswith('/'):
-            tasks_url += '/'
-        tasks_url = tasks_url + 'tasks'
+        request = self._tasks_request()
+        tasks_json = self._tasks_result(Utils().send_http_request(**request))
+        if tasks_json is None:
+            return
+        
+        tasks = []
+        for task_response_json in tasks_json:
+            task = self._listed_task(task_response_json)
+            if not task:
+                continue
+            
+            tasks.append(task)
+        
+        return tasks
+
+    def _request_args(self, connection_type, url, **kwargs):
+        #arguments to send_http_request shared by every call made by this client
+        args = {
+            'transport': self.transport,
+            'connection_type': connection_type,
+            'url': url,
+            'timeout': self.filters.timeout,
+            'ca_certificate_file': self.filters.ca_certificate_file,
+            'ca_certificate_path': self.filters.ca_certificate_path,
+            'verify_hostname': self.filters.verify_hostname,
+            'local_address': self.bind_address,
+            'bind_map': self.bind_map,
+            'address_map': self.lead_address_map
+        }
+        args.update(kwargs)
+        return args
+
+    def _url(self, path):
+        #appends path to the API url
+        url = self.url
+        url = url.strip()
+        if not url.endswith('/'):
+            url += '/'
+        return url + path
+
+    def _tasks_request(self, **kwargs):
         filters = {'detail': True, "expanded": True}
 
         if self.filters.task_filters:
             filters['json'] = self.filters.task_filters
         
-        result = Utils().send_http_request(
-            connection_type = 'GET',
-            url = tasks_url,
-            timeout = self.filters.timeout,
-            get_params = filters,
-            ca_certificate_file = self.filters.ca_certificate_file,
-            ca_certificate_path = self.filters.ca_certificate_path,
-            verify_hostname = self.filters.verify_hostname,
-            local_address = self.bind_address,
-            bind_map = self.bind_map,
-            address_map = self.lead_address_map
-        )
+        return self._request_args('GET', self._url('tasks'), get_params=filters, **kwargs)
 
+    def _tasks_result(self, result):
+        #returns the list of task objects from a /tasks response
         response = result['response']
         if result['exception']:
             self.error = result['exception']
@@ -65,68 +103,101 @@ class ApiConnect(object):
             self.error = "Tasks must be an array. Not {}".format(type(response_json))
             return
         
-        tasks = []
-        for task_response_json in response_json:
-            task_url = ''
-            has_detail = False
-            if 'detail' in task_response_json:
-                if 'href' in task_response_json['detail']:
-                    task_url = task_response_json['detail']['href']
-                    has_detail = True
-            elif 'href' in task_response_json:
-                task_url = task_response_json['href']
-            else:
-                continue
-        
-            task_uuid = extract_url_uuid(url=task_url) #Utils
-            if not task_uuid:
-                self.error = "Unable to extract UUID from url {}".format(task_url)
-                continue
-            
-            if has_detail:
-                #we got the detail, so create the object
-                task = Task(
-                    data=task_response_json,
-                    url=self.url,  
-                    filters=self.filters,
-                    uuid=task_uuid,
-                    bind_map=self.bind_map,
-                    lead_address_map=self.lead_address_map
-                )
-            else:
-                #no detail, so we have to retrieve it
-                task = self.get_task(task_uuid)
-            
-            if not task:
-                #There was an error
-                continue
-            
-            tasks.append(task)
-        
-        return tasks
+        return response_json
+
+    def iter_tasks(self, chunk_size=65536):
+        '''
+        Same as get_tasks() but parses the task array incrementally as it is read from the
+        response and yields each Task as soon as it is parsed, so memory use does not grow
+        with the number of tasks on the lead. Check error once the generator is exhausted.
+        If listing_failed is set, the list could not be read in full and the tasks yielded
+        are only part of it.
+        '''
+        self.listing_failed = False
+        result = Utils().send_http_request(**self._tasks_request(stream=True))
+
+        response = result['response']
+        if result['exception']:
+            self.error = result['exception']
+            self.listing_failed = True
+            return
+
+        try:
+            if not response.ok: 
+                self.error = build_err_msg(http_response=response)
+                self.listing_failed = True
+                return
+
+            task_count = 0
+            for task_response_json in iter_json_array(response.iter_content(chunk_size=chunk_size)):
+                task_count += 1
+                task = self._listed_task(task_response_json)
+                if task:
+                    yield task
+
+            if not task_count:
+                self.error = "No task objects returned"
+                self.listing_failed = True
+        except ValueError as e:
+            self.error = "Tasks must be an array. Unable to parse response: {}".format(e)
+            self.listing_failed = True
+        except Exception as e:
+            #connection problems while reading the body
+            self.error = e
+            self.listing_failed = True
+        finally:
+            response.close()
+
+    def _listed_task(self, task_response_json):
+        #builds a Task from an element of the /tasks list, fetching it if detail not included
+        task_uuid, has_detail = self._listed_task_uuid(task_response_json)
+        if not task_uuid:
+            return
+        
+        if has_detail:
+            #we got the detail, so create the object
+            return self._new_task(task_response_json, task_uuid)
+        
+        #no detail, so we have to retrieve it
+        return self.get_task(task_uuid)
+
+    def _listed_task_uuid(self, task_response_json):
+        #returns the uuid of an element of the /tasks list and whether it includes the detail
+        task_url = ''
+        has_detail = False
+        if 'detail' in task_response_json:
+            if 'href' in task_response_json['detail']:
+                task_url = task_response_json['detail']['href']
+                has_detail = True
+        elif 'href' in task_response_json:
+            task_url = task_response_json['href']
+        else:
+            return None, False
     
-    def get_task(self, task_uuid): 
-        #build url
-        task_url = self.url
-        task_url = task_url.strip()
-        if not task_url.endswith('/'):
-            task_url += '/'
-        task_url = task_url + "tasks/" + task_uuid
-
-        #fetch task
-        result = Utils().send_http_request(
-            connection_type='GET',
-            url=task_url,
-            get_params={'detail':True},
-            timeout=self.filters.timeout,
-            ca_certificate_file=self.filters.ca_certificate_file,
-            ca_certificate_path=self.filters.ca_certificate_path,
-            verify_hostname=self.filters.verify_hostname,
-            local_address=self.bind_address,
+        task_uuid = extract_url_uuid(url=task_url) #Utils
+        if not task_uuid:
+            self.error = "Unable to extract UUID from url {}".format(task_url)
+        return task_uuid, has_detail
+
+    def _new_task(self, data, task_uuid):
+        return Task(
+            data=data,
+            url=self.url,  
+            filters=self.filters,
+            uuid=task_uuid,
             bind_map=self.bind_map,
-            address_map=self.lead_address_map
+            lead_address_map=self.lead_address_map,
+            transport=self.transport
         )
+    
+    def get_task(self, task_uuid): 
+        request = self._task_request(task_uuid)
+        return self._task_result(Utils().send_http_request(**request), request['url'], task_uuid)
+
+    def _task_request(self, task_uuid):
+        return self._request_args('GET', self._url("tasks/" + task_uuid), get_params={'detail':True})
 
+    def _task_result(self, result, task_url, task_uuid):
         task_response = result['response']
         if result['exception']:
             self.error = result['exception']
@@ -141,141 +212,52 @@ class ApiConnect(object):
             self.error = "No task object returned from {}".format(task_url)
             return
         
-        return Task(
-            data=task_response_json,
-            url=self.url, 
-            filters=self.filters,
-            uuid=task_uuid,
-            bind_map=self.bind_map,
-            lead_address_map=self.lead_address_map
-        )
+        return self._new_task(task_response_json, task_uuid)
     
     def get_tools(self):
-
-        #build url
-        tools_url = self.url
-        tools_url = tools_url.strip()
-        if not tools_url.endswith('/'):
-            tools_url += '/'
-        tools_url = tools_url + "tools"
-
-        filters = {}
-
-        result = Utils().send_http_request(
-            connection_type='GET',
-            url=tools_url,
-            timeout=self.filters.timeout,
-            ca_certificate_file=self.filters.ca_certificate_file,
-            ca_certificate_path=self.filters.ca_certificate_path,
-            verify_hostname=self.filters.verify_hostname,
-            local_address=self.bind_address,
-            bind_map=self.bind_map,
-            address_map=self.lead_address_map
-        )
-
-        response = result['response']
-        if result['exception']:
-            self.error = result['exception']
+        tool_urls = self.get_tool_urls()
+        if tool_urls is None:
             return
 
-        if not response.ok:
-            self.error = build_err_msg(http_response=response)
-            return
-        
-        response_json = response.json()
-        if not response_json:
-            self.error = "No tool objects returned"
+        tool_names = self._url_names(tool_urls)
+        if tool_names is None:
             return
         
-        if type(response_json) is not list:
-            self.error = "Tools must be an array. Not {}".format(type(response_json))
-            return
-        
-        tools = []
-
-        for tool_url in response_json:
-            tool_name = extract_url_uuid(url=tool_url)
-            if not tool_name:
-                self.error = "Unable to extract name from url {}".format(tool_url)
-                return
-            
-            tool = self.get_tool(tool_name)
+        return self._fetch_all(self.get_tool, tool_names)
 
-            if not tool:
-                #there was an error
-                return 
-            
-            tools.append(tool)
-        
-        return tools
+    def get_tool_urls(self):
+        return self._cached('tool_urls', None, lambda: self._url_list_result(
+            Utils().send_http_request(**self._request_args('GET', self._url('tools'))), 'tool', 'Tools must be an array. Not {}'))
     
     def get_tool(self, tool_name):
+        tool_url = self._url('tools/' + tool_name)
+        tool_response_json = self._cached('tool', tool_name, lambda: self._object_result(
+            Utils().send_http_request(**self._request_args('GET', tool_url)), "No tool object returned from {}".format(tool_url)))
+        return self._new_tool(tool_response_json, tool_url, tool_name)
 
-        #build url
-        tool_url = self.url
-        tool_url = tool_url.strip()
-        if not tool_url.endswith('/'):
-            tool_url += '/'
-        tool_url = tool_url + 'tools/' + tool_name
-
-        #fetch tool
-        result = Utils().send_http_request(
-            connection_type='GET',
-            url=tool_url,
-            timeout=self.filters.timeout,
-            ca_certificate_file=self.filters.ca_certificate_file,
-            ca_certificate_path=self.filters.ca_certificate_path,
-            verify_hostname=self.filters.verify_hostname,
-            local_address=self.bind_address,
-            bind_map=self.bind_map,
-            address_map=self.lead_address_map
-        )
-
-        tool_response = result['response']
-        if result['exception']:
-            self.error = result['exception']
-            return
-
-        if not tool_response.ok:
-            self.error = build_err_msg(http_response=tool_response)
-            return
-        
-        tool_response_json = tool_response.json()
-        if not tool_response_json:
-            self.error("No tool object returned from {}".format(tool_url))
+    def _new_tool(self, tool_response_json, tool_url, tool_name):
+        if tool_response_json is None:
             return
         
         return Tool(
             data=tool_response_json,
             url=tool_url,
             filters=self.filters,
-            uuid=tool_name
+            uuid=tool_name,
+            transport=self.transport
         )
 
     def get_test_urls(self):
+        return self._cached('test_urls', None, lambda: self._test_urls_result(Utils().send_http_request(**self._test_urls_request())))
 
-        #build url
-        tests_url = self.url
-        tests_url = tests_url.strip()
-
-        if not tests_url.endswith('/'):
-            tests_url += '/'
-        tests_url = tests_url + 'tests'
-
-        filters = {}
+    def _test_urls_request(self):
+        return self._request_args('GET', self._url('tests'))
 
-        result = Utils().send_http_request(
-            connection_type='GET',
-            url=tests_url,
-            timeout=self.filters.timeout,
-            ca_certificate_file=self.filters.ca_certificate_file,
-            ca_certificate_path=self.filters.ca_certificate_path,
-            verify_hostname=self.filters.verify_hostname,
-            local_address=self.bind_address,
-            bind_map=self.bind_map,
-            address_map=self.lead_address_map
-        )
+    def _test_urls_result(self, result):
+        return self._url_list_result(result, 'test', 'Tests must be a list. Not {}')
 
+    def _url_list_result(self, result, object_name, not_list_msg):
+        #returns the list of urls from a tests or tools listing
         response = result['response']
         if result['exception']:
             self.error = result['exception']
@@ -287,38 +269,61 @@ class ApiConnect(object):
         
         response_json = response.json()
         if not response_json:
-            self.error = "No test objects returned"
+            self.error = "No {} objects returned".format(object_name)
             return
         
         if type(response_json) is not list:
-            self.error = "Tests must be a list. Not {}".format(type(response_json))
+            self.error = not_list_msg.format(type(response_json))
             return
         
         return response_json
     
     def get_tests(self):
+        test_urls = self.get_test_urls()
+        if test_urls is None:
+            return
+        
+        test_names = self._url_names(test_urls)
+        if test_names is None:
+            return
+        
+        return self._fetch_all(self.get_test, test_names)
+    
+    def get_test(self, test_name):
+        test_url = self._url("tests/" + test_name)
+        test_response_json = self._cached('test', test_name, lambda: self._object_result(
+            Utils().send_http_request(**self._request_args('GET', test_url)), "No test object returned from {}".format(test_url)))
+        return self._new_test(test_response_json, test_url, test_name)
 
-        #build url
-        tests_url = self.url
-        tests_url = tests_url.strip()
-        if not tests_url.endswith('/'):
-            tests_url += '/'
-        tests_url += "tests"
-
-        filters = {}
-
-        result = Utils().send_http_request(
-            connection_type='GET',
-            url=tests_url,
-            timeout=self.filters.timeout,
-            ca_certificate_file=self.filters.ca_certificate_file,
-            ca_certificate_path=self.filters.ca_certificate_path,
-            verify_hostname=self.filters.verify_hostname,
-            local_address=self.bind_address,
-            bind_map=self.bind_map,
-            address_map=self.lead_address_map
-        )
+    def _new_test(self, test_response_json, test_url, test_name):
+        if test_response_json is None:
+            return
+        
+        return Test(
+            data=test_response_json,
+            url=test_url,
+            filters=self.filters,
+            uuid=test_name,
+            transport=self.transport
+            )
+
+    def _url_name(self, url):
+        #test and tool names are the last part of their url, they aren't UUIDs
+        return url.strip().strip('"').rstrip('/').rsplit('/', 1)[-1]
+
+    def _url_names(self, urls):
+        #returns the names from a list of test or tool urls, or None if one has no name
+        names = []
+        for url in urls:
+            name = self._url_name(url)
+            if not name:
+                self.error = 'Unable to extract name from url {}'.format(url)
+                return
+            names.append(name)
+        return names
 
+    def _object_result(self, result, empty_msg):
+        #returns the JSON object from a test or tool response
         response = result['response']
         if result['exception']:
             self.error = result['exception']
@@ -330,94 +335,71 @@ class ApiConnect(object):
         
         response_json = response.json()
         if not response_json:
-            self.error = 'No test objects returned'
-            return
-        
-        if type(response_json) is not list:
-            self.error('Tests must be a list. Not {}'.format(response_json))
+            self.error = empty_msg
             return
         
-        tests = []
-        for test_url in response_json:
-            test_name = extract_url_uuid(url=test_url)
-            if not test_name:
-                self.error = 'Unable to extract name from url {}'.format(test_url)
-                return
-            test = self.get_test(test_name)
-
-            if not test:
-                #There was an error
-                return
-            tests.append(test)
-        
-        return tests
-    
-    def get_test(self, test_name):
-        #build url
-        test_url = self.url
-        test_url = test_url.strip()
-        if not test_url.endswith('/'):
-            test_url += '/'
-        
-        test_url = test_url + "tests/" + test_name
-
-        #fetch test
-        result = Utils().send_http_request(
-            connection_type='GET',
-            url=test_url,
-            timeout=self.filters.timeout,
-            ca_certificate_file=self.filters.ca_certificate_file,
-            ca_certificate_path=self.filters.ca_certificate_path,
-            verify_hostname=self.filters.verify_hostname,
-            local_address=self.bind_address,
-            bind_map=self.bind_map,
-            address_map=self.lead_address_map
-        )
+        return response_json
 
-        test_response = result['response']
+    def _fetch_all(self, fetch, names):
+        ##
+        # Calls fetch(name) for each name, up to workers at once, and returns the results
+        # in order. Returns None if any of them failed.
+        if not names:
+            return []
+        with ThreadPoolExecutor(max_workers=max(1, min(self.workers, len(names)))) as executor:
+            results = list(executor.map(fetch, names))
+        if not all(results):
+            #There was an error
+            return
+        return results
+
+    def _cached(self, kind, args, fetch):
+        ##
+        # Returns the cached answer for a lookup if there is a capability cache, otherwise
+        # calls fetch() and caches what it returns unless there was an error.
+        self.cache_hit = False
+        if self.capability_cache is None:
+            return fetch()
+        key = CapabilityCache.key(kind, self.url, args)
+        value = self.capability_cache.get(key, CapabilityCache.MISSING)
+        if value is not CapabilityCache.MISSING:
+            self.cache_hit = True
+            return value
+        value = fetch()
+        if value is not None:
+            self.capability_cache.set(key, value)
+        return value
+
+    def ping(self):
+        '''
+        Returns True if the API answers a request to its root URL. Cheaper than any other
+        call and never answered from the capability cache, so it can be used to check that
+        the server is up.
+        '''
+        return self._ping_result(Utils().send_http_request(**self._ping_request()))
+
+    def _ping_request(self):
+        return self._request_args('GET', self._url(''))
+
+    def _ping_result(self, result):
+        response = result['response']
         if result['exception']:
             self.error = result['exception']
-            return
+            return False
 
-        if not test_response.ok:
-            self.error = build_err_msg(http_response=test_response)
-            return
-        
-        test_response_json = test_response.json()
-        if not test_response_json:
-            self.error="No test object returned from {}".format(test_url)
+        if not response.ok:
+            self.error = build_err_msg(http_response=response)
+            return False
         
-        return Test(
-            data=test_response_json,
-            url=test_url,
-            filters=self.filters,
-            uuid=test_name
-            )
+        return True
     
     def get_hostname(self):
+        return self._cached('hostname', None, lambda: self._hostname_result(Utils().send_http_request(**self._hostname_request())))
 
-        #build url
-        hostname_url = self.url
-        hostname_url = hostname_url.strip()
-        if not hostname_url.endswith('/'):
-            hostname_url += '/'
-        
-        hostname_url += "hostname"
-
-        filters = {}
-
-        result = Utils().send_http_request(
-            connection_type="GET",
-            url=hostname_url,
-            timeout=self.filters.timeout,
-            ca_certificate_file=self.filters.ca_certificate_file,
-            ca_certificate_path=self.filters.ca_certificate_path,
-            verify_hostname=self.filters.verify_hostname,
-            local_address=self.bind_address,
-            bind_map=self.bind_map,
-            address_map=self.lead_address_map
-        )
+    def _hostname_request(self):
+        return self._request_args("GET", self._url("hostname"))
 
+    def _hostname_result(self, result):
         response = result['response']
         if result['exception']:
             self.error = result['exception']
@@ -440,32 +422,16 @@ class ApiConnect(object):
             self.error = 'get_number_of_participants: wrong test spec'
             return -1
         
-        #build url
-        test_url = self.url
-        test_url = test_url.strip()
+        return self._number_of_participants_result(Utils().send_http_request(**self._number_of_participants_request(input_data)))
 
-        if not test_url.endswith('/'):
-            test_url += '/'
-        
+    def _number_of_participants_request(self, input_data):
         input_data_json = json.loads(input_data)
         test_type = input_data_json['type']
         test_spec = urlencode(input_data_json['spec'])
         
-        test_spec_url = test_url + test_type + "/participants?spec=" + test_spec
-
-        result = Utils().send_http_request(
-            connection_type = 'GET',
-            url = test_spec_url,
-            get_params = {},
-            timeout = self.filters.timeout,
-            ca_certificate_file = self.filters.ca_certificate_file,
-            ca_certificate_path = self.filters.ca_certificate_path,
-            verify_hostname = self.filters.verify_hostname,  ################add verify_hostnames?
-            local_address = self.bind_address,
-            bind_map = self.bind_map,
-            address_map = self.lead_address_map
-        )
+        return self._request_args('GET', self._url(test_type + "/participants?spec=" + test_spec), get_params={})
 
+    def _number_of_participants_result(self, result):
         response = result['response']
         if result['exception']:
             self.error = result['exception']
@@ -493,107 +459,28 @@ class ApiConnect(object):
         return participants_number
 
     def get_test_spec_is_valid(self, test_name, spec):
-        #build url
-        test_url = self.url
-        test_url = test_url.strip()
-        if not test_url.endswith('/'):
-            test_url += '/'
-        test_url += "tests/{}/spec/is-valid".format(test_name)
-
-        #fetch test
-        result = Utils().send_http_request(
-            connection_type = 'GET',
-            url = test_url,
-            timeout = self.filters.timeout,
-            get_params = { "spec": spec },
-            ca_certificate_file = self.filters.ca_certificate_file,
-            ca_certificate_path = self.filters.ca_certificate_path,
-            verify_hostname = self.filters.verify_hostname,
-            local_address = self.bind_address,
-            bind_map = self.bind_map,
-            address_map = self.lead_address_map
-        )
+        request = self._test_spec_is_valid_request(test_name, spec)
+        return self._cached('test_spec_is_valid', [test_name, spec], lambda: self._validation_result(Utils().send_http_request(**request), request['url']))
 
-        response = result['response']
-        if result['exception']:
-            self.error = result['exception']
-            return
-        elif not response.ok:
-            self.error = build_err_msg(http_response=response)
-            return
-        
-        response_json = response.json()
-        if not response_json:
-            self.error = "No validation object returned from {}".format(test_url)
-            return
-        elif response_json.get('valid', None) is None:
-            self.error = "Returned validation object missing 'valid' field"
-            return
-        
-        return response_json
+    def _test_spec_is_valid_request(self, test_name, spec):
+        return self._request_args('GET', self._url("tests/{}/spec/is-valid".format(test_name)), get_params={ "spec": spec })
 
     def get_archiver_is_valid(self, archiver_name, data):
-        #build url
-        test_url = self.url
-        test_url = test_url.strip()
-        if not test_url.endswith('/'):
-            test_url += '/'
-        test_url += "archivers/{}/data-is-valid".format(archiver_name)
-
-        #fetch test
-        result = Utils().send_http_request(
-            connection_type = 'GET',
-            url = test_url,
-            timeout = self.filters.timeout,
-            get_params = { "data": data },
-            ca_certificate_file = self.filters.ca_certificate_file,
-            ca_certificate_path = self.filters.ca_certificate_path,
-            verify_hostname = self.filters.verify_hostname,
-            local_address = self.bind_address,
-            bind_map = self.bind_map,
-            address_map = self.lead_address_map
-        )
+        request = self._archiver_is_valid_request(archiver_name, data)
+        return self._cached('archiver_is_valid', [archiver_name, data], lambda: self._validation_result(Utils().send_http_request(**request), request['url']))
 
-        response = result['response']
-        if result['exception']:
-            self.error = result['exception']
-            return
-        elif not response.ok:
-            self.error = build_err_msg(http_response=response)
-            return
-        
-        response_json = response.json()
-        if not response_json:
-            self.error = "No validation object returned from {}".format(test_url)
-            return
-        elif response_json.get('valid', None) is None:
-            self.error = "Returned validation object missing 'valid' field"
-            return
-        
-        return response_json
+    def _archiver_is_valid_request(self, archiver_name, data):
+        return self._request_args('GET', self._url("archivers/{}/data-is-valid".format(archiver_name)), get_params={ "data": data })
 
     def get_context_is_valid(self, context_name, data):
-        #build url
-        test_url = self.url
-        test_url = test_url.strip()
-        if not test_url.endswith('/'):
-            test_url += '/'
-        test_url += "contexts/{}/data-is-valid".format(context_name)
-
-        #fetch test
-        result = Utils().send_http_request(
-            connection_type = 'GET',
-            url = test_url,
-            timeout = self.filters.timeout,
-            get_params = { "data": data },
-            ca_certificate_file = self.filters.ca_certificate_file,
-            ca_certificate_path = self.filters.ca_certificate_path,
-            verify_hostname = self.filters.verify_hostname,
-            local_address = self.bind_address,
-            bind_map = self.bind_map,
-            address_map = self.lead_address_map
-        )
+        request = self._context_is_valid_request(context_name, data)
+        return self._cached('context_is_valid', [context_name, data], lambda: self._validation_result(Utils().send_http_request(**request), request['url']))
 
+    def _context_is_valid_request(self, context_name, data):
+        return self._request_args('GET', self._url("contexts/{}/data-is-valid".format(context_name)), get_params={ "data": data })
+
+    def _validation_result(self, result, test_url):
+        #returns the object from an is-valid call, which must include a valid field
         response = result['response']
         if result['exception']:
             self.error = result['exception']
@@ -611,4 +498,3 @@ class ApiConnect(object):
             return
         
         return response_json
-
@@ -6,31 +6,60 @@ import json
 class Archive(object):
 
     def __init__(self, **kwargs) -> None:
+        self._checksums = None
         self.name = kwargs.get('name')
         self.ttl = kwargs.get('ttl')
         self.transform = kwargs.get('transform', {})
         self.data = kwargs.get('data', {})
 
+    def __setattr__(self, key, value):
+        #any change to the fields that make up the checksum drops the cached value
+        if key in ('name', 'ttl', 'data'):
+            object.__setattr__(self, '_checksums', None)
+        object.__setattr__(self, key, value)
+
     def data_param(self, field, val=None):
         if field is None:
             return
         if val is not None:
+            self._checksums = None
             self.data[field] = val
         return self.data.get(field, None)
     
     def checksum(self, include_private=False):
         #calculates checksum for comparing tasks ignoring stuff like UUID and lead url
+        public_checksum, private_checksum = self.checksums()
+        if include_private:
+            return private_checksum
+        return public_checksum
+
+    def checksums(self):
+        ##
+        # Returns a tuple of the checksum with private fields cleared and the checksum
+        # including private fields. Both are calculated in one pass and cached until the
+        # archive is changed through its attributes or data_param.
         #disable canonical since we do not care at the moment
+        if self._checksums is not None:
+            return self._checksums
 
-        archive = {'name': self.name, 'ttl': self.ttl, 'data': {}}
+        public_archive = {'name': self.name, 'ttl': self.ttl, 'data': {}}
+        private_archive = {'name': self.name, 'ttl': self.ttl, 'data': self.data}
+        has_private = False
         #clear out private fields that won't get displayed by remote tasks
         for datum in self.data.keys():
-            if datum.startswith('_') and not include_private:
-                archive['data'][datum] = ''
+            if datum.startswith('_'):
+                public_archive['data'][datum] = ''
+                has_private = True
             else:
-                archive['data'][datum] = self.data[datum]
-            
+                public_archive['data'][datum] = self.data[datum]
+
+        public_checksum = self._hash(public_archive)
+        #no private fields means both are the same
+        private_checksum = self._hash(private_archive) if has_private else public_checksum
+        self._checksums = (public_checksum, private_checksum)
+        return self._checksums
+
+    def _hash(self, archive):
         #canonical should keep it consistent by sorting keys
         archive_canonical = json.dumps(archive, sort_keys=True, separators=(',',':')).encode('utf-8')
         return b64encode(md5(archive_canonical).digest()).decode().rstrip('=')
-        
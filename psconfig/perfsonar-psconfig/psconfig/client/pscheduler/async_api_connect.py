@@ -0,0 +1,215 @@
+'''
+Client for interacting with pscheduler using asyncio
+'''
+
+import asyncio
+
+from ..utils import JsonArrayParser, build_err_msg
+from .api_connect import ApiConnect
+from .async_task import AsyncTask
+from .capability_cache import CapabilityCache
+
+
+class AsyncApiConnect(ApiConnect):
+    '''
+    ApiConnect whose network calls are coroutines, so requests to many leads can be in
+    flight at once from a single thread. transport must be an AsyncHttpTransport, which
+    is usually shared by all clients in the event loop. Requests are built and responses
+    parsed the same way as ApiConnect, and tasks are returned as AsyncTask objects.
+    iter_tasks() is an async generator, use it with async for.
+    '''
+
+    async def get_tasks(self):
+        result = await self.transport.send_http_request(**self._tasks_request())
+        tasks_json = self._tasks_result(result)
+        if tasks_json is None:
+            return
+
+        tasks = []
+        fetches = []
+        for task_response_json in tasks_json:
+            task_uuid, has_detail = self._listed_task_uuid(task_response_json)
+            if not task_uuid:
+                continue
+            if has_detail:
+                #we got the detail, so create the object
+                tasks.append(self._new_task(task_response_json, task_uuid))
+            else:
+                #no detail, so we have to retrieve it
+                fetches.append(self.get_task(task_uuid))
+
+        for task in await asyncio.gather(*fetches):
+            if task:
+                tasks.append(task)
+
+        return tasks
+
+    async def iter_tasks(self, chunk_size=65536):
+        '''Same as ApiConnect.iter_tasks(), yields each AsyncTask as soon as it is parsed'''
+        self.listing_failed = False
+        result = await self.transport.send_http_request(**self._tasks_request(stream=True))
+
+        response = result['response']
+        if result['exception']:
+            self.error = result['exception']
+            self.listing_failed = True
+            return
+
+        try:
+            if not response.ok:
+                self.error = build_err_msg(http_response=response)
+                self.listing_failed = True
+                return
+
+            task_count = 0
+            parser = JsonArrayParser()
+            async for chunk in response.iter_content(chunk_size):
+                for task_response_json in parser.feed(chunk):
+                    task_count += 1
+                    task = await self._listed_task(task_response_json)
+                    if task:
+                        yield task
+            for task_response_json in parser.close():
+                task_count += 1
+                task = await self._listed_task(task_response_json)
+                if task:
+                    yield task
+
+            if not task_count:
+                self.error = "No task objects returned"
+                self.listing_failed = True
+        except asyncio.CancelledError:
+            raise
+        except ValueError as e:
+            self.error = "Tasks must be an array. Unable to parse response: {}".format(e)
+            self.listing_failed = True
+        except Exception as e:
+            #connection problems while reading the body
+            self.error = e
+            self.listing_failed = True
+        finally:
+            response.close()
+
+    async def _listed_task(self, task_response_json):
+        task_uuid, has_detail = self._listed_task_uuid(task_response_json)
+        if not task_uuid:
+            return
+
+        if has_detail:
+            #we got the detail, so create the object
+            return self._new_task(task_response_json, task_uuid)
+
+        #no detail, so we have to retrieve it
+        return await self.get_task(task_uuid)
+
+    def _new_task(self, data, task_uuid):
+        return AsyncTask(
+            data=data,
+            url=self.url,
+            filters=self.filters,
+            uuid=task_uuid,
+            bind_map=self.bind_map,
+            lead_address_map=self.lead_address_map,
+            transport=self.transport
+        )
+
+    async def get_task(self, task_uuid):
+        request = self._task_request(task_uuid)
+        return self._task_result(await self.transport.send_http_request(**request), request['url'], task_uuid)
+
+    async def get_tools(self):
+        tool_urls = await self.get_tool_urls()
+        if tool_urls is None:
+            return
+
+        tool_names = self._url_names(tool_urls)
+        if tool_names is None:
+            return
+
+        return await self._fetch_all(self.get_tool, tool_names)
+
+    async def get_tool_urls(self):
+        return await self._cached('tool_urls', None, self._request_args('GET', self._url('tools')),
+            lambda result: self._url_list_result(result, 'tool', 'Tools must be an array. Not {}'))
+
+    async def get_tool(self, tool_name):
+        tool_url = self._url('tools/' + tool_name)
+        tool_response_json = await self._cached('tool', tool_name, self._request_args('GET', tool_url),
+            lambda result: self._object_result(result, "No tool object returned from {}".format(tool_url)))
+        return self._new_tool(tool_response_json, tool_url, tool_name)
+
+    async def get_test_urls(self):
+        return await self._cached('test_urls', None, self._test_urls_request(), self._test_urls_result)
+
+    async def get_tests(self):
+        test_urls = await self.get_test_urls()
+        if test_urls is None:
+            return
+
+        test_names = self._url_names(test_urls)
+        if test_names is None:
+            return
+
+        return await self._fetch_all(self.get_test, test_names)
+
+    async def get_test(self, test_name):
+        test_url = self._url("tests/" + test_name)
+        test_response_json = await self._cached('test', test_name, self._request_args('GET', test_url),
+            lambda result: self._object_result(result, "No test object returned from {}".format(test_url)))
+        return self._new_test(test_response_json, test_url, test_name)
+
+    async def _fetch_all(self, fetch, names):
+        ##
+        # Awaits fetch(name) for each name, up to workers at once, and returns the results
+        # in order. Returns None if any of them failed.
+        semaphore = asyncio.Semaphore(max(1, self.workers))
+        async def bounded_fetch(name):
+            async with semaphore:
+                return await fetch(name)
+        results = await asyncio.gather(*[bounded_fetch(name) for name in names])
+        if not all(results):
+            #There was an error
+            return
+        return list(results)
+
+    async def _cached(self, kind, args, request, parse):
+        ##
+        # Returns the cached answer for a lookup if there is a capability cache, otherwise
+        # sends request and caches what parse(result) returns unless there was an error.
+        self.cache_hit = False
+        if self.capability_cache is not None:
+            key = CapabilityCache.key(kind, self.url, args)
+            value = self.capability_cache.get(key, CapabilityCache.MISSING)
+            if value is not CapabilityCache.MISSING:
+                self.cache_hit = True
+                return value
+        value = parse(await self.transport.send_http_request(**request))
+        if value is not None and self.capability_cache is not None:
+            self.capability_cache.set(key, value)
+        return value
+
+    async def ping(self):
+        return self._ping_result(await self.transport.send_http_request(**self._ping_request()))
+
+    async def get_hostname(self):
+        return await self._cached('hostname', None, self._hostname_request(), self._hostname_result)
+
+    async def get_number_of_participants(self, input_data=None):
+        if not input_data:
+            self.error = 'get_number_of_participants: wrong test spec'
+            return -1
+
+        result = await self.transport.send_http_request(**self._number_of_participants_request(input_data))
+        return self._number_of_participants_result(result)
+
+    async def get_test_spec_is_valid(self, test_name, spec):
+        request = self._test_spec_is_valid_request(test_name, spec)
+        return await self._cached('test_spec_is_valid', [test_name, spec], request, lambda result: self._validation_result(result, request['url']))
+
+    async def get_archiver_is_valid(self, archiver_name, data):
+        request = self._archiver_is_valid_request(archiver_name, data)
+        return await self._cached('archiver_is_valid', [archiver_name, data], request, lambda result: self._validation_result(result, request['url']))
+
+    async def get_context_is_valid(self, context_name, data):
+        request = self._context_is_valid_request(context_name, data)
+        return await self._cached('context_is_valid', [context_name, data], request, lambda result: self._validation_result(result, request['url']))
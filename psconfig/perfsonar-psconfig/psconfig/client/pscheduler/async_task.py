@@ -0,0 +1,171 @@
+'''
+Task that talks to pScheduler with asyncio
+'''
+
+import asyncio
+from collections import deque
+
+from ..utils import JsonArrayParser, build_err_msg
+from .lead_cache import LeadCache
+from .task import Task
+
+
+class AsyncTask(Task):
+    '''
+    Task whose network calls are coroutines. Builds requests and parses responses the same
+    way as Task, but sends them through an AsyncHttpTransport given as transport. The
+    accessors and checksum work the same as in Task. iter_run_records() is an async
+    generator, use it with async for.
+    '''
+
+    async def get_lead(self):
+        self.cache_hit = False
+        lead_url, get_params = self._lead_request()
+        if lead_url is None:
+            return
+
+        #check cache before asking pscheduler
+        cache_key = self._lead_cache_key(lead_url, get_params)
+        lead = LeadCache.MISSING
+        if cache_key is not None:
+            lead = self.lead_cache.get(cache_key, LeadCache.MISSING)
+        self.cache_hit = lead is not LeadCache.MISSING
+        if lead is LeadCache.MISSING:
+            if self.lead_throttle is not None:
+                #rate limits are shared with threads, so wait without blocking the loop
+                await asyncio.to_thread(self.lead_throttle, self.url)
+            result = await self.transport.send_http_request(**self._send_args('GET', lead_url, get_params=get_params))
+            lead = self._lead_result(result, lead_url)
+            if self.error:
+                return
+            if cache_key is not None:
+                self.lead_cache.set(cache_key, lead)
+
+        return self._apply_lead(lead)
+
+    async def get_lead_url(self, scheme='https', port='', path='/pscheduler'):
+        return self._lead_url(await self.get_lead(), scheme, port, path)
+
+    async def refresh_lead(self, scheme='https', port='', path='/pscheduler'):
+        lead = await self.get_lead_url(scheme, port, path)
+        if lead:
+            #if lead exists, change url, otherwise keep the same
+            self.url = lead
+        return lead
+
+    async def post_task(self):
+        self._prepare_post()
+
+        #send request
+        result = await self.transport.send_http_request(**self._send_args('POST', self._post_url(), data=self.data))
+        return self._post_task_result(self._json_result(result))
+
+    async def delete_task(self):
+        #send request
+        self._delete_result(await self.transport.send_http_request(**self._delete_args()))
+        if self.error:
+            return -1
+        return 0
+
+    async def run_uuids(self):
+        result = await self.transport.send_http_request(**self._send_args('GET', self._runs_url()))
+        return self._run_uuids_result(result, "Runs must be a list. Not {}")
+
+    async def runs(self, workers=8):
+        result = await self.transport.send_http_request(**self._send_args('GET', self._runs_url()))
+        run_uuids = self._run_uuids_result(result, "Runs must be an array. Not {}")
+        if run_uuids is None:
+            return
+
+        #fetch up to workers runs at once
+        runs = await self._gather(self.get_run, run_uuids, workers)
+        if not all(runs):
+            #There was an error
+            return
+        return runs
+
+    async def iter_run_records(self, start=None, end=None, workers=8, full=False, chunk_size=65536):
+        '''Same as Task.iter_run_records(), runs are fetched up to workers at once as the list is read'''
+        result = await self.transport.send_http_request(**self._send_args('GET', self._runs_window_url(start, end), stream=True))
+        response = result['response']
+        if result['exception']:
+            self.error = result['exception']
+            return
+
+        async def fetch(run_url):
+            run_uuid = self._run_url_uuid(run_url)
+            if not run_uuid:
+                return
+            return self._run_record(await self.get_run(run_uuid), full)
+
+        #fetches in flight in list order, only about twice as many as workers are started ahead
+        semaphore = asyncio.Semaphore(max(1, workers))
+        async def bounded_fetch(run_url):
+            async with semaphore:
+                return await fetch(run_url)
+        fetches = deque()
+
+        try:
+            if not response.ok:
+                self.error = build_err_msg(http_response=response)
+                return
+
+            parser = JsonArrayParser()
+            async for chunk in response.iter_content(chunk_size):
+                for run_url in parser.feed(chunk):
+                    fetches.append(asyncio.ensure_future(bounded_fetch(run_url)))
+                    while len(fetches) >= max(1, workers) * 2:
+                        record = await fetches.popleft()
+                        if self._in_window(record, start, end):
+                            yield record
+            for run_url in parser.close():
+                fetches.append(asyncio.ensure_future(bounded_fetch(run_url)))
+            while fetches:
+                record = await fetches.popleft()
+                if self._in_window(record, start, end):
+                    yield record
+        except asyncio.CancelledError:
+            raise
+        except ValueError as e:
+            self.error = "Runs must be an array. Unable to parse response: {}".format(e)
+        except Exception as e:
+            #connection problems while reading the body
+            self.error = e
+        finally:
+            #consumer stopped early or the list broke, don't leave fetches running
+            for future in fetches:
+                future.cancel()
+            response.close()
+
+    async def run_records(self, start=None, end=None, workers=8, full=False):
+        '''Same as Task.run_records(), returns a list of RunRecord or None if listing the runs failed'''
+        result = await self.transport.send_http_request(**self._send_args('GET', self._runs_window_url(start, end)))
+        run_urls = self._json_result(result)
+        if run_urls is None:
+            return
+        if not isinstance(run_urls, list):
+            self.error = "Runs must be an array. Not {}".format(type(run_urls))
+            return
+
+        async def fetch(run_url):
+            run_uuid = self._run_url_uuid(run_url)
+            if not run_uuid:
+                return
+            return self._run_record(await self.get_run(run_uuid), full)
+
+        records = await self._gather(fetch, run_urls, workers)
+        return [record for record in records if self._in_window(record, start, end)]
+
+    async def _gather(self, fetch, items, workers):
+        ##
+        # Awaits fetch(item) for each item, up to workers at once, and returns the results in order
+        semaphore = asyncio.Semaphore(max(1, workers))
+        async def bounded_fetch(item):
+            async with semaphore:
+                return await fetch(item)
+        return list(await asyncio.gather(*[bounded_fetch(item) for item in items]))
+
+    async def get_run(self, run_uuid):
+        run_url = self._runs_url() + "/{}".format(run_uuid)
+        result = await self.transport.send_http_request(**self._send_args('GET', run_url))
+        return self._run_result(result, run_url, run_uuid)
@@ -11,7 +11,11 @@ class BaseNode(object):
         self.bind_address = kwargs.get('bind_address')
         self.uuid = kwargs.get('uuid')
         self.filters = kwargs.get('filters', ApiFilters())
+        #shared HttpTransport, None uses the process-wide default
+        self.transport = kwargs.get('transport')
         self.error = ''
+        #HTTP status of the last error response, None if there was none or no response at all
+        self.http_status = None
 
     
     def to_json(self, formatting_params=None):
@@ -53,18 +57,25 @@ class BaseNode(object):
         return delete_url
     
     def _post(self, data):
-
-        result = Utils().send_http_request(
-            connection_type='POST',
-            url=self._post_url(),
+        return self._json_result(Utils().send_http_request(**self._send_args('POST', self._post_url(), data=data)))
+    
+    def _send_args(self, connection_type, url, **kwargs):
+        #arguments to send_http_request for a call to this node
+        args = dict(
+            transport=self.transport,
+            connection_type=connection_type,
+            url=url,
             timeout=self.filters.timeout,
             ca_certificate_file=self.filters.ca_certificate_file,
             ca_certificate_path=self.filters.ca_certificate_path,
             verify_hostname=self.filters.verify_hostname,
-            local_address=self.bind_address,
-            data=data
+            local_address=self.bind_address
         )
+        args.update(kwargs)
+        return args
 
+    def _json_result(self, result):
+        #returns the JSON body of a POST or PUT response
         response = result['response']
         if result['exception']:
             self.error = result['exception']
@@ -72,46 +83,22 @@ class BaseNode(object):
     
         if not response.ok:
             self.error = build_err_msg(http_response=response)
+            self.http_status = response.status_code
             return
         
         return response.json()
     
-    
     def _put(self, data):
-        result = Utils().send_http_request(
-            connection_type='PUT',
-            url=self._post_url(),
-            timeout=self.filters.timeout,
-            ca_certificate_file=self.filters.ca_certificate_file,
-            ca_certificate_path=self.filters.ca_certificate_path,
-            verify_hostname=self.filters.verify_hostname,
-            local_address=self.bind_address,
-            data=data
-        )
-
-        response = result['response']
-        if result['exception']:
-            self.error = result['exception']
-            return
-        
-        if not response.ok:
-            self.error = build_err_msg(http_response=response)
-            return
-        
-        return response.json()
-    
+        return self._json_result(Utils().send_http_request(**self._send_args('PUT', self._post_url(), data=data)))
     
     def _delete(self):
-        result = Utils().send_http_request(
-            connection_type='DELETE',
-            url=self._delete_url(),
-            timeout=self.filters.timeout,
-            ca_certificate_file=self.filters.ca_certificate_file,
-            ca_certificate_path=self.filters.ca_certificate_file,
-            verify_hostname=self.filters.verify_hostname,
-            local_address=self.bind_address
-        )
+        return self._delete_result(Utils().send_http_request(**self._delete_args()))
+
+    def _delete_args(self):
+        #Note: passes the CA file as the CA path too
+        return self._send_args('DELETE', self._delete_url(), ca_certificate_path=self.filters.ca_certificate_file)
 
+    def _delete_result(self, result):
         response = result['response']
         if result['exception']:
             self.error = result['exception']
@@ -0,0 +1,58 @@
+'''
+Cache of pScheduler metadata that rarely changes
+'''
+
+import json
+import threading
+import time
+
+
+class CapabilityCache(object):
+    '''
+    Remembers answers from pScheduler that only change when the server is upgraded or
+    reconfigured: test and tool listings and details, spec validity answers and hostnames.
+    Entries expire after ttl seconds. Values are stored as JSON so callers always get their
+    own copy. Meant to be kept in memory across agent runs and is safe to use from multiple
+    threads.
+    '''
+
+    #returned by get when there is no entry
+    MISSING = object()
+
+    def __init__(self, **kwargs):
+        self.ttl = kwargs.get('ttl', 3600)
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(kind, url, args=None):
+        '''Returns the cache key for a kind of lookup against the API at url'''
+        return json.dumps([kind, url, args], sort_keys=True, separators=(',', ':'))
+
+    def get(self, key, default=None):
+        '''Returns the cached value for key or default if missing or expired'''
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[0] > self.ttl:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+            return json.loads(entry[1])
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.time(), json.dumps(value))
+
+    def clear(self):
+        with self._lock:
+            self._entries = {}
+
+    def stats(self):
+        with self._lock:
+            return {'size': len(self._entries), 'hits': self.hits, 'misses': self.misses}
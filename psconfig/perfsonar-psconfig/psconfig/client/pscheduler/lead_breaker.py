@@ -0,0 +1,114 @@
+'''
+Circuit breaker that stops TaskManager from contacting leads that keep failing
+'''
+
+import threading
+import time
+
+
+class LeadBreaker(object):
+    '''
+    Tracks consecutive failures of each lead and puts a lead in quarantine for an
+    exponentially growing backoff (base_backoff, doubled for each further failure, at most
+    max_backoff seconds). Requests to a quarantined lead should be skipped. Once the
+    quarantine is over a single probe request is let through (half-open): success closes
+    the breaker, failure starts a longer quarantine.
+
+    State lives in the lead entries of the tracker file (failures, quarantine_until and
+    error_time) so it carries over between runs. Leads can also be held for the rest of
+    the run, such as leads whose tasks could not be listed, and are refused without a probe
+    even if their quarantine ends. The breaker is safe to use from multiple threads.
+    '''
+
+    def __init__(self, **kwargs):
+        #lead entries from the tracker file, keyed by lead url. Updated in place.
+        self.leads = kwargs.get('leads', {})
+        self.base_backoff = kwargs.get('base_backoff', 60)
+        self.max_backoff = kwargs.get('max_backoff', 3600)
+        self._probing = {}
+        self._skipped = {}
+        self._held = set()
+        self._lock = threading.Lock()
+
+    def allow(self, url):
+        '''
+        Returns True if a request may be sent to url. Every allowed request must be followed
+        by a call to success(), failure() or release() so a half-open probe is resolved.
+        '''
+        now = time.time()
+        with self._lock:
+            lead = self.leads.get(url, {})
+            quarantine_until = lead.get('quarantine_until')
+            if url in self._held:
+                self._skipped[url] = max(0, int((quarantine_until or now) - now))
+                return False
+            if not quarantine_until:
+                return True
+            if now < quarantine_until or self._probing.get(url):
+                self._skipped[url] = max(0, int(quarantine_until - now))
+                return False
+            #quarantine is over, let one probe through
+            self._probing[url] = True
+            return True
+
+    def success(self, url):
+        '''Closes the breaker for url'''
+        with self._lock:
+            self._probing.pop(url, None)
+            lead = self.leads.get(url)
+            if lead is None:
+                return
+            lead.pop('failures', None)
+            lead.pop('quarantine_until', None)
+
+    def failure(self, url):
+        '''Records a failed request to url and puts it in quarantine'''
+        now = int(time.time())
+        with self._lock:
+            self._probing.pop(url, None)
+            lead = self.leads.setdefault(url, {})
+            failures = lead.get('failures', 0) + 1
+            lead['failures'] = failures
+            lead['error_time'] = now
+            lead['quarantine_until'] = now + self.backoff(failures)
+
+    def release(self, url):
+        '''Ends a request to url that was allowed but never sent, leaving the breaker as it was'''
+        with self._lock:
+            self._probing.pop(url, None)
+
+    def hold(self, url):
+        '''Refuses all requests to url for the rest of the run, whatever its quarantine'''
+        with self._lock:
+            self._held.add(url)
+
+    def held(self, url):
+        '''Returns True if url is held for the rest of the run'''
+        with self._lock:
+            return url in self._held
+
+    def probing(self, url):
+        '''Returns True if the next request to url is the probe of a half-open breaker'''
+        with self._lock:
+            return bool(self._probing.get(url))
+
+    def backoff(self, failures):
+        '''Returns the quarantine length in seconds after the given number of consecutive failures'''
+        if failures < 1:
+            return 0
+        #cap the exponent so the multiplication can't get out of hand
+        return min(self.max_backoff, self.base_backoff * (2 ** min(failures - 1, 32)))
+
+    def skipped(self):
+        '''Returns a dict of lead url to seconds of quarantine left for leads that had requests skipped'''
+        with self._lock:
+            return dict(self._skipped)
+
+    def skip_message(self, url):
+        with self._lock:
+            quarantine_until = self.leads.get(url, {}).get('quarantine_until') or 0
+            held = url in self._held
+        if held and quarantine_until <= time.time():
+            return "Skipped because the tasks of lead {} could not be listed this run".format(url)
+        return "Skipped because lead {} failed recently and is in quarantine for another {} seconds".format(
+            url, max(0, int(quarantine_until - time.time())))
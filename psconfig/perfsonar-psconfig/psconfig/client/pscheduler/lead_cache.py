@@ -0,0 +1,107 @@
+'''
+Cache of lead lookups done by Task.get_lead
+'''
+
+from collections import OrderedDict
+from hashlib import md5
+import json
+import threading
+import time
+
+
+class LeadCache(object):
+    '''
+    Remembers which participant leads a task so tasks sharing the same test type, spec
+    and bind parameters don't each need a GET to /tests/<type>/participants. Entries
+    expire after ttl seconds and the least recently used entries are evicted once there
+    are more than max_size. Keys are hashes so the spec (which may contain secrets) is
+    never written to disk. The cache is safe to use from multiple threads.
+    '''
+
+    #returned by get when there is no entry, since a cached lead may be None
+    MISSING = object()
+
+    def __init__(self, **kwargs):
+        self.ttl = kwargs.get('ttl', 3600)
+        self.max_size = kwargs.get('max_size', 10000)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.load(kwargs.get('data', {}))
+
+    @staticmethod
+    def key(url, test_spec, lead_bind=None, bind_address=None):
+        '''Returns the cache key for a participants lookup'''
+        normalized = json.dumps({
+            'url': url,
+            'spec': test_spec,
+            'lead-bind': lead_bind or '',
+            'bind': bind_address or ''
+        }, sort_keys=True, separators=(',', ':'))
+        return md5(normalized.encode('utf-8')).hexdigest()
+
+    def get(self, key, default=None):
+        '''Returns the cached lead for key or default if missing or expired'''
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry['time'] > self.ttl:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry['lead']
+
+    def set(self, key, lead):
+        '''Caches lead for key, evicting the least recently used entries if full'''
+        with self._lock:
+            self._entries[key] = {'lead': lead, 'time': int(time.time())}
+            self._entries.move_to_end(key)
+            self._evict()
+
+    def load(self, data):
+        '''Loads entries previously returned by to_json, dropping any that have expired'''
+        if not isinstance(data, dict):
+            return
+        now = time.time()
+        with self._lock:
+            for key, entry in data.items():
+                try:
+                    if now - entry['time'] > self.ttl:
+                        continue
+                    self._entries[key] = {'lead': entry['lead'], 'time': entry['time']}
+                except (KeyError, TypeError):
+                    #ignore malformed entries
+                    continue
+            self._evict()
+
+    def to_json(self):
+        '''Returns the unexpired entries in a form that can be stored in the tracker file'''
+        now = time.time()
+        with self._lock:
+            return {k: dict(v) for k, v in self._entries.items() if now - v['time'] <= self.ttl}
+
+    def stats(self):
+        '''Returns hit, miss and eviction counters along with the hit rate'''
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': (float(self.hits) / lookups) if lookups else 0.0
+            }
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _evict(self):
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
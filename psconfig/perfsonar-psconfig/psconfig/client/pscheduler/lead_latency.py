@@ -0,0 +1,93 @@
+'''
+Latency statistics used to pick request timeouts for each pScheduler lead
+'''
+
+import math
+import threading
+
+
+class LeadLatency(object):
+    '''
+    Keeps the most recent successful request latencies for each lead and endpoint class
+    (such as listing, participants, post and delete) and turns them into timeouts. The
+    timeout for a class is a high percentile of its latencies times factor, bounded by floor
+    and ceiling. Until a class has min_samples latencies the caller's default is used.
+    Latencies are stored in milliseconds so they can be kept in the tracker file. Safe to
+    use from multiple threads.
+    '''
+
+    def __init__(self, **kwargs):
+        self.floor = kwargs.get('floor', 5)
+        self.ceiling = kwargs.get('ceiling', 300)
+        self.percentile = kwargs.get('percentile', 0.99)
+        self.factor = kwargs.get('factor', 3.0)
+        self.min_samples = kwargs.get('min_samples', 5)
+        #number of latencies kept per lead and class
+        self.window = kwargs.get('window', 32)
+        self._samples = {}
+        self._lock = threading.Lock()
+        self.load(kwargs.get('data', {}))
+
+    def record(self, url, endpoint, seconds):
+        '''Records the latency in seconds of a successful request to url'''
+        with self._lock:
+            samples = self._samples.setdefault(url, {}).setdefault(endpoint, [])
+            samples.append(int(seconds * 1000))
+            if len(samples) > self.window:
+                del samples[:len(samples) - self.window]
+
+    def timeout(self, url, endpoint, default):
+        '''Returns the timeout in seconds for a request to url, or default if not enough is known'''
+        value = self.latency(url, endpoint)
+        if value is None:
+            return default
+        return max(self.floor, min(self.ceiling, value * self.factor))
+
+    def latency(self, url, endpoint, percentile=None):
+        '''Returns the given percentile (0-1) of latencies in seconds, None if there are too few'''
+        if percentile is None:
+            percentile = self.percentile
+        with self._lock:
+            samples = self._samples.get(url, {}).get(endpoint)
+            if not samples or len(samples) < self.min_samples:
+                return
+            samples = sorted(samples)
+        #nearest rank
+        rank = max(1, int(math.ceil(percentile * len(samples))))
+        return samples[rank - 1] / 1000.0
+
+    def load(self, data):
+        '''Loads statistics previously returned by to_json'''
+        if not isinstance(data, dict):
+            return
+        with self._lock:
+            for url, endpoints in data.items():
+                if not isinstance(endpoints, dict):
+                    continue
+                for endpoint, samples in endpoints.items():
+                    if not isinstance(samples, list):
+                        continue
+                    samples = [s for s in samples if isinstance(s, int) and s >= 0]
+                    self._samples.setdefault(url, {})[endpoint] = samples[-self.window:]
+
+    def to_json(self, urls=None):
+        '''Returns statistics in a form that can be stored in the tracker file, limited to urls if given'''
+        with self._lock:
+            return {
+                url: {endpoint: list(samples) for endpoint, samples in endpoints.items()}
+                for url, endpoints in self._samples.items()
+                if urls is None or url in urls
+            }
+
+    def stats(self):
+        '''Returns the median and percentile latency and timeout of each lead and class'''
+        with self._lock:
+            keys = [(url, endpoint) for url in self._samples for endpoint in self._samples[url]]
+        stats = {}
+        for url, endpoint in keys:
+            stats.setdefault(url, {})[endpoint] = {
+                'p50': self.latency(url, endpoint, 0.5),
+                'p{}'.format(int(self.percentile * 100)): self.latency(url, endpoint),
+                'timeout': self.timeout(url, endpoint, None)
+            }
+        return stats
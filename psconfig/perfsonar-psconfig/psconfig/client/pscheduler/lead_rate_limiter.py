@@ -0,0 +1,105 @@
+'''
+Token bucket rate limits on requests TaskManager sends to each pScheduler lead
+'''
+
+import threading
+import time
+
+
+class TokenBucket(object):
+    '''
+    Lets rate requests per second through on average with bursts of up to burst requests.
+    Tokens may go negative, so each caller reserves its own slot and waiters are served in
+    the order they asked. Safe to use from multiple threads.
+    '''
+
+    def __init__(self, rate, burst=1):
+        self.rate = float(rate)
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        '''Takes a token and returns the seconds to wait before using it'''
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0
+            return -self._tokens / self.rate
+
+
+class LeadRateLimiter(object):
+    '''
+    Keeps a token bucket per lead and class of request so a large commit doesn't flood a
+    pScheduler server. Classes are list (hostname and task listing), lead (participant
+    lookups) and mutate (task creation and deletion), each with its own rate in requests
+    per second. A class with a rate of None or 0 (the default) is not limited. Time spent
+    waiting is counted so it can be reported. Safe to use from multiple threads.
+    '''
+
+    KINDS = ('list', 'lead', 'mutate')
+
+    def __init__(self, **kwargs):
+        self.rates = {
+            'list': kwargs.get('list_rate'),
+            'lead': kwargs.get('lead_rate'),
+            'mutate': kwargs.get('mutate_rate')
+        }
+        self.burst = kwargs.get('burst', 10)
+        self._buckets = {}
+        self._throttled = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, url, kind):
+        '''
+        Blocks until a request of class kind may be sent to the lead at url and returns the
+        seconds waited
+        '''
+        bucket = self._bucket(url, kind)
+        if bucket is None:
+            return 0
+        wait = bucket.reserve()
+        if wait > 0:
+            time.sleep(wait)
+            with self._lock:
+                counter = self._throttled.setdefault(url, {}).setdefault(kind, {'requests': 0, 'seconds': 0.0})
+                counter['requests'] += 1
+                counter['seconds'] += wait
+        return wait
+
+    def _bucket(self, url, kind):
+        rate = self.rates.get(kind)
+        if not rate:
+            return
+        with self._lock:
+            bucket = self._buckets.get((url, kind))
+            if bucket is None:
+                bucket = TokenBucket(rate, self.burst)
+                self._buckets[(url, kind)] = bucket
+            return bucket
+
+    def stats(self):
+        '''
+        Returns the number of throttled requests and seconds spent waiting, in total, by
+        class and by lead
+        '''
+        stats = {
+            'requests': 0,
+            'seconds': 0.0,
+            'kinds': {kind: {'requests': 0, 'seconds': 0.0} for kind in self.KINDS},
+            'leads': {}
+        }
+        with self._lock:
+            for url, kinds in self._throttled.items():
+                stats['leads'][url] = {kind: dict(counter) for kind, counter in kinds.items()}
+                for kind, counter in kinds.items():
+                    stats['requests'] += counter['requests']
+                    stats['seconds'] += counter['seconds']
+                    total = stats['kinds'].setdefault(kind, {'requests': 0, 'seconds': 0.0})
+                    total['requests'] += counter['requests']
+                    total['seconds'] += counter['seconds']
+        return stats
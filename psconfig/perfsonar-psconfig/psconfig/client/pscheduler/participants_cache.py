@@ -0,0 +1,99 @@
+'''
+Cache of participant counts returned by pScheduler for a test spec
+'''
+
+from concurrent.futures import ThreadPoolExecutor
+import json
+import re
+import threading
+
+from .api_connect import ApiConnect
+
+TEMPLATE_VAR_RE = re.compile(r'{%\s+.+?\s+%\}')
+#template variables that only fill in an address of the pair
+ADDRESS_VAR_RE = re.compile(r'{%\s+(?:(?:address|pscheduler_address|lead_bind_address)\[\d+\]|scheduled_by_address|localhost)\s+%\}')
+
+
+class ParticipantsCache(object):
+    '''
+    Remembers how many participants pScheduler reports for a test. The count depends on
+    the test type and the spec, but not on the addresses filled in for a particular pair,
+    so one lookup can be shared by every pair generated from the same test template
+    unless other template variables expand differently. Meant to live for a single agent
+    run and is safe to use from multiple threads.
+    '''
+
+    def __init__(self, **kwargs):
+        #number of lookups to run at once when prefetching
+        self.workers = kwargs.get('workers', 8)
+        self.hits = 0
+        self.misses = 0
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(test_type, template_spec, expanded_spec=None):
+        '''
+        Returns the cache key for a test. template_spec is the spec before template
+        variables are expanded. The fields present in expanded_spec are included in case
+        a template variable expands to nothing. Fields set by template variables other
+        than addresses, such as jq, may change the count, so their expanded values are
+        included too.
+        '''
+        fields = {}
+        if isinstance(expanded_spec, dict):
+            template_fields = template_spec if isinstance(template_spec, dict) else {}
+            for field, value in expanded_spec.items():
+                template_value = ADDRESS_VAR_RE.sub('', json.dumps(template_fields.get(field)))
+                if field in template_fields and not TEMPLATE_VAR_RE.search(template_value):
+                    value = None
+                fields[field] = value
+        return json.dumps([test_type, template_spec, fields], sort_keys=True, separators=(',', ':'))
+
+    def get(self, key, default=None):
+        '''Returns the cached participant count for key or default'''
+        with self._lock:
+            if key in self._counts:
+                self.hits += 1
+                return self._counts[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, count):
+        with self._lock:
+            self._counts[key] = count
+
+    def prefetch(self, psc_url, specs, transport=None):
+        '''
+        Looks up participant counts for every entry of specs (a dict of key to test JSON
+        as accepted by ApiConnect.get_number_of_participants) not already cached. Lookups
+        run concurrently. Returns a dict of key to error for lookups that failed.
+        '''
+        with self._lock:
+            pending = {k: v for k, v in specs.items() if k not in self._counts}
+        if not pending:
+            return {}
+
+        def fetch(item):
+            key, test_data_json = item
+            psc_client = ApiConnect(url=psc_url, transport=transport)
+            count = psc_client.get_number_of_participants(test_data_json)
+            return key, count, psc_client.error
+
+        errors = {}
+        with ThreadPoolExecutor(max_workers=max(1, min(self.workers, len(pending)))) as executor:
+            for key, count, error in executor.map(fetch, pending.items()):
+                if self.valid_count(count):
+                    self.set(key, count)
+                else:
+                    errors[key] = error or 'Invalid number of participants'
+        return errors
+
+    def stats(self):
+        with self._lock:
+            return {'size': len(self._counts), 'hits': self.hits, 'misses': self.misses}
+
+    @staticmethod
+    def valid_count(count):
+        '''Returns True if count is a usable answer from get_number_of_participants'''
+        return count is not None and count != -1 and count != '-1'
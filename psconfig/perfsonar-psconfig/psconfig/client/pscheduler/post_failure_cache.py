@@ -0,0 +1,117 @@
+'''
+Remembers tasks that pScheduler refused so they aren't retried every run
+'''
+
+import threading
+import time
+
+
+class PostFailureCache(object):
+    '''
+    Tracks tasks, keyed by checksum, whose lead lookup or POST was answered with an HTTP
+    error. A task that fails is not retried until its backoff is over. Client errors
+    (4xx other than 408 and 429) mean pScheduler rejected the task itself, such as an
+    invalid spec, so they are treated as permanent and wait permanent_backoff seconds.
+    Other failures are transient and wait base_backoff seconds, doubled for each further
+    consecutive failure up to max_backoff. A task whose definition changes gets a new
+    checksum and so is tried right away.
+
+    Entries are stored in the tracker file. Entries for tasks that are no longer generated
+    are dropped when saved. Safe to use from multiple threads.
+    '''
+
+    def __init__(self, **kwargs):
+        self.base_backoff = kwargs.get('base_backoff', 300)
+        self.max_backoff = kwargs.get('max_backoff', 21600)
+        self.permanent_backoff = kwargs.get('permanent_backoff', 86400)
+        self._entries = {}
+        self._seen = set()
+        self._lock = threading.Lock()
+        self.load(kwargs.get('data', {}))
+
+    @staticmethod
+    def is_permanent(http_status):
+        '''Returns True if an HTTP status means retrying the same task won't help'''
+        return http_status is not None and 400 <= http_status < 500 and http_status not in (408, 429)
+
+    def blocked(self, checksum):
+        '''
+        Returns the entry for checksum if the task is still backing off, None if it may be
+        posted. Marks the checksum as still in use either way.
+        '''
+        now = time.time()
+        with self._lock:
+            self._seen.add(checksum)
+            entry = self._entries.get(checksum)
+            if entry is None or entry['retry_time'] <= now:
+                return
+            return dict(entry)
+
+    def failure(self, checksum, http_status=None, error=None, task=None):
+        '''Records a failed attempt to create the task with checksum and returns its entry'''
+        now = int(time.time())
+        permanent = self.is_permanent(http_status)
+        with self._lock:
+            self._seen.add(checksum)
+            entry = self._entries.get(checksum, {'failures': 0, 'first_time': now})
+            entry['failures'] += 1
+            entry['last_time'] = now
+            entry['http_status'] = http_status
+            entry['permanent'] = permanent
+            entry['error'] = str(error) if error else ''
+            if task:
+                entry['task'] = task
+            if permanent:
+                entry['retry_time'] = now + self.permanent_backoff
+            else:
+                entry['retry_time'] = now + self.backoff(entry['failures'])
+            self._entries[checksum] = entry
+            return dict(entry)
+
+    def success(self, checksum):
+        '''Forgets failures of the task with checksum'''
+        with self._lock:
+            self._seen.add(checksum)
+            self._entries.pop(checksum, None)
+
+    def backoff(self, failures):
+        '''Returns the wait in seconds after the given number of consecutive transient failures'''
+        if failures < 1:
+            return 0
+        return min(self.max_backoff, self.base_backoff * (2 ** min(failures - 1, 32)))
+
+    def entries(self):
+        '''Returns a copy of all entries keyed by checksum'''
+        with self._lock:
+            return {k: dict(v) for k, v in self._entries.items()}
+
+    def clear(self, checksum=None):
+        '''Removes the entry for checksum, or all entries if not given. Returns the number removed.'''
+        with self._lock:
+            if checksum is None:
+                count = len(self._entries)
+                self._entries = {}
+                return count
+            return 1 if self._entries.pop(checksum, None) is not None else 0
+
+    def load(self, data):
+        '''Loads entries previously returned by to_json'''
+        if not isinstance(data, dict):
+            return
+        with self._lock:
+            for checksum, entry in data.items():
+                if isinstance(entry, dict) and isinstance(entry.get('retry_time'), (int, float)) \
+                        and isinstance(entry.get('failures'), int):
+                    self._entries[checksum] = dict(entry)
+
+    def to_json(self, seen_only=True):
+        '''
+        Returns entries in a form that can be stored in the tracker file. Unless seen_only
+        is False, only entries for tasks looked up or updated since this cache was created
+        are included.
+        '''
+        with self._lock:
+            return {
+                k: dict(v) for k, v in self._entries.items()
+                if (not seen_only) or k in self._seen
+            }
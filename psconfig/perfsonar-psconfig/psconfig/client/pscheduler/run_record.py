@@ -0,0 +1,70 @@
+'''
+Compact record of a pScheduler run
+'''
+
+import json
+
+from .api_filters import ApiFilters
+from .run import Run
+from ..utils import iso_to_ts
+
+
+class RunRecord(object):
+    '''
+    Keeps the fields needed to scan many runs (state, times and participant) with the
+    times already converted to epoch seconds. The rest of the run, minus the full
+    per-participant results and data unless full is requested, is held as a JSON string
+    so a Run can be rebuilt when the details are needed.
+    '''
+
+    __slots__ = (
+        'uuid', 'url', 'state', 'start_time', 'end_time', 'start_ts', 'end_ts',
+        'duration', 'participant', '_data_json'
+    )
+
+    #large fields only kept when asked for
+    FULL_FIELDS = ('result-full', 'participant-data-full')
+
+    def __init__(self, **kwargs):
+        self.uuid = kwargs.get('uuid')
+        self.url = kwargs.get('url')
+        self.state = kwargs.get('state')
+        self.start_time = kwargs.get('start_time')
+        self.end_time = kwargs.get('end_time')
+        self.start_ts = kwargs.get('start_ts')
+        self.end_ts = kwargs.get('end_ts')
+        self.duration = kwargs.get('duration')
+        self.participant = kwargs.get('participant')
+        self._data_json = kwargs.get('data_json', '{}')
+
+    @classmethod
+    def from_json(cls, data, url=None, uuid=None, full=False):
+        '''Builds a record from a run object returned by pScheduler'''
+        if not full:
+            data = {k: v for k, v in data.items() if k not in cls.FULL_FIELDS}
+        return cls(
+            uuid=uuid,
+            url=url,
+            state=data.get('state'),
+            start_time=data.get('start-time'),
+            end_time=data.get('end-time'),
+            start_ts=iso_to_ts(data.get('start-time')),
+            end_ts=iso_to_ts(data.get('end-time')),
+            duration=data.get('duration'),
+            participant=data.get('participant'),
+            data_json=json.dumps(data, separators=(',', ':'))
+        )
+
+    def data(self):
+        '''Returns the run object that was kept'''
+        return json.loads(self._data_json)
+
+    def run(self, filters=None, transport=None):
+        '''Returns a new Run built from this record'''
+        return Run(
+            data=self.data(),
+            url=self.url,
+            filters=filters if filters is not None else ApiFilters(),
+            uuid=self.uuid,
+            transport=transport
+        )
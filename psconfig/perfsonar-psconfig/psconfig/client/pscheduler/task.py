@@ -1,14 +1,15 @@
 
 from .base_node import BaseNode
-from ..utils import Utils, build_err_msg, extract_url_uuid
+from ..utils import Utils, build_err_msg, extract_url_uuid, iter_concurrent, iter_json_array, ts_to_iso
 from .archive import Archive
 from .run import Run
+from .run_record import RunRecord
+from .lead_cache import LeadCache
 from hashlib import md5
 from base64 import b64encode
 from ipaddress import ip_address, IPv6Address
-from urllib.parse import urlparse, urlunparse
+from urllib.parse import urlparse, urlunparse, urlencode
 import json
-import copy
 
 class Task(BaseNode):
     
@@ -17,7 +18,27 @@ class Task(BaseNode):
         self.bind_map = kwargs.get('bind_map', {}) #host interface
         self.lead_bind_map = kwargs.get('lead_bind_map', {})
         self.lead_address_map = kwargs.get('lead_address_map', {}) #host
+        self.lead_cache = kwargs.get('lead_cache') #LeadCache, None disables caching
+        #called with the participants url before a lead lookup that isn't cached, such as a rate limit
+        self.lead_throttle = kwargs.get('lead_throttle')
+        #whether the last lead lookup was answered from the lead cache
+        self.cache_hit = False
         self.error = ''
+
+    @property
+    def data(self):
+        return self._data
+
+    @data.setter
+    def data(self, val):
+        self._data = val
+        self._changed()
+
+    def _changed(self):
+        ##
+        # Drops the cached checksum. Setters call this for any field that is part of the
+        # checksum. Code that changes data in place some other way must call it too.
+        self._checksum = None
         
     def _post_url(self):
         tasks_url = self.url
@@ -35,12 +56,14 @@ class Task(BaseNode):
     
     def priority(self, val=None):
         if val is not None:
+            self._changed()
             self.data['priority'] = val
         
         return self.data.get('priority', None)
     
     def test_type(self, val=None):
         if val is not None:
+            self._changed()
             self._init_field(self.data, 'test')
             self.data['test']['type'] = val
         
@@ -51,6 +74,7 @@ class Task(BaseNode):
     
     def test_spec(self, val=None):
         if val is not None:
+            self._changed()
             self._init_field(self.data, 'test')
             self.data['test']['spec'] = val
         
@@ -65,6 +89,7 @@ class Task(BaseNode):
             return None
         
         if val is not None:
+            self._changed()
             self._init_field(self.data, 'test')
             self._init_field(self.data['test'], 'spec')
             self.data['test']['spec'][field] = val
@@ -82,16 +107,19 @@ class Task(BaseNode):
     
     def lead_bind(self, val=None):
         if val is not None:
+            self._changed()
             self.data['lead-bind'] = val
         return self.data.get('lead-bind', None)
     
     def reference(self, val=None):
         if val is not None:
+            self._changed()
             self.data['reference'] = val
         return self.data.get('reference', None)
 
     def contexts(self, val=None):
         if val is not None:
+            self._changed()
             self.data['contexts'] = val
         return self.data.get('contexts', None)
     
@@ -101,6 +129,7 @@ class Task(BaseNode):
             return None
         
         if val is not None:
+            self._changed()
             self._init_field(self.data, 'reference')
             self.data['reference'][field] = val
         
@@ -111,11 +140,13 @@ class Task(BaseNode):
     
     def schedule(self, val=None):
         if val is not None:
+            self._changed()
             self.data['schedule'] = val
         return self.data.get('schedule', None)
     
     def schedule_maxruns(self, val=None):
         if val is not None:
+            self._changed()
             self._init_field(self.data, 'schedule')
             self.data['schedule']['max-runs'] = val
         
@@ -126,6 +157,7 @@ class Task(BaseNode):
     
     def schedule_repeat(self, val=None):
         if val is not None:
+            self._changed()
             self._init_field(self.data, 'schedule')
             self.data['schedule']['repeat'] = val
         
@@ -136,6 +168,7 @@ class Task(BaseNode):
     
     def schedule_sliprand(self, val=None):
         if val is not None:
+            self._changed()
             self._init_field(self.data, 'schedule')
             if val:
                 self.data['schedule']['sliprand'] = True
@@ -149,6 +182,7 @@ class Task(BaseNode):
     
     def schedule_slip(self, val=None):
         if val is not None:
+            self._changed()
             self._init_field(self.data, 'schedule')
             self.data['schedule']['slip'] = val
         
@@ -298,6 +332,7 @@ class Task(BaseNode):
     
     def archives(self, val=None):
         if val is not None:
+            self._changed()
             self.data['archives'] = []
             for v in val:
                 tmp_archive = {
@@ -323,6 +358,7 @@ class Task(BaseNode):
     def add_archive(self, val=None):
         if val is None:
             return
+        self._changed()
         self.data['archives'] = self.data.get('archives', [])
 
         tmp_archive = {
@@ -336,12 +372,14 @@ class Task(BaseNode):
     
     def requested_tools(self, val=None):
         if val is not None:
+            self._changed()
             self.data['tools'] = val
         return self.data.get('tools', None)
     
     def add_requested_tool(self, val=None):
         if val is None:
             return
+        self._changed()
         
         self.data['tools'] = self.data.get('tools', None)
         self.data['tools'].append(val)
@@ -373,7 +411,14 @@ class Task(BaseNode):
     
 
     def post_task(self):
-        
+        self._prepare_post()
+
+        #send request
+        content = self._post(self.data)
+        return self._post_task_result(content)
+
+    def _prepare_post(self):
+        #fill in fields pscheduler needs before posting
         if self.schema() is None:
             if self.priority() is not None:
                 #priority introduced in v3
@@ -389,8 +434,8 @@ class Task(BaseNode):
         self._init_field(self.data['test'], 'spec')
         self.data['test']['spec']['schema'] = self.data['test']['spec'].get('schema', 1)
 
-        #send request
-        content = self._post(self.data)
+    def _post_task_result(self, content):
+        #sets the uuid from the url returned by a POST to tasks
         if self.error:
             return -1 
         if not content:
@@ -414,82 +459,111 @@ class Task(BaseNode):
             return -1
         return 0
     
-    def runs(self):
-
-        #build url
-        runs_url = self.url
-        runs_url = runs_url.strip()
-
-        if not runs_url.endswith('/'):
-            runs_url += '/'
+    def runs(self, workers=8):
+        run_uuids = self._run_uuids_result(Utils().send_http_request(**self._send_args('GET', self._runs_url())), "Runs must be an array. Not {}")
+        if run_uuids is None:
+            return
         
-        runs_url = runs_url + "tasks/" + self.uuid + "/runs"
-
-        filters = {}
-        result = Utils().send_http_request(
-            connection_type='GET',
-            url=runs_url,
-            timeout=self.filters.timeout,
-            ca_certificate_file=self.filters.ca_certificate_file,
-            ca_certificate_path=self.filters.ca_certificate_path,
-            verify_hostname=self.filters.verify_hostname,
-            local_address=self.bind_address
-        )
+        #fetch up to workers runs at once
+        runs = []
+        for run in iter_concurrent(self.get_run, run_uuids, workers):
+            if not run:
+                #There was an error
+                return 
+            runs.append(run)
+        return runs
 
+    def iter_run_records(self, start=None, end=None, workers=8, full=False, chunk_size=65536):
+        '''
+        Yields a RunRecord for each run of the task, in the order pScheduler lists them.
+        start and end are epoch seconds limiting the runs to those starting in that window.
+        The run list is parsed as it is read and up to workers runs are fetched at once, so
+        memory use doesn't grow with the number of runs. Set full to keep the full results
+        of each participant in the records. Runs that can't be fetched are skipped, check
+        error once the generator is exhausted.
+        '''
+        result = Utils().send_http_request(**self._send_args('GET', self._runs_window_url(start, end), stream=True))
         response = result['response']
         if result['exception']:
             self.error = result['exception']
             return
 
-        if not response.ok:
-            self.error = build_err_msg(http_response=response)
-            return
-        
-        response_json = response.json()
-
-        if not response_json:
-            self.error = "No run objects returned"
-            return
-        
-        if not isinstance(response_json, list):
-            self.error = "Runs must be an array. Not {}".format(type(response_json))
-            return
-        
-        runs = []
-        for run_url in response_json:
-            run_uuid = extract_url_uuid(url=run_url)
+        def fetch(run_url):
+            run_uuid = self._run_url_uuid(run_url)
             if not run_uuid:
-                self.error = "Unable to extract name from url {}".format(run_url)
                 return
-            run = self.get_run(run_uuid)
-            if not run:
-                #There was an error
-                return 
-            runs.append(run)
-        return runs
+            return self._run_record(self.get_run(run_uuid), full)
 
-    def run_uuids(self):
+        try:
+            if not response.ok:
+                self.error = build_err_msg(http_response=response)
+                return
 
+            run_urls = iter_json_array(response.iter_content(chunk_size=chunk_size))
+            for record in iter_concurrent(fetch, run_urls, workers):
+                if self._in_window(record, start, end):
+                    yield record
+        except ValueError as e:
+            self.error = "Runs must be an array. Unable to parse response: {}".format(e)
+        except Exception as e:
+            #connection problems while reading the body
+            self.error = e
+        finally:
+            response.close()
+
+    def run_records(self, start=None, end=None, workers=8, full=False):
+        '''Same as iter_run_records() but returns a list, or None if listing the runs failed'''
+        records = list(self.iter_run_records(start=start, end=end, workers=workers, full=full))
+        if not records and self.error:
+            return
+        return records
+
+    def _runs_window_url(self, start, end):
+        #runs url limited to runs starting between start and end
+        runs_url = self._runs_url()
+        query = {}
+        if start is not None:
+            query['start'] = ts_to_iso(start)
+        if end is not None:
+            query['end'] = ts_to_iso(end)
+        if query:
+            runs_url += '?' + urlencode(query)
+        return runs_url
+
+    def _run_url_uuid(self, run_url):
+        run_uuid = extract_url_uuid(url=run_url)
+        if not run_uuid:
+            self.error = "Unable to extract name from url {}".format(run_url)
+        return run_uuid
+
+    def _run_record(self, run, full):
+        if not run:
+            return
+        return RunRecord.from_json(run.data, url=run.url, uuid=run.uuid, full=full)
+
+    def _in_window(self, record, start, end):
+        if record is None:
+            return False
+        #in case the server doesn't filter by time itself
+        if record.start_ts is not None:
+            if start is not None and record.start_ts < start:
+                return False
+            if end is not None and record.start_ts > end:
+                return False
+        return True
+
+    def _runs_url(self):
         #build url
         runs_url = self.url
         runs_url = runs_url.strip()
 
         if not runs_url.endswith('/'):
             runs_url += '/'
+        
+        return runs_url + "tasks/" + self.uuid + "/runs"
 
-        runs_url = runs_url + "tasks/" + self.uuid + "/runs"
-
-        filters = {}
-        result = Utils().send_http_request(
-            connection_type='GET',
-            url=runs_url,
-            timeout=self.filters.timeout,
-            ca_certificate_file=self.filters.ca_certificate_file,
-            ca_certificate_path=self.filters.ca_certificate_path,
-            verify_hostname=self.filters.verify_hostname,
-            local_address=self.bind_address
-        )
-
+    def _run_uuids_result(self, result, not_list_msg):
+        #returns the run uuids from a runs response
         response = result['response']
         if result['exception']:
             self.error = result['exception']
@@ -505,7 +579,7 @@ class Task(BaseNode):
             return
 
         if not isinstance(response_json, list):
-            self.error = "Runs must be a list. Not {}".format(type(response_json))
+            self.error = not_list_msg.format(type(response_json))
             return
         
         runs = []
@@ -517,28 +591,15 @@ class Task(BaseNode):
             runs.append(run_uuid)
         
         return runs
+
+    def run_uuids(self):
+        return self._run_uuids_result(Utils().send_http_request(**self._send_args('GET', self._runs_url())), "Runs must be a list. Not {}")
     
     def get_run(self, run_uuid):
-        #build url
-        run_url = self.url
-        run_url = run_url.strip()
-
-        if not run_url.endswith('/'):
-            run_url += '/'
-        
-        run_url = run_url + "tasks/" + self.uuid + "/runs/{}".format(run_uuid)
-
-        #fetch tool
-        result = Utils().send_http_request(
-            connection_type='GET',
-            url=run_url,
-            timeout=self.filters.timeout,
-            ca_certificate_file=self.filters.ca_certificate_file,
-            ca_certificate_path=self.filters.ca_certificate_path,
-            verify_hostname=self.filters.verify_hostname,
-            local_address=self.bind_address
-        )
+        run_url = self._runs_url() + "/{}".format(run_uuid)
+        return self._run_result(Utils().send_http_request(**self._send_args('GET', run_url)), run_url, run_uuid)
 
+    def _run_result(self, result, run_url, run_uuid):
         run_response = result['response']
         if result['exception']:
             self.error = result['exception']
@@ -557,14 +618,40 @@ class Task(BaseNode):
             data=run_response_json,
             url=run_url,
             filters=self.filters,
-            uuid=run_uuid
+            uuid=run_uuid,
+            transport=self.transport
         )
 
     def get_lead(self):
+        self.cache_hit = False
+        lead_url, get_params = self._lead_request()
+        if lead_url is None:
+            return
 
+        #check cache before asking pscheduler
+        cache_key = self._lead_cache_key(lead_url, get_params)
+        lead = LeadCache.MISSING
+        if cache_key is not None:
+            lead = self.lead_cache.get(cache_key, LeadCache.MISSING)
+        self.cache_hit = lead is not LeadCache.MISSING
+        if lead is LeadCache.MISSING:
+            if self.lead_throttle is not None:
+                self.lead_throttle(self.url)
+            lead = self._lead_result(Utils().send_http_request(**self._send_args('GET', lead_url, get_params=get_params)), lead_url)
+            if self.error:
+                return
+            if cache_key is not None:
+                self.lead_cache.set(cache_key, lead)
+
+        return self._apply_lead(lead)
+
+    def _lead_request(self):
+        ##
+        # Applies address and bind maps and returns the participants url and GET parameters
+        # used to find the lead, or None, None if the task can't be looked up.
         #need a test_type and test_spec for this to work
         if not (self.test_type() and self.test_spec()):
-            return
+            return None, None
         
         #do any address based mappings here
         participants_lead_bind = ""
@@ -614,44 +701,45 @@ class Task(BaseNode):
         if participants_lead_bind:
             get_params['lead-bind'] = participants_lead_bind
         
-        result = Utils().send_http_request(
-            connection_type='GET',
-            url=lead_url,
-            get_params=get_params,
-            timeout=self.filters.timeout,
-            ca_certificate_file=self.filters.ca_certificate_file,
-            ca_certificate_path=self.filters.ca_certificate_path,
-            verify_hostname=self.filters.verify_hostname,
-            local_address=self.bind_address
-        )
+        return lead_url, get_params
 
+    def _lead_cache_key(self, lead_url, get_params):
+        if self.lead_cache is None:
+            return
+        return LeadCache.key(lead_url, self.test_spec(), get_params.get('lead-bind', ''), self.bind_address)
+
+    def _lead_result(self, result, lead_url):
+        #returns the first participant from a participants response
         lead_response = result['response']
         if result['exception']:
             self.error = result['exception']
-            return
+            return None
         
         if not lead_response.ok:
             self.error = build_err_msg(http_response=lead_response)
-            return
+            self.http_status = lead_response.status_code
+            return None
         
         lead_response_json = {}
         try:
             lead_response_json = lead_response.json()
         except Exception as e:
             self.error = "Error parsing lead object returned from {}: {}".format(lead_url, e)
-            return
+            return None
 
         
         if not lead_response_json.get('participants'):
             self.error = "Error parsing lead object returned from {}: No participant list returned".format(lead_url)
-            return
+            return None
         
         if not len(lead_response_json.get('participants')) > 0:
             self.error = "Error parsing lead object returned from {}: No participants provided in the returned list".format(lead_url)
-            return
+            return None
 
-        lead = lead_response_json['participants'][0]
+        return lead_response_json['participants'][0]
 
+    def _apply_lead(self, lead):
+        #maps the lead to its public address and sets bind addresses for it
         #switch to public address if mapping exists
         if lead and self.lead_address_map.get(lead):
             lead = self.lead_address_map[lead]
@@ -669,16 +757,17 @@ class Task(BaseNode):
             self.lead_bind(self.lead_bind_map['_default'])
         
         return lead
-    
+
     def get_lead_url(self, scheme='https', port='', path='/pscheduler'):
+        return self._lead_url(self.get_lead(), scheme, port, path)
 
+    def _lead_url(self, address, scheme, port, path):
         if port:
             port = ":" + port
         if not path.startswith('/'):
             path = '/' + path
         
         #get address
-        address = self.get_lead()
         if not address:
             return
         
@@ -711,28 +800,41 @@ class Task(BaseNode):
         self.data['archives'] = self.data.get('archives', [])
         self.data['schedule'] = self.data.get('schedule', {})
 
-        data_copy = copy.deepcopy(self.data)
+        #only recalculate if something changed since last time
+        if self._checksum is not None:
+            return self._checksum
+
+        #build a shallow copy, only copying the parts of data that get cleared
+        data_copy = dict(self.data)
         data_copy['schema'] = '' #clear out this since if other params same then should be equal
-        data_copy['test']['spec']['schema'] = '' #clear out this since if other params same then should be equal
         data_copy['tool'] = '' #clear out tool since set by server
         data_copy['href'] = '' #clear out href
+        data_copy['detail'] = {} #clear out detail
+
+        data_copy['schedule'] = dict(data_copy['schedule'])
         data_copy['schedule']['start'] = '' #clear out temporal values
         data_copy['schedule']['until'] = '' #clear out temporal values
-        data_copy['detail'] = {} #clear out detail
 
         #clear our private fields that won't get displayed by remote tasks
+        data_copy['test'] = dict(data_copy['test'])
+        data_copy['test']['spec'] = self._clear_private(data_copy['test']['spec'])
+        data_copy['test']['spec']['schema'] = '' #clear out this since if other params same then should be equal
+
+        archives_copy = []
         for archive in data_copy['archives']:
-            for datum in archive['data'].keys():
-                if datum.startswith('_'):
-                    archive['data'][datum] = ''
-        
-        for tparam in data_copy['test']['spec']:
-            if tparam.startswith('_'):
-                data_copy['test']['spec'][tparam] = ''
+            archive_copy = dict(archive)
+            archive_copy['data'] = self._clear_private(archive['data'])
+            archives_copy.append(archive_copy)
+        data_copy['archives'] = archives_copy
 
         #canonical should keep it consistent by sorting keys
         data_copy_canonical = json.dumps(data_copy, sort_keys=True, separators=(',',':')).encode('utf-8')
-        return b64encode(md5(data_copy_canonical).digest()).decode().rstrip('=')
+        self._checksum = b64encode(md5(data_copy_canonical).digest()).decode().rstrip('=')
+        return self._checksum
+
+    def _clear_private(self, params):
+        #returns a copy of params with fields starting with _ set to empty string
+        return {k: ('' if k.startswith('_') else v) for k, v in params.items()}
     
     def to_str(self): #use __str__?
         string = self.test_type()
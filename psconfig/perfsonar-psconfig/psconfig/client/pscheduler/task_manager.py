@@ -3,16 +3,39 @@ A client tracking and maintaining pscheduler tasks across multiple servers
 '''
 
 import os
-import isodate
 import json
 import time
 import uuid
+import copy
+import threading
+import asyncio
+import concurrent.futures
+from concurrent.futures import ThreadPoolExecutor
 from ...utilities.iso8601 import duration_to_seconds
 from .api_filters import ApiFilters
 from .api_connect import ApiConnect
+from .async_api_connect import AsyncApiConnect
+from .lead_cache import LeadCache
+from .lead_breaker import LeadBreaker
+from .lead_latency import LeadLatency
+from .lead_rate_limiter import LeadRateLimiter
+from .post_failure_cache import PostFailureCache
+from .task_record import TaskRecord, iso_to_ts
+from ..transport import HttpTransport
+from .. import async_transport
 import datetime
 from ...utilities.logging_utils import LoggingUtils
 import logging
+from hashlib import md5
+
+#rate limit class of each kind of request sent to a lead
+ENDPOINT_RATE_CLASSES = {
+    'hostname': 'list',
+    'listing': 'list',
+    'participants': 'lead',
+    'post': 'mutate',
+    'delete': 'mutate'
+}
 
 class TaskManager(object):
     def __init__(self, **kwargs):
@@ -24,6 +47,10 @@ class TaskManager(object):
         self.leads_to_keep = kwargs.get('leads_to_keep', {})
         self.added_tasks = kwargs.get('added_tasks', [])
         self.hostname = kwargs.get('agent_hostname', None)
+        #pooled HTTP transport shared by every client this manager creates
+        self.transport = kwargs.get('transport') or HttpTransport()
+        #optional CapabilityCache used to remember lead hostnames between runs
+        self.capability_cache = kwargs.get('capability_cache')
         #self.leads = {}
         
         #mandatory
@@ -67,11 +94,55 @@ class TaskManager(object):
                 raise TypeError("task_renewal_fudge_factor must be float")
         self.task_renewal_fudge_factor = kwargs.get('task_renewal_fudge_factor', 0.0)
 
+        #spread expirations and renewals of tasks over this many seconds
+        if 'renewal_window' in kwargs:
+            if not isinstance(kwargs.get('renewal_window'), int):
+                raise TypeError("renewal_window must be integer")
+        self.renewal_window = kwargs.get('renewal_window', 0)
+
         #optional argument
         if 'debug' in kwargs:
             if not isinstance(kwargs.get('debug'), bool):
                 raise TypeError("debug must be boolean")
         self.debug = kwargs.get('debug')
+
+        #optional arguments controlling how leads are listed
+        if 'lead_workers' in kwargs:
+            if not isinstance(kwargs.get('lead_workers'), int):
+                raise TypeError("lead_workers must be integer")
+        self.lead_workers = kwargs.get('lead_workers', 8)
+        if 'lead_deadline' in kwargs:
+            if not isinstance(kwargs.get('lead_deadline'), (int, float)):
+                raise TypeError("lead_deadline must be a number")
+        self.lead_deadline = kwargs.get('lead_deadline', 120)
+        #leads past their deadline whose requests may still hold a thread
+        if 'lead_max_stragglers' in kwargs:
+            if not isinstance(kwargs.get('lead_max_stragglers'), int):
+                raise TypeError("lead_max_stragglers must be integer")
+        self.lead_max_stragglers = kwargs.get('lead_max_stragglers', 8)
+        #parse task lists as they are read instead of loading the whole response
+        if 'stream_tasks' in kwargs:
+            if not isinstance(kwargs.get('stream_tasks'), bool):
+                raise TypeError("stream_tasks must be boolean")
+        self.stream_tasks = kwargs.get('stream_tasks', True)
+        #list leads with the asyncio client from one thread, lead_workers can then be much
+        #higher. Needs aiohttp.
+        if 'use_asyncio' in kwargs:
+            if not isinstance(kwargs.get('use_asyncio'), bool):
+                raise TypeError("use_asyncio must be boolean")
+        self.use_asyncio = kwargs.get('use_asyncio', False)
+
+        #optional arguments controlling how tasks are created and deleted on commit
+        if 'commit_workers' in kwargs:
+            if not isinstance(kwargs.get('commit_workers'), int):
+                raise TypeError("commit_workers must be integer")
+        self.commit_workers = kwargs.get('commit_workers', 16)
+        if 'lead_max_in_flight' in kwargs:
+            if not isinstance(kwargs.get('lead_max_in_flight'), int):
+                raise TypeError("lead_max_in_flight must be integer")
+        self.lead_max_in_flight = kwargs.get('lead_max_in_flight', 4)
+        self._lead_semaphores = {}
+        self._lead_semaphores_lock = threading.Lock()
         
         self.errors = [] 
         
@@ -80,8 +151,106 @@ class TaskManager(object):
         self.leads = self.tracker_file_json.get('leads', {})
         self._update_lead(self.pscheduler_url, {})
 
+        #skip leads that keep failing, backing off exponentially
+        if 'lead_backoff' in kwargs:
+            if not isinstance(kwargs.get('lead_backoff'), int):
+                raise TypeError("lead_backoff must be integer")
+        if 'lead_max_backoff' in kwargs:
+            if not isinstance(kwargs.get('lead_max_backoff'), int):
+                raise TypeError("lead_max_backoff must be integer")
+        self.lead_breaker = LeadBreaker(
+            leads=self.leads,
+            base_backoff=kwargs.get('lead_backoff', 60),
+            max_backoff=kwargs.get('lead_max_backoff', 3600)
+        )
+
+        #request timeouts derived from latencies seen in previous runs
+        if 'timeout_floor' in kwargs:
+            if not isinstance(kwargs.get('timeout_floor'), (int, float)):
+                raise TypeError("timeout_floor must be a number")
+        if 'timeout_ceiling' in kwargs:
+            if not isinstance(kwargs.get('timeout_ceiling'), (int, float)):
+                raise TypeError("timeout_ceiling must be a number")
+        self.lead_latency = LeadLatency(
+            floor=kwargs.get('timeout_floor', 5),
+            ceiling=kwargs.get('timeout_ceiling', 300),
+            data=self.tracker_file_json.get('latency', {})
+        )
+
+        #tasks pscheduler refused recently are not posted again until their backoff is over
+        if 'post_failure_backoff' in kwargs:
+            if not isinstance(kwargs.get('post_failure_backoff'), int):
+                raise TypeError("post_failure_backoff must be integer")
+        if 'post_failure_max_backoff' in kwargs:
+            if not isinstance(kwargs.get('post_failure_max_backoff'), int):
+                raise TypeError("post_failure_max_backoff must be integer")
+        if 'post_failure_permanent_backoff' in kwargs:
+            if not isinstance(kwargs.get('post_failure_permanent_backoff'), int):
+                raise TypeError("post_failure_permanent_backoff must be integer")
+        self.post_failures = PostFailureCache(
+            base_backoff=kwargs.get('post_failure_backoff', 300),
+            max_backoff=kwargs.get('post_failure_max_backoff', 21600),
+            permanent_backoff=kwargs.get('post_failure_permanent_backoff', 86400),
+            data=self.tracker_file_json.get('post_failures', {})
+        )
+        self.blocked_tasks = []
+
+        #time allowed for creating tasks in commit, the least urgent are deferred when it runs out
+        if 'commit_budget' in kwargs and kwargs.get('commit_budget') is not None:
+            if not isinstance(kwargs.get('commit_budget'), (int, float)):
+                raise TypeError("commit_budget must be a number")
+        self.commit_budget = kwargs.get('commit_budget')
+        self.deferred_tasks = []
+        self._previously_deferred = self.tracker_file_json.get('deferred', {})
+        if not isinstance(self._previously_deferred, dict):
+            self._previously_deferred = {}
+        self._commit_deadline = None
+        #sort key of each new task by checksum, lower is more urgent
+        self._urgency = {}
+
+        #limit the rate of requests to each lead so big changes don't overload pscheduler.
+        #Unlimited unless rates are given, since limits slow down every commit.
+        for rate_kwarg in ['list_rate', 'lead_rate', 'mutate_rate']:
+            if rate_kwarg in kwargs and kwargs.get(rate_kwarg) is not None:
+                if not isinstance(kwargs.get(rate_kwarg), (int, float)):
+                    raise TypeError("{} must be a number".format(rate_kwarg))
+        if 'rate_burst' in kwargs:
+            if not isinstance(kwargs.get('rate_burst'), int):
+                raise TypeError("rate_burst must be integer")
+        self.rate_limiter = LeadRateLimiter(
+            list_rate=kwargs.get('list_rate'),
+            lead_rate=kwargs.get('lead_rate'),
+            mutate_rate=kwargs.get('mutate_rate'),
+            burst=kwargs.get('rate_burst', 10)
+        )
+
+        #renew tasks ahead of time one slice per run, slices taking turns across runs
+        if 'renewal_slices' in kwargs:
+            if not isinstance(kwargs.get('renewal_slices'), int):
+                raise TypeError("renewal_slices must be integer")
+        self.renewal_slices = max(1, kwargs.get('renewal_slices', 1))
+        renewal_slice = self.tracker_file_json.get('renewal_slice', 0)
+        if not isinstance(renewal_slice, int):
+            renewal_slice = 0
+        self.renewal_slice = renewal_slice % self.renewal_slices
+        #time until the next run
+        self._run_interval = max(0, self.old_task_deadline - int(time.time()))
+
         #get list of existing MAs
         self.existing_archives = self.tracker_file_json.get('archives', {})
+
+        #get cached lead lookups, used by every task this manager creates or deletes
+        if 'lead_cache_ttl' in kwargs:
+            if not isinstance(kwargs.get('lead_cache_ttl'), int):
+                raise TypeError("lead_cache_ttl must be integer")
+        if 'lead_cache_size' in kwargs:
+            if not isinstance(kwargs.get('lead_cache_size'), int):
+                raise TypeError("lead_cache_size must be integer")
+        self.lead_cache = LeadCache(
+            ttl=kwargs.get('lead_cache_ttl', 3600),
+            max_size=kwargs.get('lead_cache_size', 10000),
+            data=self.tracker_file_json.get('lead_cache', {})
+        )
         
         self.logger = kwargs.get('logger', logging.getLogger(__name__))
         self.logf = kwargs.get('logf', LoggingUtils())
@@ -94,79 +263,290 @@ class TaskManager(object):
         # but may want to remove this to ease confusion in future.
         lead_address_map = kwargs.get('lead_address_map')
 
-        visited_leads = {}
+        self._list_leads(bind_map, lead_address_map)
+
+
+    def _list_leads(self, bind_map, lead_address_map):
+        ##
+        # Fetches existing tasks from every lead in the tracker file. Leads are queried
+        # in parallel by a bounded pool of workers, each lead getting at most lead_deadline
+        # seconds from when it is contacted. Results are merged in tracker file order so de-duplication by hostname
+        # is the same as if leads had been visited one at a time. Leads in quarantine are
+        # skipped and kept in the tracker file so their backoff carries over. Leads that
+        # could not be listed are held for the rest of the run, since tasks they already
+        # have would otherwise be created again.
+        use_asyncio = self.use_asyncio
+        if use_asyncio and async_transport.aiohttp is None:
+            self.log_warn("aiohttp is not installed, listing leads with threads instead of asyncio")
+            use_asyncio = False
+        psc_clients = {}
         for psc_url in self.leads:
-            log_ctx = {'url': psc_url}
-            self.log_info("Getting task list from {}".format(psc_url), log_ctx)
-            #Query lead
-            psc_lead = self.leads[psc_url] 
-            existing_task_map = {}
+            if not self.lead_breaker.allow(psc_url):
+                self.log_info(self.lead_breaker.skip_message(psc_url), {'url': psc_url})
+                self.leads_to_keep[psc_url] = True
+                self.lead_breaker.hold(psc_url)
+                continue
+            self.log_info("Getting task list from {}".format(psc_url), {'url': psc_url})
             psc_filters = ApiFilters()
             psc_filters.detail_enabled(True)
             psc_filters.reference_param(self.reference_label, {'created-by': self.created_by})
-            psc_client = ApiConnect(url=psc_url, filters=psc_filters,
-                                    bind_map=bind_map, lead_address_map=lead_address_map)
-            
-            #get hostname to see if this is a server we already visited using a different address
-            psc_hostname = psc_client.get_hostname()
-            if psc_client.error:
-                self.log_error("Error getting hostname from {}: ".format(psc_url) + str(psc_client.error), log_ctx)
-                psc_lead['error_time'] = int(time.time())
-                self.errors.append("Problem retrieving host information from pScheduler lead {}: {}".format(psc_url, psc_client.error))
-                continue
+            #no point waiting on a single request longer than the whole lead is allowed
+            psc_filters.timeout = self.lead_latency.timeout(psc_url, 'hostname', min(psc_filters.timeout, self.lead_deadline))
+            #a lead coming out of quarantine has to really be asked
+            capability_cache = None if self.lead_breaker.probing(psc_url) else self.capability_cache
+            #asyncio clients get their transport once the event loop is running
+            client_class = AsyncApiConnect if use_asyncio else ApiConnect
+            psc_clients[psc_url] = client_class(url=psc_url, filters=psc_filters,
+                                    bind_map=bind_map, lead_address_map=lead_address_map,
+                                    transport=None if use_asyncio else self.transport, capability_cache=capability_cache)
+
+        #get hostname to see if this is a server we already visited using a different address
+        if use_asyncio:
+            hostnames = asyncio.run(self._run_async_lead_workers(self._fetch_lead_hostname_async, psc_clients))
+        else:
+            hostnames = self._run_lead_workers(self._fetch_lead_hostname, psc_clients)
+        visited_leads = {}
+        unique_clients = {}
+        #other urls of each visited server, their breakers go with the listing of the server
+        aliases = {}
+        for psc_url in psc_clients:
+            log_ctx = {'url': psc_url}
+            psc_hostname, error = hostnames[psc_url]
+            if error:
+                self.log_error("Error getting hostname from {}: ".format(psc_url) + str(error), log_ctx)
+                self.lead_breaker.failure(psc_url)
+                self.lead_breaker.hold(psc_url)
+                self.errors.append("Problem retrieving host information from pScheduler lead {}: {}".format(psc_url, error))
             elif not psc_hostname:
                 self.log_error("Error: {} returned an empty hostname".format(psc_url), log_ctx )
-                psc_lead['error_time'] = int(time.time())
+                self.lead_breaker.failure(psc_url)
+                self.lead_breaker.hold(psc_url)
                 self.errors.append("Empty string returned from {}/hostname. It may not have its hostname configured correctly.".format(psc_url))
-                continue
             elif visited_leads.get(psc_hostname):
                 self.log_debug("Already visited server at {} using ".format(psc_url) + str(visited_leads.get(psc_hostname)) + ", so skipping.", log_ctx)
-                continue
+                aliases[visited_leads[psc_hostname]].append(psc_url)
             else:
                 visited_leads[psc_hostname] = psc_url
-
-            #get tasks
-            existing_tasks = psc_client.get_tasks()
-            if existing_tasks and len(existing_tasks) > 0 and psc_client.error:
-                    #there was an error getting an individual task
-                    self.log_error("Error fetching an individual task, but was able to get list: " +  str(psc_client.error), log_ctx)
-            elif psc_client.error:
+                aliases[psc_url] = []
+                unique_clients[psc_url] = psc_clients[psc_url]
+
+        #get tasks
+        #leads known to take a while to list get more time
+        listing_deadlines = {}
+        for psc_url in unique_clients:
+            listing_deadlines[psc_url] = max(self.lead_deadline, self.lead_latency.timeout(psc_url, 'listing', 0))
+        if use_asyncio:
+            task_lists = asyncio.run(self._run_async_lead_workers(self._fetch_lead_tasks_async, unique_clients, listing_deadlines))
+        else:
+            task_lists = self._run_lead_workers(self._fetch_lead_tasks, unique_clients, listing_deadlines)
+        for psc_url in unique_clients:
+            log_ctx = {'url': psc_url}
+            existing_records, error = task_lists[psc_url]
+            if existing_records and error:
+                #there was an error getting an individual task
+                self.log_error("Error fetching an individual task, but was able to get list: " +  str(error), log_ctx)
+            elif error:
                 #there was an error getting the entire list
-                self.log_error("Error getting task list from {}: ".format(psc_url) + str(psc_client.error), log_ctx)
-                psc_lead['error_time'] = int(time.time())
-                self.errors.append("Problem getting existing tests from pScheduler lead {}: {}".format(psc_url, psc_client.error))
+                self.log_error("Error getting task list from {}: ".format(psc_url) + str(error), log_ctx)
+                for lead_url in [psc_url] + aliases[psc_url]:
+                    self.lead_breaker.failure(lead_url)
+                    self.lead_breaker.hold(lead_url)
+                self.errors.append("Problem getting existing tests from pScheduler lead {}: {}".format(psc_url, error))
                 continue
-            #can get rid of this
-            elif len(existing_tasks) == 0:
-                #Todo: Drop this when 4.0 deprecated. fallback in case detail filter not supported (added in 4.0.2).
-                self.log_debug("Trying to get task list without enabled filter", log_ctx)
-                del psc_client.filters.taskfilters['detail'] 
-                existing_tasks = psc_client.get_tasks() 
-                if psc_client.error:
-                    #there was an error getting the entire list
-                    self.log_error("Error getting task list from {}: ".format(psc_url) + str(psc_client.error), log_ctx)
-                    psc_lead['error_time'] = int(time.time())
-                    self.errors.append("Problem getting existing tests from pScheduler lead {}: {}".format(psc_url, psc_client.error))
-                    continue
+            #only a lead that lists its tasks is healthy, answering /hostname is not enough
+            for lead_url in [psc_url] + aliases[psc_url]:
+                self.lead_breaker.success(lead_url)
             
             #add to existing task map
-            for existing_task in existing_tasks:
-                if not existing_task.detail_enabled():  
-                    continue
-                self.log_task(existing_task)
-                
+            for record in existing_records:
                 #make an array since could have more than one test with same checksum 
-                if not self.existing_task_map.get(existing_task.checksum()):
-                    self.existing_task_map[existing_task.checksum()] = {}
+                if not self.existing_task_map.get(record.checksum):
+                    self.existing_task_map[record.checksum] = {}
                 
-                if not self.existing_task_map.get(existing_task.checksum()).get(existing_task.tool()):
-                    self.existing_task_map[existing_task.checksum()][existing_task.tool()] = {}
+                if not self.existing_task_map.get(record.checksum).get(record.tool):
+                    self.existing_task_map[record.checksum][record.tool] = {}
                 
-                self.existing_task_map[existing_task.checksum()][existing_task.tool()][existing_task.uuid] = {
-                    'task': existing_task,
-                    'keep': False
-                }
+                self.existing_task_map[record.checksum][record.tool][record.uuid] = record
 
+    def _run_lead_workers(self, fetch, psc_clients, deadlines=None):
+        ##
+        # Runs fetch(psc_client) for each lead, at most lead_workers at a time. Returns a dict
+        # keyed by lead url of (result, error). Each lead gets its seconds in deadlines
+        # (lead_deadline by default) from when its fetch starts. A lead that runs out of
+        # time gets an error and its slot goes to the next lead, so queued leads are
+        # always contacted. Its request keeps a thread until it times out, so at most
+        # lead_max_stragglers of them are allowed before new leads wait for their threads.
+        results = {}
+        if not psc_clients:
+            return results
+        if deadlines is None:
+            deadlines = {}
+        max_running = max(1, min(self.lead_workers, len(psc_clients)))
+        max_threads = min(max_running + max(0, self.lead_max_stragglers), len(psc_clients))
+
+        executor = ThreadPoolExecutor(max_workers=max_threads)
+        queued = list(psc_clients.items())
+        running = {}
+        stragglers = set()
+        while queued or running:
+            while queued and len(running) < max_running and len(running) + len(stragglers) < max_threads:
+                psc_url, psc_client = queued.pop(0)
+                running[executor.submit(fetch, psc_client)] = (psc_url, time.monotonic() + deadlines.get(psc_url, self.lead_deadline))
+            timeout = None
+            if running:
+                first_expiry = min(expires for psc_url, expires in running.values())
+                timeout = max(0, first_expiry - time.monotonic())
+            done, not_done = concurrent.futures.wait(list(running.keys()) + list(stragglers), timeout=timeout,
+                                                     return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                if future in stragglers:
+                    #thread is free again, the result was already given up on
+                    stragglers.discard(future)
+                    continue
+                psc_url, expires = running.pop(future)
+                if future.exception():
+                    results[psc_url] = (None, future.exception())
+                else:
+                    results[psc_url] = future.result()
+            now = time.monotonic()
+            for future in not_done:
+                if future not in running:
+                    continue
+                psc_url, expires = running[future]
+                if expires <= now:
+                    #don't wait on stragglers, their results are ignored
+                    del running[future]
+                    stragglers.add(future)
+                    results[psc_url] = (None, "Timed out after {} seconds".format(deadlines.get(psc_url, self.lead_deadline)))
+        executor.shutdown(wait=False)
+
+        return results
+
+    async def _run_async_lead_workers(self, fetch, psc_clients, deadlines=None):
+        ##
+        # Same as _run_lead_workers but fetch is a coroutine function and clients are
+        # AsyncApiConnect objects, which share one AsyncHttpTransport for the phase.
+        if deadlines is None:
+            deadlines = {}
+        semaphore = asyncio.Semaphore(max(1, self.lead_workers))
+        transport = async_transport.AsyncHttpTransport()
+
+        async def run(psc_url, psc_client):
+            psc_client.transport = transport
+            async with semaphore:
+                #the deadline starts once the lead has a slot
+                deadline = deadlines.get(psc_url, self.lead_deadline)
+                try:
+                    return await asyncio.wait_for(fetch(psc_client), deadline)
+                except asyncio.TimeoutError:
+                    return None, "Timed out after {} seconds".format(deadline)
+                except Exception as e:
+                    return None, e
+
+        try:
+            results = await asyncio.gather(*[run(psc_url, psc_client) for psc_url, psc_client in psc_clients.items()])
+        finally:
+            await transport.close()
+
+        return dict(zip(psc_clients.keys(), results))
+
+    def _fetch_lead_hostname(self, psc_client):
+        self._throttle(psc_client.url, 'hostname')
+        start = time.monotonic()
+        psc_hostname = psc_client.get_hostname()
+        if not (psc_client.error or psc_client.cache_hit):
+            self.lead_latency.record(psc_client.url, 'hostname', time.monotonic() - start)
+        return psc_hostname, psc_client.error
+
+    async def _fetch_lead_hostname_async(self, psc_client):
+        #rate limits are shared with threads, so wait without blocking the loop
+        await asyncio.to_thread(self._throttle, psc_client.url, 'hostname')
+        start = time.monotonic()
+        psc_hostname = await psc_client.get_hostname()
+        if not (psc_client.error or psc_client.cache_hit):
+            self.lead_latency.record(psc_client.url, 'hostname', time.monotonic() - start)
+        return psc_hostname, psc_client.error
+
+    def _fetch_lead_tasks(self, psc_client):
+        psc_client.filters.timeout = self.lead_latency.timeout(psc_client.url, 'listing', psc_client.filters.timeout)
+        self._throttle(psc_client.url, 'listing')
+        start = time.monotonic()
+        existing_records = self._fetch_lead_records(psc_client)
+        if not psc_client.error:
+            self.lead_latency.record(psc_client.url, 'listing', time.monotonic() - start)
+        if psc_client.error or existing_records is None:
+            return existing_records, psc_client.error
+        #can get rid of this
+        elif len(existing_records) == 0:
+            #Todo: Drop this when 4.0 deprecated. fallback in case detail filter not supported (added in 4.0.2).
+            self.log_debug("Trying to get task list without enabled filter", {'url': psc_client.url})
+            del psc_client.filters.task_filters['detail']
+            self._throttle(psc_client.url, 'listing')
+            existing_records = self._fetch_lead_records(psc_client)
+        return existing_records, psc_client.error
+
+    async def _fetch_lead_tasks_async(self, psc_client):
+        psc_client.filters.timeout = self.lead_latency.timeout(psc_client.url, 'listing', psc_client.filters.timeout)
+        await asyncio.to_thread(self._throttle, psc_client.url, 'listing')
+        start = time.monotonic()
+        existing_records = await self._fetch_lead_records_async(psc_client)
+        if not psc_client.error:
+            self.lead_latency.record(psc_client.url, 'listing', time.monotonic() - start)
+        if psc_client.error or existing_records is None:
+            return existing_records, psc_client.error
+        elif len(existing_records) == 0:
+            #Todo: Drop this when 4.0 deprecated. fallback in case detail filter not supported (added in 4.0.2).
+            self.log_debug("Trying to get task list without enabled filter", {'url': psc_client.url})
+            del psc_client.filters.task_filters['detail']
+            await asyncio.to_thread(self._throttle, psc_client.url, 'listing')
+            existing_records = await self._fetch_lead_records_async(psc_client)
+        return existing_records, psc_client.error
+
+    async def _fetch_lead_records_async(self, psc_client):
+        #same as _fetch_lead_records with the asyncio client
+        if self.stream_tasks:
+            existing_records = []
+            async for existing_task in psc_client.iter_tasks():
+                self._add_task_record(existing_records, existing_task)
+            if psc_client.listing_failed:
+                #a truncated list would make every task missing from it look deleted
+                return
+            return existing_records
+        existing_tasks = await psc_client.get_tasks()
+        if existing_tasks is None:
+            return
+        return self._task_records(existing_tasks)
+
+    def _fetch_lead_records(self, psc_client):
+        ##
+        # Returns a compact record for each enabled task on the lead. Tasks are logged and
+        # converted as they are read, so only the records are kept in memory when streaming.
+        # Returns None if the list could not be read in full.
+        if self.stream_tasks:
+            existing_records = self._task_records(psc_client.iter_tasks())
+            if psc_client.listing_failed:
+                #a truncated list would make every task missing from it look deleted
+                return
+            return existing_records
+        existing_tasks = psc_client.get_tasks()
+        if existing_tasks is None:
+            return
+        return self._task_records(existing_tasks)
+
+    def _task_records(self, existing_tasks):
+        existing_records = []
+        for existing_task in existing_tasks:
+            self._add_task_record(existing_records, existing_task)
+        return existing_records
+
+    def _add_task_record(self, existing_records, existing_task):
+        if not existing_task.detail_enabled():  
+            return
+        self.log_task(existing_task)
+        record = TaskRecord.from_task(existing_task)
+        #tasks listed with asyncio are deleted later with the shared transport
+        record.transport = self.transport
+        existing_records.append(record)
 
     def add_task(self, **kwargs):
         self.logf.global_context = {"action" : "add_to_manager"}
@@ -198,12 +578,32 @@ class TaskManager(object):
         
         new_task.reference_param(self.reference_label, {'created-by': tmp_created_by})
 
+        #share connection pools and lead lookups with the rest of the run
+        new_task.transport = self.transport
+        new_task.lead_cache = self.lead_cache
+        new_task.lead_throttle = self._throttle_lead_lookup
+
         #determine if we need new task and create
         need_new_task, new_task_start = self._need_new_task(new_task)
         if need_new_task:
             self.duplicate_new_task_map[new_task.checksum()] = True
+            #don't keep posting a task pscheduler keeps refusing
+            failure = self.post_failures.blocked(new_task.checksum())
+            if failure:
+                self.blocked_tasks.append(new_task)
+                self.log_debug("Not creating task {} that failed {} time(s), next attempt in {} seconds: {}".format(
+                    new_task.to_str(), failure['failures'], max(0, int(failure['retry_time'] - time.time())), failure['error']),
+                    {'checksum': new_task.checksum()})
+                return
             #task does not exist, we need to create it
-            new_task.schedule_start(self._ts_to_iso(new_task_start))
+            #nothing to take over from, so spread start times of repeating tasks over up to one interval
+            start_jitter = 0
+            if not new_task_start and repeat_seconds:
+                start_jitter = self._renewal_jitter(new_task.checksum(), 'start', min(self.renewal_window, int(repeat_seconds)))
+            if start_jitter:
+                new_task.schedule_start(self._ts_to_iso(int(time.time()) + start_jitter))
+            else:
+                new_task.schedule_start(self._ts_to_iso(new_task_start))
             #set end time to greater of min repeats and expiration time
             min_repeat_time = 0
             if repeat_seconds:
@@ -224,16 +624,37 @@ class TaskManager(object):
             else:
                 #just add the minimum ttl
                 new_until += self.new_task_min_ttl
+            #so tasks created together don't all expire and need renewing together
+            new_until += self._renewal_jitter(new_task.checksum(), 'ttl')
             
             new_task.schedule_until(self._ts_to_iso(new_until))
             self.new_tasks.append(new_task)
-    
+            self._urgency[new_task.checksum()] = self._task_urgency(new_task, new_task_start)
 
-    def commit(self):
+    def _task_urgency(self, new_task, new_task_start):
+        ##
+        # Returns the sort key used to order creations. Tasks with nothing running for them
+        # (no start time) come first, then the ones whose existing task ends soonest. Ties
+        # go to the task that has been deferred the most runs.
+        deferred = self._previously_deferred.get(new_task.checksum(), {})
+        return (new_task_start or 0, -deferred.get('runs', 0))
+    
 
+    def commit(self, budget=None):
+        '''
+        Deletes and creates tasks on pScheduler. If budget (or commit_budget) is given, tasks
+        are created most urgent first and those not started within budget seconds of the
+        start of the commit are deferred to the next run.
+        '''
         self.errors = []
+        if budget is None:
+            budget = self.commit_budget
+        self._commit_deadline = None if budget is None else time.monotonic() + budget
         self._delete_tasks()
         self._create_tasks()
+        self._log_skipped_leads()
+        self._log_blocked_tasks()
+        self._log_deferred_tasks()
         self._cleanup_leads()
         self._write_tracker_file()
 
@@ -241,15 +662,66 @@ class TaskManager(object):
     def check_assist_server(self):
         self.logf.global_context = {"action" : "check_assist_server", "url" :  self.pscheduler_url}
 
-        psc_client = ApiConnect(url=self.pscheduler_url)
-        psc_client.get_test_urls()
-        if psc_client.error:
+        psc_client = ApiConnect(url=self.pscheduler_url, transport=self.transport)
+        if not psc_client.ping():
             self.log_error("Error checking assist server: " + str(psc_client.error))
             return False
         else:
             return True
 
 
+    def transport_stats(self):
+        '''Returns connection pool hit/miss statistics of the shared transport'''
+        return self.transport.stats()
+
+
+    def lead_cache_stats(self):
+        '''Returns hit/miss statistics of the lead lookup cache'''
+        return self.lead_cache.stats()
+
+
+    def skipped_leads(self):
+        '''Returns a dict of lead url to seconds of quarantine left for leads skipped this run'''
+        return self.lead_breaker.skipped()
+
+    def rate_limit_stats(self):
+        '''Returns the number of requests delayed by rate limits and the seconds spent waiting'''
+        return self.rate_limiter.stats()
+
+    def latency_stats(self):
+        '''Returns request latency percentiles and the resulting timeouts for each lead'''
+        return self.lead_latency.stats()
+
+    def post_failure_stats(self):
+        '''Returns the number of tasks in the post failure cache and how many were skipped this run'''
+        entries = self.post_failures.entries()
+        return {
+            'entries': len(entries),
+            'permanent': len([e for e in entries.values() if e.get('permanent')]),
+            'skipped': len(self.blocked_tasks)
+        }
+
+    def _log_blocked_tasks(self):
+        if self.blocked_tasks:
+            self.log_warn("Skipped creating {} task(s) that failed recently. Run 'psconfig pscheduler-failed-tasks' for details.".format(
+                len(self.blocked_tasks)))
+
+    def _log_deferred_tasks(self):
+        held = len([t for t in self.deferred_tasks if self.lead_breaker.held(t.url)])
+        if held:
+            self.log_warn("Deferred {} task(s) to the next run since their leads could not be listed".format(held))
+        if len(self.deferred_tasks) > held:
+            self.log_warn("Ran out of time creating tasks, deferred {} task(s) to the next run".format(len(self.deferred_tasks) - held))
+
+    def _log_skipped_leads(self):
+        for lead_url, remaining in self.skipped_leads().items():
+            if not remaining:
+                self.log_warn("Skipped requests to lead {} since its tasks could not be listed this run".format(lead_url), {'url': lead_url})
+                continue
+            self.log_warn("Skipped requests to lead {} which is in quarantine for another {} seconds after {} consecutive failures".format(
+                lead_url, remaining, self.leads.get(lead_url, {}).get('failures', 0)), {'url': lead_url})
+
+
     def _delete_tasks(self):
         self.logf.global_context = {"action" : "delete"}
 
@@ -260,7 +732,7 @@ class TaskManager(object):
         self.deleted_tasks = []
 
         self.log_info("Deleting tasks")
-        found_task_to_delete = False
+        tasks_to_delete = []
         
         for checksum in self.existing_task_map:
             cmap = self.existing_task_map[checksum]
@@ -270,15 +742,21 @@ class TaskManager(object):
 
                 for uuid in tmap:
                     #prep task
-                    meta_task = tmap[uuid]
-                    task = meta_task['task']
+                    record = tmap[uuid]
                     #optimization so don't lookup lead for same params
                     if cached_lead:
+                        if record.keep:
+                            #no need to build the task, just make sure we keep the lead around
+                            self.leads_to_keep[cached_lead] = True
+                            continue
+                        task = record.task()
                         task.url = cached_lead
                         if cached_bind:
                             task.bind_address = cached_bind 
                     else:
-                        cached_lead = task.refresh_lead()
+                        task = record.task()
+                        task.lead_cache = self.lead_cache
+                        cached_lead = self._refresh_lead(task)
                         cached_bind = task.bind_address 
                     
                     if task.error:
@@ -290,24 +768,26 @@ class TaskManager(object):
                         continue
 
                     #if we keep, make sure we track lead, otherwise delete
-                    if meta_task.get('keep'):
+                    if record.keep:
                         #make sure we keep the lead around
                         self.leads_to_keep[task.url] = True
                     else:
-                        self.log_task(task)
-                        found_task_to_delete = True
-                        task.delete_task()
-                        if task.error:
-                            self.leads_to_keep[task.url] = True
-                            self._update_lead(task.url, {'error_time': int(time.time())})
-                            err = "Problem deleting test {}, continuing with rest of config: {}".format(task.to_str(), task.error)
-                            self.log_error(err)
-                            self.errors.append(err)
-                        else:
-                            self.deleted_tasks.append(task)
+                        tasks_to_delete.append(task)
                     
-        if not found_task_to_delete:
+        if not tasks_to_delete:
             self.log_info("No tasks marked for deletion")
+
+        #send deletes in parallel, then record results in the order tasks were found
+        for task in self._run_commit_workers(self._delete_task_worker, tasks_to_delete):
+            self.log_task(task)
+            if task.error:
+                self.leads_to_keep[task.url] = True
+                self._update_lead(task.url, {'error_time': int(time.time())})
+                err = "Problem deleting test {}, continuing with rest of config: {}".format(task.to_str(), task.error)
+                self.log_error(err)
+                self.errors.append(err)
+            else:
+                self.deleted_tasks.append(task)
         
         self.log_info("Done deleting tasks")
 
@@ -319,7 +799,7 @@ class TaskManager(object):
         #checksum will be wrong. If we don't specify then don't worry about it as its a
         #perfomance hit
         if new_task.needs_bind_addresses():
-            new_task.refresh_lead() 
+            self._refresh_lead(new_task)
 
         #calculate the checksum once
         new_task_checksum = new_task.checksum()
@@ -334,12 +814,11 @@ class TaskManager(object):
         #Note: Don't worry about removed archives since task checksum has that covered
         ma_changed = False  
         for archive in new_task.archives():
-            opaque_new_checksum = archive.checksum()
+            opaque_new_checksum, new_checksum = archive.checksums()
             #Key combines task and archive checksum since multiple tasks may have archive sthat only differ between opaque parts
             #Likewise, within a task we may have archives that only differ by private fields
             archive_key = new_task_checksum + '__' + opaque_new_checksum
             old_checksum = self.existing_archives.get(archive_key)
-            new_checksum = archive.checksum(include_private=True)
             if not self.new_archives.get(archive_key):
                 self.new_archives[archive_key] = {}
             self.new_archives[archive_key][new_checksum] = True
@@ -374,22 +853,19 @@ class TaskManager(object):
 
         for uuid in tmap:
             old_task = tmap[uuid]
-            old_task['keep'] = True 
-            until_ts = self._iso_to_ts(old_task['task'].schedule_until())
+            old_task.keep = True 
+            until_ts = old_task.until_ts
 
             if need_new_task:
 
                 #if detail has start use that, otherwise use added time
-                if old_task['task'].detail_start():
-                    old_task_start_iso = old_task['task'].detail_start()
-                else:
-                    old_task_start_iso = old_task['task'].detail_added()
-                old_task_start_ts = self._iso_to_ts(old_task_start_iso)
+                old_task_start_iso = old_task.start_iso
+                old_task_start_ts = old_task.start_ts
 
-                if ((not old_task['task'].detail_exclusive()) #not exclusive
-                    and old_task['task'].detail_multiresult() #is multi-result
+                if ((not old_task.exclusive) #not exclusive
+                    and old_task.multiresult #is multi-result
                     and (old_task_start_ts + 15*60) < int(time.time()) #started at least 15 min ago
-                    and (old_task['task'].detail_runs_started() is not None and (old_task['task'].detail_runs_started()== 0)) #no runs started
+                    and (old_task.runs_started is not None and (old_task.runs_started == 0)) #no runs started
                    ):
 
                         #if background-multi, one or less runs and start time is 15 minutes (arbitrary)
@@ -398,9 +874,9 @@ class TaskManager(object):
                         
                         self.log_info("Stuck background-multi task found (start={}: {}, runs=1). Will cancel and recreate.".format(old_task_start_iso, uuid))
                         
-                        old_task['keep'] = False
+                        old_task.keep = False
                         new_start_time = int(time.time())
-                elif ((not until_ts) or (until_ts > (self.old_task_deadline + (self.new_task_min_ttl * self.task_renewal_fudge_factor)))):
+                elif ((not until_ts) or (until_ts > self._renewal_threshold(old_task.checksum))):
                     #if old task has no end time or will not expire before deadline, no task needed
                     need_new_task = False
                     #continue with loop since need to mark other tasks that might be older as keep
@@ -411,6 +887,42 @@ class TaskManager(object):
         return need_new_task, new_start_time
 
     
+    def _renewal_threshold(self, checksum):
+        ##
+        # Returns the time a task with checksum has to expire by to be renewed this run.
+        # Normally that is any task expiring within the fudge factor of the minimum TTL after
+        # the next run. With rolling renewal only the slice whose turn it is gets renewed
+        # ahead of time, far enough ahead to last until its next turn. Tasks in other slices
+        # are only renewed if they would lapse before the run after next.
+        threshold = self.old_task_deadline + (self.new_task_min_ttl * self.task_renewal_fudge_factor) + self._renewal_jitter(checksum, 'renew')
+        if self.renewal_slices > 1:
+            if self._renewal_slice_of(checksum) == self.renewal_slice:
+                threshold += (self.renewal_slices - 1) * self._run_interval
+            else:
+                threshold = min(threshold, self.old_task_deadline + self._run_interval)
+        return threshold
+
+    def _renewal_slice_of(self, checksum):
+        return self._checksum_hash(checksum, 'slice') % self.renewal_slices
+
+    def _checksum_hash(self, checksum, kind):
+        ##
+        # Returns a 32-bit number that is always the same for a task checksum and kind
+        return int.from_bytes(md5("{}:{}".format(kind, checksum).encode('utf-8')).digest()[:4], 'big')
+
+    def _renewal_jitter(self, checksum, kind, window=None):
+        ##
+        # Returns a number of seconds between 0 and window (renewal_window by default) that
+        # is always the same for a task checksum and kind of jitter. Kinds are start (delay
+        # of a task's first run), ttl (extra time before it expires) and renew (how much
+        # earlier than usual it is renewed). Renewing early spreads out tasks that already
+        # expire together, the other two keep new tasks from doing so.
+        if window is None:
+            window = self.renewal_window
+        if not (window and checksum):
+            return 0
+        return int(window * self._checksum_hash(checksum, kind) / 2**32)
+
     def _create_tasks(self):
         self.logf.global_context = {"action" : "create"}
 
@@ -422,38 +934,171 @@ class TaskManager(object):
         if not self.new_tasks:
             self.log_info("No tasks to create")
         
-        for new_task in self.new_tasks:
-            #determine lead - do here as optimization so we only do it for tests that need to be added
-            new_task.refresh_lead()
-            if new_task.error:
+        #most urgent first so those are the ones done if time runs out
+        self.deferred_tasks = []
+        new_tasks = self.new_tasks
+        if self._commit_deadline is not None:
+            new_tasks = sorted(new_tasks, key=lambda t: self._urgency.get(t.checksum(), (0, 0)))
+
+        #lookup leads and post tasks in parallel, then record results in urgency order
+        for new_task, found_lead in self._run_commit_workers(self._create_task_worker, new_tasks):
+            if found_lead is None:
+                self.deferred_tasks.append(new_task)
+                if self.lead_breaker.held(new_task.url):
+                    self.log_debug("Deferred creating task {} to the next run since the tasks of {} could not be listed".format(
+                        new_task.to_str(), new_task.url), {'checksum': new_task.checksum()})
+                else:
+                    self.log_debug("Deferred creating task {} to the next run".format(new_task.to_str()), {'checksum': new_task.checksum()})
+                continue
+            if not found_lead:
                 err = "Problem determining which pscheduler to submit test to for creation, skipping test {}: {}".format(new_task.to_str(), new_task.error)
                 self.log_error(err)
 
                 self.errors.append(err)
+                self._post_failure(new_task)
                 continue
             
 
             self.leads_to_keep[new_task.url] = True
             self.log_task(new_task)
 
-            new_task.post_task()
-
             if new_task.error:
                 err = "Problem adding test {}, continuing with rest of config: {}".format(new_task.to_str(), new_task.error)
                 self.log_error(err)
 
                 self.errors.append(err)
+                self._post_failure(new_task)
             else:
                 self.added_tasks.append(new_task)
+                self.post_failures.success(new_task.checksum())
                 self._update_lead(new_task.url, {'success_time': int(time.time())})
         
         self.log_info("Done creating tasks")
 
 
+    def _post_failure(self, task):
+        ##
+        # Records a task that pscheduler refused in the post failure cache. Connection
+        # problems are left to the lead breaker since they say nothing about the task.
+        if task.http_status is None:
+            return
+        failure = self.post_failures.failure(task.checksum(), http_status=task.http_status,
+                                             error=task.error, task=task.to_str())
+        if failure['permanent']:
+            self.log_warn("Task {} was rejected with HTTP status {}, not trying it again for {} seconds unless it changes".format(
+                task.to_str(), task.http_status, self.post_failures.permanent_backoff), {'checksum': task.checksum()})
+
+    def _run_commit_workers(self, worker, tasks):
+        ##
+        # Runs worker(task) for each task using a pool of commit_workers threads and returns
+        # the results in the original task order once all have finished. Workers only talk to
+        # pScheduler and set task fields, all bookkeeping is left to the caller.
+        if not tasks:
+            return []
+        with ThreadPoolExecutor(max_workers=max(1, min(self.commit_workers, len(tasks)))) as executor:
+            return list(executor.map(worker, tasks))
+
+    def _lead_semaphore(self, url):
+        ##
+        # Returns the semaphore limiting the number of requests in flight to a single lead
+        with self._lead_semaphores_lock:
+            semaphore = self._lead_semaphores.get(url)
+            if semaphore is None:
+                semaphore = threading.BoundedSemaphore(max(1, self.lead_max_in_flight))
+                self._lead_semaphores[url] = semaphore
+        return semaphore
+
+    def _delete_task_worker(self, task):
+        self._call_lead(task, task.delete_task, 'delete')
+        return task
+
+    def _create_task_worker(self, new_task):
+        ##
+        # Returns the task and whether its lead could be determined, or None if the commit
+        # ran out of time before the task was started or its lead could not be listed
+        if self._commit_deadline is not None and time.monotonic() >= self._commit_deadline:
+            return new_task, None
+        #determine lead - do here as optimization so we only do it for tests that need to be added
+        self._refresh_lead(new_task)
+        if self.lead_breaker.held(new_task.url):
+            #the task may already exist on a lead we could not list
+            return new_task, None
+        if new_task.error:
+            return new_task, False
+        self._call_lead(new_task, new_task.post_task, 'post')
+        return new_task, True
+
+    def _refresh_lead(self, task):
+        return self._call_lead(task, task.refresh_lead, 'participants')
+
+    def _call_lead(self, task, call, endpoint):
+        ##
+        # Runs call() against the lead at task.url unless the lead is in quarantine, in which
+        # case task.error is set instead. Only connection problems (errors that are exceptions
+        # rather than error responses) count as failures of the lead. The timeout comes from
+        # latencies of the same kind of request to the lead.
+        url = task.url
+        if not self.lead_breaker.allow(url):
+            task.error = self.lead_breaker.skip_message(url)
+            return
+        #filters may be shared with other tasks from the same lead, so don't change them in place
+        task.filters = copy.copy(task.filters)
+        task.filters.timeout = self.lead_latency.timeout(url, endpoint, task.filters.timeout)
+        #wait for the rate limit before taking one of the lead's in flight slots. Lead
+        #lookups wait inside the call instead, and only if not answered from the lead cache.
+        if endpoint == 'participants':
+            task.lead_throttle = self._throttle_lead_lookup
+        else:
+            self._throttle(url, endpoint)
+        with self._lead_semaphore(url):
+            start = time.monotonic()
+            result = call()
+            elapsed = time.monotonic() - start
+        if isinstance(task.error, Exception):
+            self.lead_breaker.failure(url)
+        elif endpoint == 'participants' and task.cache_hit:
+            #the lead was never asked, so this says nothing about its health or latency
+            self.lead_breaker.release(url)
+        else:
+            self.lead_breaker.success(url)
+            self.lead_latency.record(url, endpoint, elapsed)
+        return result
+
+
+    def _throttle(self, url, endpoint):
+        ##
+        # Waits until the rate limit of the lead at url allows another request of this kind
+        return self.rate_limiter.acquire(url, ENDPOINT_RATE_CLASSES[endpoint])
+
+    def _throttle_lead_lookup(self, url):
+        return self._throttle(url, 'participants')
+
+
+    def _deferred_json(self):
+        ##
+        # Returns tasks deferred this run for the tracker file with the time they were
+        # first deferred and the number of runs in a row they have been
+        now = int(time.time())
+        deferred = {}
+        for task in self.deferred_tasks:
+            previous = self._previously_deferred.get(task.checksum(), {})
+            deferred[task.checksum()] = {
+                'task': task.to_str(),
+                'since': previous.get('since', now),
+                'runs': previous.get('runs', 0) + 1
+            }
+        return deferred
+
     def _write_tracker_file(self):
         content = {
             'leads': self.leads,
-            'archives': self.new_archives
+            'archives': self.new_archives,
+            'lead_cache': self.lead_cache.to_json(),
+            'post_failures': self.post_failures.to_json(),
+            'deferred': self._deferred_json(),
+            'renewal_slice': (self.renewal_slice + 1) % self.renewal_slices,
+            #the local pscheduler is listed every run even if it has no tasks
+            'latency': self.lead_latency.to_json(set(self.leads) | {self.pscheduler_url})
         }
 
         try:
@@ -467,6 +1112,9 @@ class TaskManager(object):
         #clean out leads that we don't need anymore
         del_lead_urls = []
         for lead_url in self.leads:
+            #keep leads in quarantine so the backoff is not forgotten
+            if self.leads[lead_url].get('quarantine_until'):
+                continue
             if not self.leads_to_keep.get(lead_url):
                 del_lead_urls.append(lead_url)
         
@@ -527,11 +1175,7 @@ class TaskManager(object):
 
 
     def _iso_to_ts(self, iso_str):
-        if not iso_str:
-            return
-
-        #ensure no microseconds for strptime to work
-        return isodate.parse_datetime(iso_str).timestamp()
+        return iso_to_ts(iso_str)
 
     def _ts_to_iso(self, ts):
         if not ts:
@@ -0,0 +1,77 @@
+'''
+Compact record of a task that already exists on a pScheduler lead
+'''
+
+import json
+
+from .task import Task
+from ..utils import iso_to_ts
+
+
+class TaskRecord(object):
+    '''
+    Keeps only what TaskManager needs to decide whether an existing task should be kept,
+    with timestamps already converted to epoch seconds. The rest of the task, minus the
+    detail object, is held as a JSON string so a Task can be rebuilt if it needs to be
+    deleted or logged.
+    '''
+
+    __slots__ = (
+        'uuid', 'url', 'checksum', 'tool', 'keep',
+        'until_ts', 'start_ts', 'start_iso', 'exclusive', 'multiresult', 'runs_started',
+        'filters', 'bind_map', 'lead_address_map', 'transport', '_data_json'
+    )
+
+    def __init__(self, **kwargs):
+        self.uuid = kwargs.get('uuid')
+        self.url = kwargs.get('url')
+        self.checksum = kwargs.get('checksum')
+        self.tool = kwargs.get('tool')
+        self.keep = kwargs.get('keep', False)
+        self.until_ts = kwargs.get('until_ts')
+        self.start_ts = kwargs.get('start_ts')
+        self.start_iso = kwargs.get('start_iso')
+        self.exclusive = kwargs.get('exclusive')
+        self.multiresult = kwargs.get('multiresult')
+        self.runs_started = kwargs.get('runs_started')
+        self.filters = kwargs.get('filters')
+        self.bind_map = kwargs.get('bind_map')
+        self.lead_address_map = kwargs.get('lead_address_map')
+        self.transport = kwargs.get('transport')
+        self._data_json = kwargs.get('data_json', '{}')
+
+    @classmethod
+    def from_task(cls, task):
+        '''Builds a record from a Task returned by ApiConnect.get_tasks'''
+        #if detail has start use that, otherwise use added time
+        start_iso = task.detail_start() if task.detail_start() else task.detail_added()
+        data = {k: v for k, v in task.data.items() if k != 'detail'}
+        return cls(
+            uuid=task.uuid,
+            url=task.url,
+            checksum=task.checksum(),
+            tool=task.tool(),
+            until_ts=iso_to_ts(task.schedule_until()),
+            start_ts=iso_to_ts(start_iso),
+            start_iso=start_iso,
+            exclusive=task.detail_exclusive(),
+            multiresult=task.detail_multiresult(),
+            runs_started=task.detail_runs_started(),
+            filters=task.filters,
+            bind_map=task.bind_map,
+            lead_address_map=task.lead_address_map,
+            transport=task.transport,
+            data_json=json.dumps(data, separators=(',', ':'))
+        )
+
+    def task(self):
+        '''Returns a new Task built from this record. The detail object is not included.'''
+        return Task(
+            data=json.loads(self._data_json),
+            url=self.url,
+            filters=self.filters,
+            uuid=self.uuid,
+            bind_map=self.bind_map,
+            lead_address_map=self.lead_address_map,
+            transport=self.transport
+        )
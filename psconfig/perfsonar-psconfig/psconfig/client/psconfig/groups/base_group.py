@@ -10,6 +10,11 @@ class BaseGroup(BaseMetaNode):
         self.iter = 0
         self._address_queue = []
         self._psconfig = None
+        self._match_addresses = None
+        self._scheduled_by = None
+        self._selectors = None
+        self._selections = None
+        self._selected = None
         
     
     def default_address_label(self, val=None):
@@ -51,8 +56,11 @@ class BaseGroup(BaseMetaNode):
         #override this if group has ways to exclude address selector combinations
         return False
 
-    def start(self, psconfig):
-        '''Initializes variables used to iterate through group'''
+    def start(self, psconfig, match_addresses=None, scheduled_by=None):
+        '''Initializes variables used to iterate through group. match_addresses is an optional
+        dictionary keyed on lowercase addresses and scheduled_by the index of the address that
+        schedules a task. If both are given, groups that support it skip combinations that
+        could never be scheduled by one of those addresses.'''
         #Gets the next group of address selectors
 
         #if already started
@@ -61,12 +69,39 @@ class BaseGroup(BaseMetaNode):
         
         self._reset_iter()
         self._psconfig = psconfig
+        self._match_addresses = match_addresses
+        self._scheduled_by = scheduled_by
         self._start()
+        #resolve selectors unless _start already needed them
+        if self._selectors is None:
+            self._resolve()
         self.started = True
     
     def _start(self):
         #override this if you have local state set to start
         return
+
+    def _resolve(self):
+        ##
+        # Builds each dimension's address selectors and selects their name/label/address
+        # dictionaries once, since neither changes until stop(). Selectors that wrap the same
+        # data, like both dimensions of a mesh, are only built and selected once.
+        self._selectors = []
+        self._selections = []
+        self._selected = {}
+        resolved = {}
+        for dimension in range(self.dimension_count()):
+            selectors = []
+            selections = []
+            for index in range(self.dimension_size(dimension)):
+                addr_sel = self.dimension_step(dimension, index)
+                key = id(addr_sel.data) if addr_sel else None
+                if key not in resolved:
+                    resolved[key] = (addr_sel, addr_sel.select(self._psconfig) if addr_sel else None)
+                selectors.append(resolved[key][0])
+                selections.append(resolved[key][1])
+            self._selectors.append(selectors)
+            self._selections.append(selections)
     
     def next(self):
         '''Grabs the next address combination, or returns empty list if none. Must call start first.'''
@@ -76,43 +111,13 @@ class BaseGroup(BaseMetaNode):
         if not self.started:
             return
 
-        #loop generalized for N dimensions that iterates through each dimension
-        #and grabs next item in series.
         while(not self._address_queue):
-            excluded = True
-            addr_sels =  []
-
-            while excluded:
-                #exit if reached max
-                if self.iter > self.max_iter():
-                    return
-
-                working_size = 1
-                addr_sels = []
-                i = self.dimension_count()
-                while i > 0:
-                    index = None
-                    if i == self.dimension_count():
-                        index = self.iter % self.dimension_size(i-1)
-                    else:
-                        working_size *= self.dimension_size(i)
-                        index = int(self.iter/ (working_size + 0.0))
-
-                    addr_sel = self.dimension_step(i-1, index)
-                    if isinstance(addr_sel, list):
-                        addr_sels = addr_sel + addr_sels #if index is None, addr_sel the entire list.
-                    else:
-                        addr_sels = [addr_sel] + addr_sels
-
-                    i -= 1
-                
-                excluded = self.is_excluded_selectors(addr_sels)
-                self._increment_iter()
-
-            #we now have the selectors. time to expand
-            addr_nlas = []
-            for addr_sel in addr_sels:
-                addr_nlas.append(addr_sel.select(self._psconfig))
+            indices = self._next_indices()
+            if not indices:
+                return
+
+            #we now have the selectors, grab the name, label, addresses resolved in start
+            addr_nlas = [self._selections[dimension][index] for dimension, index in enumerate(indices)]
             
             #we now have the name, label, addresses, time to combine in group specific way
             addr_combos = self.select_addresses(addr_nlas)
@@ -122,6 +127,41 @@ class BaseGroup(BaseMetaNode):
         addresses = self._address_queue.pop(0)
 
         return addresses
+
+    def _next_indices(self):
+        ##
+        # Returns the index in each dimension of the next address selector combination that is
+        # not excluded, or None when done. Override this if a group can enumerate its
+        # combinations more directly.
+
+        #loop generalized for N dimensions that iterates through each dimension
+        #and grabs next item in series.
+        sizes = [len(selectors) for selectors in self._selectors]
+        max_iter = self.max_iter()
+        excluded = True
+        indices = []
+
+        while excluded:
+            #exit if reached max
+            if self.iter > max_iter:
+                return
+
+            working_size = 1
+            indices = []
+            i = len(sizes)
+            while i > 0:
+                if i == len(sizes):
+                    index = self.iter % sizes[i-1]
+                else:
+                    working_size *= sizes[i]
+                    index = int(self.iter/ (working_size + 0.0))
+                indices = [index] + indices
+                i -= 1
+            
+            excluded = self.is_excluded_selectors([self._selectors[dimension][index] for dimension, index in enumerate(indices)])
+            self._increment_iter()
+
+        return indices
         
     def stop(self):
         '''Ends iteration and resets iteration variables'''
@@ -130,6 +170,11 @@ class BaseGroup(BaseMetaNode):
         self._reset_iter()
         self._stop()
         self._psconfig = None
+        self._match_addresses = None
+        self._scheduled_by = None
+        self._selectors = None
+        self._selections = None
+        self._selected = None
     
     def _stop(self):
         #override this if you have a local state to reset
@@ -186,6 +231,22 @@ class BaseGroup(BaseMetaNode):
         #finally, if none of the above work, just use the address obj as is
         return local_addr
     
+    def _select_address(self, addr_nla, remote_addr_key):
+        ##
+        # Same as select_address for a name/label/address dictionary, remembering the result
+        # for the dictionaries resolved in start so each combination is only worked out once
+        if self._selected is None:
+            return self.select_address(addr_nla['address'], addr_nla['label'], remote_addr_key)
+
+        key = (id(addr_nla), remote_addr_key)
+        selected = self._selected.get(key)
+        #hold on to addr_nla so its id isn't reused
+        if selected is None or selected[0] is not addr_nla:
+            selected = (addr_nla, self.select_address(addr_nla['address'], addr_nla['label'], remote_addr_key))
+            self._selected[key] = selected
+
+        return selected[1]
+    
     def merge_parents(self, addr, parents):
         '''Merges inherited values into addresses from parent addresses if any'''
 
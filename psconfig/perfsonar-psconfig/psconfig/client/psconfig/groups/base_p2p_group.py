@@ -7,6 +7,11 @@ class BaseP2PGroup(BaseGroup):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self._exclude_checksum_map =  None
+        self._pair_iter = None
+        self._selector_checksums = None
+        self._selector_ids = None
+        self._excluded_ids = None
+        self._all_columns = None
     
     def dimension_count(self):
         '''Returns 2 since there are two dimensions (src, dst) in point-to-point test'''
@@ -112,16 +117,8 @@ class BaseP2PGroup(BaseGroup):
 
         for a_addr_nla in addr_nlas[0]:
             for b_addr_nla in addr_nlas[1]:
-                a_addr = self.select_address(
-                    a_addr_nla['address'],
-                    a_addr_nla['label'],
-                    b_addr_nla['name']
-                )
-                b_addr = self.select_address(
-                    b_addr_nla['address'],
-                    b_addr_nla['label'],
-                    a_addr_nla['name']
-                )
+                a_addr = self._select_address(a_addr_nla, b_addr_nla['name'])
+                b_addr = self._select_address(b_addr_nla, a_addr_nla['name'])
 
                 a_host = a_addr_nla['address'].host_ref()
                 b_host = b_addr_nla['address'].host_ref()
@@ -132,5 +129,133 @@ class BaseP2PGroup(BaseGroup):
         
         return address_pairs
     
+    def _start(self):
+        ##
+        # Gives every selector an integer id by checksum so pairs can be excluded without
+        # checksumming selectors on every step. Pairs are enumerated by _pairs() on first use.
+        self._resolve()
+        checksum_ids = {}
+        checksum_of = {}
+        self._selector_checksums = []
+        self._selector_ids = []
+        for selectors in self._selectors:
+            checksums = []
+            for addr_sel in selectors:
+                if id(addr_sel) not in checksum_of:
+                    checksum_of[id(addr_sel)] = addr_sel.checksum()
+                checksums.append(checksum_of[id(addr_sel)])
+            self._selector_checksums.append(checksums)
+            self._selector_ids.append([checksum_ids.setdefault(checksum, len(checksum_ids)) for checksum in checksums])
+
+        self._excluded_ids = set()
+        for excl_pair in self.excludes():
+            local_id = checksum_ids.get(excl_pair.local_address().checksum())
+            if local_id is None:
+                continue
+            for target in excl_pair.target_addresses():
+                target_id = checksum_ids.get(target.checksum())
+                if target_id is not None:
+                    self._excluded_ids.add((local_id, target_id))
+
+        self._all_columns = list(range(len(self._selectors[1])))
+        self._pair_iter = None
+
+    def _next_indices(self):
+        if self._pair_iter is None:
+            self._pair_iter = self._pairs()
+
+        for a_index, b_index in self._pair_iter:
+            if not self._is_excluded_pair(a_index, b_index):
+                return [a_index, b_index]
+
+    def _is_excluded_pair(self, a_index, b_index):
+        #same as is_excluded_selectors, using the ids worked out in _start
+        return (self._selector_ids[0][a_index], self._selector_ids[1][b_index]) in self._excluded_ids
+
+    def _pair_columns(self, a_index):
+        ##
+        # Returns the sorted b indices a is paired with. Override this if a group doesn't pair
+        # everything. Must return lists that live until stop() since filtered copies are cached
+        # for each list.
+        return self._all_columns
+
+    def _pairs(self):
+        ##
+        # Yields the (a, b) index pairs in the same order as the generic loop. If given match
+        # addresses and scheduled-by, pairs where the scheduled-by address can't be one of the
+        # match addresses are skipped. A pair is kept if the scheduled-by selector may match,
+        # or if it may be no-agent and either side may match since the task then flips to the
+        # first address with an agent. The task generator still checks every pair returned,
+        # so flags only need to be conservative.
+        flags = None
+        if self._match_addresses and self._scheduled_by in (0, 1):
+            flags = [[self._selection_flags(addr_nlas) for addr_nlas in selections] for selections in self._selections]
+            match_columns = {i for i, (b_match, b_no_agent) in enumerate(flags[1]) if b_match}
+            match_or_no_agent_columns = {i for i, (b_match, b_no_agent) in enumerate(flags[1]) if b_match or b_no_agent}
+
+        filtered = {}
+        for a_index in range(len(self._selectors[0])):
+            columns = self._pair_columns(a_index)
+            if flags:
+                a_match, a_no_agent = flags[0][a_index]
+                if self._scheduled_by == 0:
+                    if a_match:
+                        keep = None
+                    elif a_no_agent:
+                        keep = match_columns
+                    else:
+                        continue
+                elif a_match:
+                    keep = match_or_no_agent_columns
+                else:
+                    keep = match_columns
+
+                if keep is not None:
+                    key = (id(columns), id(keep))
+                    if key not in filtered:
+                        #hold on to columns so its id isn't reused
+                        filtered[key] = (columns, [i for i in columns if i in keep])
+                    columns = filtered[key][1]
+
+            for b_index in columns:
+                yield a_index, b_index
+
+    def _selection_flags(self, addr_nlas):
+        ##
+        # Returns a (may match, may be no-agent) tuple for the addresses a selector resolved
+        # to. Anything that can't be worked out is flagged both ways.
+        if not isinstance(addr_nlas, list):
+            return True, True
+
+        may_match = False
+        may_be_no_agent = False
+        for addr_nla in addr_nlas:
+            address = addr_nla.get('address')
+            if not address:
+                return True, True
+            #selected labels and remote addresses match on the address they belong to
+            if (not address.address()) or self._match_addresses.get(str(address.address()).lower()):
+                may_match = True
+            #no-agent may be set on the address, any of its labels or remotes, or its host
+            host = self._psconfig.host(address.host_ref())
+            if self._has_no_agent(address.data) or (host and host.no_agent()):
+                may_be_no_agent = True
+
+        return may_match, may_be_no_agent
+
+    def _has_no_agent(self, data):
+        if isinstance(data, dict):
+            if data.get('no-agent'):
+                return True
+            return any(self._has_no_agent(v) for v in data.values())
+        elif isinstance(data, list):
+            return any(self._has_no_agent(v) for v in data)
+        return False
+
     def _stop(self):
         self._exclude_checksum_map = None
+        self._pair_iter = None
+        self._selector_checksums = None
+        self._selector_ids = None
+        self._excluded_ids = None
+        self._all_columns = None
@@ -12,6 +12,8 @@ class Disjoint(BaseP2PGroup):
         self._a_address_map = {}
         self._b_address_map = {}
         self._checked_pairs = {}
+        self._columns = None
+        self._seen_pairs = None
         
 
     def unidirectional(self, val=None):
@@ -56,7 +58,7 @@ class Disjoint(BaseP2PGroup):
     def dimension_size(self, dimension):
         '''This is primarily used by next() and won't have much utility outide that. It merges 
             a_addresses and b_addresses and returnes the total size as needed by the next() algorithm 
-            genealized for n dimensions. Tests are then excluded using the is_excluded_selectors below.'''
+            genealized for n dimensions. Only pairs of an a and a b address are walked, see _pair_columns().'''
         
         if not (dimension < self.dimension_count()):
             return
@@ -87,31 +89,59 @@ class Disjoint(BaseP2PGroup):
             return self.b_addresses()
 
     def _start(self):
-        merged_addresses = []
-        a_addr_map = {}
-        b_addr_map = {}
-        for a_addr in self.a_addresses():
-            merged_addresses.append(a_addr)
-            a_addr_map[a_addr.checksum()] = True
-        
-        for b_addr in self.b_addresses():
-            merged_addresses.append(b_addr)
-            b_addr_map[b_addr.checksum()] = True
-        
-        self._merged_addresses = merged_addresses
-        self._a_address_map = a_addr_map
-        self._b_address_map = b_addr_map
+        a_addresses = self.a_addresses()
+        self._merged_addresses = a_addresses + self.b_addresses()
+        super()._start()
+
+        #maps used by is_excluded_selectors, from the checksums worked out above
+        checksums = self._selector_checksums[0]
+        self._a_address_map = {checksum: True for checksum in checksums[:len(a_addresses)]}
+        self._b_address_map = {checksum: True for checksum in checksums[len(a_addresses):]}
         self._checked_pairs = {}
 
-        return
-    
+        ##
+        # Work out which merged indices each one pairs with. Membership goes by selector
+        # identity so a selector listed in both a and b pairs both ways like before.
+        ids = self._selector_ids[0]
+        a_ids = set(ids[:len(a_addresses)])
+        b_ids = set(ids[len(a_addresses):])
+        a_columns = [i for i, selector_id in enumerate(ids) if selector_id in a_ids]
+        b_columns = [i for i, selector_id in enumerate(ids) if selector_id in b_ids]
+        no_columns = []
+        self._columns = []
+        for selector_id in ids:
+            in_a = selector_id in a_ids
+            in_b = selector_id in b_ids
+            if self.unidirectional():
+                self._columns.append(b_columns if in_a else no_columns)
+            elif in_a and in_b:
+                self._columns.append(self._all_columns)
+            else:
+                self._columns.append(b_columns if in_a else a_columns)
+
+        #only need to track pairs already returned if the same selector is listed twice
+        self._seen_pairs = set() if len(set(ids)) < len(ids) else None
+
     def _stop(self):
         self._merged_addresses = None
         self._a_address_map = None
         self._b_address_map = None
         self._checked_pairs = None
-        self._exclude_checksum_map = None
+        self._columns = None
+        self._seen_pairs = None
+        super()._stop()
+
+    def _pair_columns(self, a_index):
+        return self._columns[a_index]
+
+    def _is_excluded_pair(self, a_index, b_index):
+        if self._seen_pairs is not None:
+            pair = (self._selector_ids[0][a_index], self._selector_ids[1][b_index])
+            if pair in self._seen_pairs:
+                return True
+            self._seen_pairs.add(pair)
 
+        return super()._is_excluded_pair(a_index, b_index)
 
     def is_excluded_selectors(self, addr_sels):
         '''Given two selectors, return True if should be excluded and False otherwise'''
@@ -69,11 +69,7 @@ class FieldList(BaseGroup):
         addresses = []
 
         for addr_nla in addr_nlas[0]:
-            selected_addr = self.select_address(
-                addr_nla['address'],
-                addr_nla['label'],
-                addr_nla['name']
-            )
+            selected_addr = self._select_address(addr_nla, addr_nla['name'])
 
             if selected_addr:
                 addresses.append(selected_addr)
@@ -3,12 +3,115 @@ import json
 import re
 from ....utilities.jq import jq
 
+TEMPLATE_VAR_RE = re.compile(r'{%\s+(.+?)\s+%\}')
+
+def _ipv6_url_re():
+    IPv4 = "((25[0-5]|2[0-4][0-9]|[0-1]?[0-9]{1,2})[.](25[0-5]|2[0-4][0-9]|[0-1]?[0-9]{1,2})[.](25[0-5]|2[0-4][0-9]|[0-1]?[0-9]{1,2})[.](25[0-5]|2[0-4][0-9]|[0-1]?[0-9]{1,2}))"
+    G = "[0-9a-fA-F]{1,4}"
+    tail = ( ":",
+	     "(:(" + G + ")?|" + IPv4 + ")",
+             ":(" + IPv4 + "|" + G + "(:" + G + ")?|)",
+             "(:" + IPv4 + "|:" + G + "(:" + IPv4 + "|(:" + G + "){0,2})|:)",
+	     "((:" + G + "){0,2}(:" + IPv4 + "|(:" + G + "){1,2})|:)",
+	     "((:" + G + "){0,3}(:" + IPv4 + "|(:" + G + "){1,2})|:)",
+	     "((:" + G + "){0,4}(:" + IPv4 + "|(:" + G + "){1,2})|:)" )
+    
+    IPv6_re = G
+    for _ in tail:
+        IPv6_re = "{}:(".format(G)+IPv6_re+"|{})".format(_)
+
+    IPv6_re = ":(:" + G + "){0,5}((:" + G + "){1,2}|:" + IPv4 + ")|" + IPv6_re
+    IPv6_re = re.sub(r'\(', '(?:', IPv6_re)
+    return re.compile('(https?)://'+'('+IPv6_re+')')
+
+#only needs to be built once
+IPV6_URL_RE = _ipv6_url_re()
+
+#markers for variables when compiling, json.dumps escapes control characters so they can't clash
+QUOTED_SLOT = '"\x01{}\x01"'
+SLOT_RE = re.compile(r'"\x01(\d+)\x01"|\x01(\d+)\x01')
+#expanded values with these can interact with other variables, so they take the slow path
+UNSAFE_VALUE_RE = re.compile(r'[{}%"\\\n]')
+
+class CompiledTemplate(object):
+    '''
+    A template object serialized and parsed once into literal text and variable slots, so it
+    can be expanded for many address combinations with BaseTemplate.render(). Slots are found
+    by running the substitutions with marker values, so they land exactly where expand()
+    would put values.
+    '''
+
+    def __init__(self, obj=None, replace_quotes=True):
+        self.obj = obj
+        self.replace_quotes = replace_quotes
+        self.obj_str = None
+        self.template_vars = []
+        self.segments = None #alternating literal text and (variable index, quoted) slots
+
+        if not obj:
+            return
+
+        self.obj_str = json.dumps(obj)
+        for template_var in TEMPLATE_VAR_RE.findall(self.obj_str):
+            template_var = template_var.strip()
+            if template_var not in self.template_vars:
+                self.template_vars.append(template_var)
+
+        #variables containing template markers can create new matches, leave those to expand()
+        for template_var in self.template_vars:
+            if '{%' in template_var or '%}' in template_var:
+                return
+
+        markers = {template_var: QUOTED_SLOT.format(i) for i, template_var in enumerate(self.template_vars)}
+        marked_str = BaseTemplate._substitute(self.obj_str, markers, '"' if replace_quotes else '')
+        segments = []
+        last = 0
+        for match in SLOT_RE.finditer(marked_str):
+            segments.append(marked_str[last:match.start()])
+            if match.group(1) is not None:
+                segments.append((int(match.group(1)), True))
+            else:
+                segments.append((int(match.group(2)), False))
+            last = match.end()
+        segments.append(marked_str[last:])
+        self.segments = segments
+
+    def fill(self, template_var_map):
+        '''
+        Returns the JSON string with the given expanded values, or None if a value could change
+        how other variables match and the substitutions have to be run one by one
+        '''
+        if self.segments is None:
+            return
+
+        values = []
+        for template_var in self.template_vars:
+            value = "{}".format(template_var_map[template_var])
+            embedded = value
+            if self.replace_quotes:
+                embedded = embedded[1:] if embedded.startswith('"') else embedded
+                embedded = embedded[:-1] if embedded.endswith('"') else embedded
+                if value not in (embedded, '"' + embedded + '"'):
+                    return
+            if (not embedded) or UNSAFE_VALUE_RE.search(embedded):
+                return
+            values.append((value, embedded))
+
+        parts = []
+        for segment in self.segments:
+            if isinstance(segment, tuple):
+                parts.append(values[segment[0]][0 if segment[1] else 1])
+            else:
+                parts.append(segment)
+        return ''.join(parts)
+
 class BaseTemplate():
 
     def __init__(self, **kwargs) -> None:
         self.jq_obj = kwargs.get('jq_obj', {})
         self.replace_quotes = kwargs.get('replace_quotes',True)
         self.error = ''
+        self._expanded_vars = {} #variables already expanded by render()
 
     def expand(self, obj = None):
         '''Parse the given object replace template variables with appropriate values. Returns copy of object with expanded values'''
@@ -23,15 +126,10 @@ class BaseTemplate():
         #convert to string so we get copy and can do replace
         obj_str = json.dumps(obj)
 
-        #handle quotes
-        quote = ""
-        if self.replace_quotes:
-            quote = '"'
-        
         #find the variables used
         template_var_map = {}
 
-        for template_var in re.findall('{%\s+(.+?)\s+%\}', obj_str):
+        for template_var in TEMPLATE_VAR_RE.findall(obj_str):
             template_var = template_var.strip()
             if template_var_map.get(template_var):
                 continue
@@ -42,6 +140,47 @@ class BaseTemplate():
             template_var_map[template_var] = expanded_val
 
         #do the substitutions
+        obj_str = self._substitute(obj_str, template_var_map, '"' if self.replace_quotes else '')
+
+        return self._finish(obj_str)
+
+    def compile(self, obj=None):
+        '''Parses the given object once so it can be expanded repeatedly with render()'''
+        return CompiledTemplate(obj, replace_quotes=self.replace_quotes)
+
+    def render(self, compiled):
+        '''
+        Same as expand() for the object a CompiledTemplate was built from, filling in its
+        variable slots instead of searching and replacing the whole serialized object for
+        each variable. Variables are only expanded once per template.
+        '''
+
+        #make sure we have an object, otherwise return what was given
+        if not compiled.obj:
+            return compiled.obj
+
+        #reset error
+        self.error = ''
+
+        template_var_map = {}
+        for template_var in compiled.template_vars:
+            expanded_val = self._expanded_vars.get(template_var)
+            if expanded_val is None:
+                expanded_val = self._expand_var(template_var)
+                if expanded_val is None:
+                    self.error = "Unable to expand variable {}: {}".format(template_var, self.error)
+                    return
+                self._expanded_vars[template_var] = expanded_val
+            template_var_map[template_var] = expanded_val
+
+        obj_str = compiled.fill(template_var_map)
+        if obj_str is None:
+            obj_str = self._substitute(compiled.obj_str, template_var_map, '"' if compiled.replace_quotes else '')
+
+        return self._finish(obj_str)
+
+    @staticmethod
+    def _substitute(obj_str, template_var_map, quote):
         for template_var in template_var_map:
             #replace with expanded values
             template_var_str = "{}".format(template_var_map[template_var]) #make sure value is string
@@ -54,6 +193,9 @@ class BaseTemplate():
             #replace embedded variables
             obj_str = re.sub(r'{%\s+' + re.escape(template_var) +  r'\s+%\}', template_var_str, obj_str)
 
+        return obj_str
+
+    def _finish(self, obj_str):
         # post processing
         ##bracket IPv6 URLs
         obj_str = self._bracket_ipv6_url(obj_str)
@@ -84,22 +226,4 @@ class BaseTemplate():
         return '"' + (jq_result if jq_result is not None else '') + '"'
     
     def _bracket_ipv6_url(self, json_str):
-        IPv4 = "((25[0-5]|2[0-4][0-9]|[0-1]?[0-9]{1,2})[.](25[0-5]|2[0-4][0-9]|[0-1]?[0-9]{1,2})[.](25[0-5]|2[0-4][0-9]|[0-1]?[0-9]{1,2})[.](25[0-5]|2[0-4][0-9]|[0-1]?[0-9]{1,2}))"
-        G = "[0-9a-fA-F]{1,4}"
-        tail = ( ":",
-	     "(:(" + G + ")?|" + IPv4 + ")",
-             ":(" + IPv4 + "|" + G + "(:" + G + ")?|)",
-             "(:" + IPv4 + "|:" + G + "(:" + IPv4 + "|(:" + G + "){0,2})|:)",
-	     "((:" + G + "){0,2}(:" + IPv4 + "|(:" + G + "){1,2})|:)",
-	     "((:" + G + "){0,3}(:" + IPv4 + "|(:" + G + "){1,2})|:)",
-	     "((:" + G + "){0,4}(:" + IPv4 + "|(:" + G + "){1,2})|:)" )
-        
-        IPv6_re = G
-        for _ in tail:
-            IPv6_re = "{}:(".format(G)+IPv6_re+"|{})".format(_)
-
-        IPv6_re = ":(:" + G + "){0,5}((:" + G + "){1,2}|:" + IPv4 + ")|" + IPv6_re
-        IPv6_re = re.sub('\(', '(?:', IPv6_re)
-        json_str = re.sub('(https?)://'+'('+IPv6_re+')', r'\g<1>://[\g<2>]', json_str)
-
-        return json_str
+        return IPV6_URL_RE.sub(r'\g<1>://[\g<2>]', json_str)
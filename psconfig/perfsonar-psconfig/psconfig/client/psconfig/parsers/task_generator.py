@@ -5,6 +5,7 @@ from ..config import Config
 from .template import Template
 from ...pscheduler.task import Task
 from ...pscheduler.api_connect import ApiConnect
+from ...pscheduler.participants_cache import ParticipantsCache
 import re
 import json
 
@@ -18,6 +19,9 @@ class TaskGenerator(object):
         self.default_archives = kwargs.get('default_archives', [])
         self.use_psconfig_archives = kwargs.get('use_psconfig_archives', True)
         self.bind_map = kwargs.get('bind_map', {})
+        self.transport = kwargs.get('transport')
+        #share one cache across all tasks of a run so each test template is looked up once
+        self.participants_cache = kwargs.get('participants_cache') or ParticipantsCache()
 
         self.error = ''
 
@@ -36,9 +40,19 @@ class TaskGenerator(object):
         self.expanded_reference = None
         self.scheduled_by_address = None
         self.addresses = None
+        self.participants_pending = False #participant count was recorded for later instead of looked up
 
         #private
+        self._flip = False
         self._match_addresses_map = None
+        self._participant_specs = None #when set, participant lookups are recorded here instead of sent
+        ##Lookups indexed on start() so next() doesn't repeat them for every pair
+        self._host_map = None #host_ref -> Host
+        self._address_flags = None #id(address) -> (address, disabled, no_agent)
+        self._archive_map = None #host_ref -> (archive data list, error)
+        self._task_archives = None #[(archive_ref, archive data, checksum)] from task
+        self._default_archives = None #[(archive data, checksum)]
+        self._compiled_templates = None #id(obj) -> CompiledTemplate
 
     def start(self):
         '''Prepares generator to begin iterating through tasks. Must be run before any call to next()'''
@@ -96,8 +110,12 @@ class TaskGenerator(object):
         
         #validate specs?
 
-        #start group
-        group.start(self.psconfig)
+        #index host, flag and archive lookups for this task
+        self._start_index()
+
+        #start group, letting it skip pairs none of our addresses would schedule
+        scheduled_by = task.scheduled_by() if task.scheduled_by() else 0
+        group.start(self.psconfig, match_addresses=self._match_addresses_map, scheduled_by=scheduled_by)
 
         #set started
         self.started = True
@@ -105,6 +123,42 @@ class TaskGenerator(object):
         #return true if reach here
         return True
     
+    def _start_index(self):
+        ##
+        # Archive checksums are worked out once here. Hosts, address flags and the archive
+        # list of each host are filled in as next() first needs them.
+        self._host_map = {}
+        self._address_flags = {}
+        self._archive_map = {}
+        self._task_archives = []
+        if self.use_psconfig_archives:
+            for archive_ref in (self.task.archive_refs() or []):
+                archive = self.psconfig.archive(archive_ref)
+                self._task_archives.append((archive_ref, archive.data if archive else None, archive.checksum() if archive else None))
+        self._default_archives = [(archive.data, archive.checksum()) for archive in self.default_archives]
+        self._compiled_templates = {}
+
+    def _stop_index(self):
+        self._host_map = None
+        self._address_flags = None
+        self._archive_map = None
+        self._task_archives = None
+        self._default_archives = None
+        self._compiled_templates = None
+
+    def _compiled(self, template, obj):
+        ##
+        # Returns obj parsed into a CompiledTemplate, parsing each test, archive, context and
+        # reference object once per start()
+        if self._compiled_templates is None:
+            return template.compile(obj)
+        compiled = self._compiled_templates.get(id(obj))
+        #compiled keeps obj so its id isn't reused
+        if compiled is None or compiled.obj is not obj:
+            compiled = template.compile(obj)
+            self._compiled_templates[id(obj)] = compiled
+        return compiled
+
     def next(self):
         '''Finds the next matching task. Returns the addresses and remaining values can be pulled
             from class properties'''
@@ -171,8 +225,34 @@ class TaskGenerator(object):
         if not matched:
             return
 
+        return self._expand(addrs, scheduled_by_addr, flip)
+
+    def pair(self):
+        '''Returns the current address set in the form expand() takes'''
+        return (self.addresses, self.scheduled_by_address, self._flip)
+
+    def expand(self, pair):
+        '''Expands an address set returned by pair() again, for example once its participant
+            count is cached. Returns the addresses and sets class properties like next()'''
+        if not self.started:
+            return
+
+        self._reset_next()
+        addrs, scheduled_by_addr, flip = pair
+        return self._expand(addrs, scheduled_by_addr, flip)
+
+    def defer_participants(self, specs):
+        '''Makes next() record participant lookups it can't answer from the cache in specs
+            instead of sending them. specs is a dict of participants cache key to test JSON
+            suitable for ParticipantsCache.prefetch. When a lookup is recorded
+            participants_pending is set, and the pair can be expanded again with expand()
+            once the count is cached. Pass None to send lookups again.'''
+        self._participant_specs = specs
+
+    def _expand(self, addrs, scheduled_by_addr, flip):
         #set addresses
         self.addresses = addrs
+        self._flip = flip
 
         ##
         #create object to be queried by jq template vars
@@ -208,7 +288,7 @@ class TaskGenerator(object):
         self.scheduled_by_address = scheduled_by_addr
 
         #expand test spec
-        test = template.expand(self.test.data)
+        test = template.render(self._compiled(template, self.test.data))
 
         if test:
             self.expanded_test = test
@@ -219,45 +299,18 @@ class TaskGenerator(object):
         #expand archivers
         expanded_archives = []
         for archive in archives:
-            expanded_archive = template.expand(archive)
+            expanded_archive = template.render(self._compiled(template, archive))
             if not expanded_archive:
                 return self._handle_next_error(addrs, "Error expanding archives: {}".format(template.error))
             expanded_archives.append(expanded_archive)
 
         self.expanded_archives = expanded_archives
 
-        test_data = self.expanded_test
-
-        test_data_spec = self.expanded_test['spec']
-        test_data_hash = {}
-        test_data_spec_hash = {}
-        for test_data_key in test_data_spec:
-            test_data_value = test_data_spec[test_data_key]
-            test_data_spec_hash[test_data_key] = test_data_value
-        
-        test_data_hash['type'] = test_data['type']
-        test_data_hash['spec'] = test_data_spec_hash
-
-        test_data_json = json.dumps(test_data_hash)
-        # remove quotes around numbers
-        # I did't find more elegant way for unquoting numbers
-        test_data_json = re.sub("['\"](\d+)['\"]", r'\1',test_data_json) #removes both single and double quotes
         number_of_participants = len(contexts)
         # self.pscheduler_url is uninitialized during template validation
         # only do this check if we have contexts to determine and a pscheduler server we can contact
         if has_contexts and self.pscheduler_url:
-            psc_url = self.pscheduler_url + '/tests'
-            if not psc_url:
-                self.error = 'psc_url is NULL'
-            psc_client = ApiConnect(url=psc_url)
-            if not psc_client:
-                self.error = 'psc_client is NULL'
-            retrieved_number_of_participants = psc_client.get_number_of_participants(test_data_json)
-            if (retrieved_number_of_participants == -1) or (retrieved_number_of_participants == '-1'):
-                number_of_participants = len(contexts)
-                self.error = 'Invalid number of participants'
-            else:
-                number_of_participants = retrieved_number_of_participants
+            number_of_participants = self._get_number_of_participants(len(contexts))
         
         #expand contexts
         #Note: Assumes first address is first participant, second is second participant, etc.
@@ -266,7 +319,7 @@ class TaskGenerator(object):
         for context in contexts:
             # expand contexts according to number of participants
             if participants_counter < number_of_participants:
-                expanded_context = template.expand(context)
+                expanded_context = template.render(self._compiled(template, context))
                 if not expanded_context:
                     return self._handle_next_error(addrs, "Error expanding context: {}".format(template.error))
                 expanded_contexts.append(expanded_context)
@@ -278,7 +331,7 @@ class TaskGenerator(object):
         #expand reference
         reference = None
         if self.task.reference():
-            reference = template.expand(self.task.reference())
+            reference = template.render(self._compiled(template, self.task.reference()))
             if reference:
                 self.expanded_reference = reference
             else:
@@ -292,6 +345,7 @@ class TaskGenerator(object):
         self._reset_next()
         self.started = False
         self.group.stop()
+        self._stop_index()
         self.task = None
         self.group = None
         self.schedule = None
@@ -348,7 +402,8 @@ class TaskGenerator(object):
 
         #time to create pscheduler task
         psched_task = Task(url = self.pscheduler_url,
-                           data = task_data)
+                           data = task_data,
+                           transport = self.transport)
         
         #set bind map - defaults to empty object
         psched_task.bind_map = self.bind_map ###why not use add_bind_map method?
@@ -408,6 +463,38 @@ class TaskGenerator(object):
         #if get here , then not a match
         return False
     
+    def _host_ref(self, address):
+        #labels don't have a host, so fall back to the one of the address they were selected from
+        try:
+            return address.host_ref()
+        except Exception as e:
+            return address._parent_host_ref
+
+    def _host(self, address):
+        host_ref = self._host_ref(address)
+        if self._host_map is None:
+            return self.psconfig.host(host_ref)
+        if host_ref not in self._host_map:
+            self._host_map[host_ref] = self.psconfig.host(host_ref)
+        return self._host_map[host_ref]
+
+    def _flags(self, address):
+        ##
+        # Returns whether address is disabled and no-agent, taking its host into account.
+        # Groups hand out the same selected address objects for every pair, so remember them.
+        flags = self._address_flags.get(id(address)) if self._address_flags is not None else None
+        #keep address with its flags so its id isn't reused
+        if flags is None or flags[0] is not address:
+            host = self._host(address)
+            flags = (
+                address,
+                bool(address._is_disabled() or (host and host.disabled())),
+                bool(address._is_no_agent() or (host and host.no_agent()))
+            )
+            if self._address_flags is not None:
+                self._address_flags[id(address)] = flags
+        return flags
+
     def _is_no_agent(self, address=None):
         ##
         # Checks if address or host has no-agent set. If either has it set then it 
@@ -417,22 +504,7 @@ class TaskGenerator(object):
         if not address:
             return
         
-        #check address no_agent
-        if address._is_no_agent():
-            return True
-        
-        #check host no_agent
-        host = None
-        try:
-            host = self.psconfig.host(address.host_ref())
-        except Exception as e:
-            if address._parent_host_ref:
-                host = self.psconfig.host(address._parent_host_ref)
-        
-        if host and host.no_agent():
-            return True
-        
-        return False
+        return self._flags(address)[2]
     
     def _is_disabled(self, address=None):
         ##
@@ -442,75 +514,62 @@ class TaskGenerator(object):
         if not address:
             return
 
-        #check address disabled
-        if address._is_disabled():
-            return True
-        
-        #check host disabled
-        host = None
-        
-        try:
-            host = self.psconfig.host(address.host_ref())
-        except Exception as e:
-            if address._parent_host_ref:
-                host = self.psconfig.host(address._parent_host_ref)
-            
-        if host and host.disabled():
-            return True
-        
-        return False
+        return self._flags(address)[1]
     
     def _get_archives(self, address=None, template=None): ######template not used. check usage
-        archives = []
-
         if not address:
-            return archives
-        
-        #init some values
-        task = self.task
-        psconfig = self.psconfig
+            return []
+        
+        #archives only depend on the host, so build each host's list once
+        if self._archive_map is None:
+            self._start_index()
+        host_ref = self._host_ref(address) if self.use_psconfig_archives else None
+        if host_ref not in self._archive_map:
+            self._archive_map[host_ref] = self._host_archives(address)
+        archives, error = self._archive_map[host_ref]
+        if error:
+            self.error = error
+            return
+
+        return list(archives)
+
+    def _host_archives(self, address):
+        ##
+        # Returns the deduplicated archives of the task, address host and defaults along
+        # with an error if an archive can't be found
+        archives = []
         archive_tracker = {}
 
         #configuring archives from psconfig if allowed
         if self.use_psconfig_archives:
-            host = None
-            try:
-                host = self.psconfig.host(address.host_ref())
-            except Exception as e:
-                if address._parent_host_ref:
-                    host = self.psconfig.host(address._parent_host_ref)
-            archive_refs = []
-            if task.archive_refs():
-                archive_refs += task.archive_refs()
+            host_archives = []
+            host = self._host(address)
             if host and host.archive_refs():
-                archive_refs += host.archive_refs()
-            
+                for archive_ref in host.archive_refs():
+                    archive = self.psconfig.archive(archive_ref)
+                    host_archives.append((archive_ref, archive.data if archive else None, archive.checksum() if archive else None))
+
             #iterate through archives skipping duplicates
-            for archive_ref in archive_refs:
-                #get archive obj
-                archive = psconfig.archive(archive_ref)
-                if not archive:
-                    self.error = "Unable to find archive defined in task: {}".format(archive_ref)
-                    return
+            for archive_ref, archive_data, checksum in self._task_archives + host_archives:
+                if archive_data is None:
+                    return None, "Unable to find archive defined in task: {}".format(archive_ref)
                 #check if duplicate
-                checksum = archive.checksum()
                 if archive_tracker.get(checksum):
                     continue #skip duplicates
                 #if made it here, add to the list
                 archive_tracker[checksum] = True
-                archives.append(archive.data)
+                archives.append(archive_data)
         
         #configure default archives
-        for archive in self.default_archives:
+        for archive_data, checksum in self._default_archives:
             #check if duplicate
-            checksum = archive.checksum()
             if archive_tracker.get(checksum):
                 continue # skip duplicates
             #if made it here, add to the list
             archive_tracker[checksum] = True
-            archives.append(archive.data)
+            archives.append(archive_data)
         
-        return archives
+        return archives, None
     
     def _get_hosts(self):
         ##
@@ -520,13 +579,7 @@ class TaskGenerator(object):
         hosts = []
 
         for address in self.addresses:
-            #check host no_agent
-            host = None
-            try:
-                host = self.psconfig.host(address.host_ref())
-            except Exception as e:
-                if address._parent_host_ref:
-                    host = self.psconfig.host(address._parent_host_ref)
+            host = self._host(address)
             if host:
                 hosts.append(host.data)
             else:
@@ -569,6 +622,55 @@ class TaskGenerator(object):
 
         return addrs
 
+    def _participants_test_json(self):
+        test_data = self.expanded_test
+
+        test_data_spec = self.expanded_test['spec']
+        test_data_hash = {}
+        test_data_spec_hash = {}
+        for test_data_key in test_data_spec:
+            test_data_value = test_data_spec[test_data_key]
+            test_data_spec_hash[test_data_key] = test_data_value
+        
+        test_data_hash['type'] = test_data['type']
+        test_data_hash['spec'] = test_data_spec_hash
+
+        test_data_json = json.dumps(test_data_hash)
+        # remove quotes around numbers
+        # I did't find more elegant way for unquoting numbers
+        test_data_json = re.sub("['\"](\d+)['\"]", r'\1',test_data_json) #removes both single and double quotes
+        return test_data_json
+
+    def _get_number_of_participants(self, default_count):
+        #count only depends on the test template, so check the cache before asking pscheduler
+        cache_key = ParticipantsCache.key(self.expanded_test.get('type'), self.test.data.get('spec'), self.expanded_test.get('spec'))
+        number_of_participants = self.participants_cache.get(cache_key)
+        if number_of_participants is not None:
+            return number_of_participants
+
+        test_data_json = self._participants_test_json()
+        if self._participant_specs is not None:
+            #just collecting specs to prefetch
+            self._participant_specs[cache_key] = test_data_json
+            self.participants_pending = True
+            return default_count
+
+        psc_url = self.pscheduler_url + '/tests'
+        if not psc_url:
+            self.error = 'psc_url is NULL'
+        psc_client = ApiConnect(url=psc_url, transport=self.transport)
+        if not psc_client:
+            self.error = 'psc_client is NULL'
+        retrieved_number_of_participants = psc_client.get_number_of_participants(test_data_json)
+        if (retrieved_number_of_participants == -1) or (retrieved_number_of_participants == '-1'):
+            number_of_participants = default_count
+            self.error = 'Invalid number of participants'
+        else:
+            number_of_participants = retrieved_number_of_participants
+            if ParticipantsCache.valid_count(number_of_participants):
+                self.participants_cache.set(cache_key, number_of_participants)
+        return number_of_participants
+
     def _reset_next(self):
         self.error = None
         self.expanded_test = None
@@ -577,3 +679,5 @@ class TaskGenerator(object):
         self.expanded_reference = None
         self.scheduled_by_address = None
         self.addresses = None
+        self.participants_pending = False
+        self._flip = False
@@ -5,6 +5,11 @@ from .base_template import BaseTemplate
 import re
 from ipaddress import ip_address, IPv6Address
 
+ADDRESS_RE = re.compile(r'^address\[(\d+)\]$')
+PSCHEDULER_ADDRESS_RE = re.compile(r'^pscheduler_address\[(\d+)\]$')
+LEAD_BIND_ADDRESS_RE = re.compile(r'^lead_bind_address\[(\d+)\]$')
+JQ_RE = re.compile(r'^jq (.+)$')
+
 class Template(BaseTemplate):
 
     def __init__(self, **kwargs):
@@ -14,10 +19,10 @@ class Template(BaseTemplate):
         self.flip = kwargs.get('flip', False)
 
     def _expand_var(self, template_var):
-        addr_match = re.match('^address\[(\d+)\]$', template_var)
-        pscheduler_address_match = re.match('^pscheduler_address\[(\d+)\]$', template_var)
-        lead_bind_address_match = re.match('^lead_bind_address\[(\d+)\]$', template_var)
-        jq_match = re.match('^jq (.+)$', template_var)
+        addr_match = ADDRESS_RE.match(template_var)
+        pscheduler_address_match = PSCHEDULER_ADDRESS_RE.match(template_var)
+        lead_bind_address_match = LEAD_BIND_ADDRESS_RE.match(template_var)
+        jq_match = JQ_RE.match(template_var)
 
         if addr_match:
             val = self._parse_group_address(int(addr_match.group(1)))
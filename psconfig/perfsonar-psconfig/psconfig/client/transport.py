@@ -0,0 +1,184 @@
+'''
+Long-lived HTTP transport with pooled keep-alive connections
+'''
+
+from requests import Session
+from requests.adapters import HTTPAdapter
+from urllib3.util.ssl_ import create_urllib3_context
+from .happy_eyeballs import FamilyCache, connection_pool_classes
+import os
+import threading
+
+
+class PooledHTTPAdapter(HTTPAdapter):
+    '''
+    HTTPAdapter that binds every connection it opens to source_address and verifies against
+    a pre-loaded SSLContext instead of re-reading the CA file for each new connection.
+    Binding is per connection, so adapters with different source addresses can be used
+    from different threads at the same time. If family_cache is given, new connections
+    race the addresses of dual-stack hosts (see happy_eyeballs).
+    '''
+
+    def __init__(self, **kwargs):
+        self.source_address = kwargs.pop('source_address', None)
+        self.ssl_context = kwargs.pop('ssl_context', None)
+        self.family_cache = kwargs.pop('family_cache', None)
+        self.happy_eyeballs_delay = kwargs.pop('happy_eyeballs_delay', 0.25)
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, connections, maxsize, block=False, **pool_kwargs):
+        if self.source_address:
+            pool_kwargs['source_address'] = (self.source_address, 0)
+        if self.ssl_context is not None:
+            pool_kwargs['ssl_context'] = self.ssl_context
+        super().init_poolmanager(connections, maxsize, block=block, **pool_kwargs)
+        if self.family_cache is not None:
+            self.poolmanager.pool_classes_by_scheme = connection_pool_classes(self.family_cache, self.happy_eyeballs_delay)
+
+    def cert_verify(self, conn, url, verify, cert):
+        super().cert_verify(conn, url, verify, cert)
+        #CA already loaded in ssl_context, don't make urllib3 load it again per connection
+        if self.ssl_context is not None:
+            conn.ca_certs = None
+            conn.ca_cert_dir = None
+
+
+class HttpTransport(object):
+    '''
+    Keeps one set of connection pools per local bind address and CA file. Within each set
+    urllib3 keeps a keep-alive pool per lead (scheme, host, port), so repeated requests to
+    the same pScheduler reuse the TCP connection and TLS session instead of doing a new
+    handshake. Share a single instance for the lifetime of an agent run.
+
+    The transport is safe to use from multiple threads. Pools are shared by all threads
+    while each thread gets its own Session (sessions carry per-request state like cookies).
+
+    New connections to hosts with both IPv4 and IPv6 addresses race the two families,
+    starting the next address every happy_eyeballs_delay seconds, and the winning family
+    is tried first next time. Pass the same family_cache to the transports of later runs
+    to remember winners across runs. Set happy_eyeballs to False to connect one address
+    at a time instead.
+    '''
+
+    def __init__(self, **kwargs):
+        #number of per-lead pools to keep for each bind address
+        self.pool_connections = kwargs.get('pool_connections', 50)
+        #number of keep-alive connections to keep for each lead
+        self.pool_maxsize = kwargs.get('pool_maxsize', 10)
+        self.happy_eyeballs = kwargs.get('happy_eyeballs', True)
+        self.happy_eyeballs_delay = kwargs.get('happy_eyeballs_delay', 0.25)
+        self.family_cache = kwargs.get('family_cache') or FamilyCache()
+        self._adapters = {}
+        self._ssl_contexts = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def send(self, prepped, bind_address=None, ca_certificate_file=None, **kwargs):
+        '''Sends a prepared request using the pool for the given bind address. Returns a
+            requests Response and raises on connection errors.'''
+        session = self.session(bind_address=bind_address, ca_certificate_file=ca_certificate_file)
+        return session.send(prepped, **kwargs)
+
+    def session(self, bind_address=None, ca_certificate_file=None):
+        '''Returns this thread's Session for the given bind address and CA file'''
+        key = (bind_address or '', ca_certificate_file or '')
+        sessions = getattr(self._local, 'sessions', None)
+        if sessions is None:
+            sessions = self._local.sessions = {}
+        session = sessions.get(key)
+        if session is None:
+            adapter = self.adapter(bind_address=bind_address, ca_certificate_file=ca_certificate_file)
+            session = Session()
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            sessions[key] = session
+        return session
+
+    def adapter(self, bind_address=None, ca_certificate_file=None):
+        '''Returns the shared adapter (and thus pools) for the given bind address and CA file'''
+        key = (bind_address or '', ca_certificate_file or '')
+        with self._lock:
+            adapter = self._adapters.get(key)
+            if adapter is None:
+                adapter = PooledHTTPAdapter(
+                    pool_connections=self.pool_connections,
+                    pool_maxsize=self.pool_maxsize,
+                    source_address=bind_address,
+                    ssl_context=self._ssl_context(ca_certificate_file),
+                    family_cache=self.family_cache if self.happy_eyeballs else None,
+                    happy_eyeballs_delay=self.happy_eyeballs_delay
+                )
+                self._adapters[key] = adapter
+        return adapter
+
+    def _ssl_context(self, ca_certificate_file):
+        #only need our own context when verifying against a CA file
+        if not (ca_certificate_file and isinstance(ca_certificate_file, str)):
+            return
+        context = self._ssl_contexts.get(ca_certificate_file)
+        if context is None:
+            context = create_ca_context(ca_certificate_file)
+            self._ssl_contexts[ca_certificate_file] = context
+        return context
+
+    def stats(self):
+        '''
+        Returns pool statistics keyed by lead ("scheme://host:port"). Each entry has the
+        number of requests sent, connections opened, hits (requests that reused a pooled
+        connection) and misses (requests that needed a new connection). A "total" entry
+        sums everything.
+        '''
+        stats = {}
+        total = {'requests': 0, 'connections': 0, 'hits': 0, 'misses': 0}
+        with self._lock:
+            adapters = list(self._adapters.items())
+        for (bind_address, ca_file), adapter in adapters:
+            pools = adapter.poolmanager.pools
+            for pool_key in list(pools.keys()):
+                pool = pools.get(pool_key)
+                if pool is None:
+                    continue
+                lead = "{}://{}:{}".format(pool.scheme, pool.host, pool.port)
+                if bind_address:
+                    lead += " (bind {})".format(bind_address)
+                entry = stats.setdefault(lead, {'requests': 0, 'connections': 0, 'hits': 0, 'misses': 0})
+                entry['requests'] += pool.num_requests
+                entry['connections'] += pool.num_connections
+                entry['misses'] += pool.num_connections
+                entry['hits'] += max(pool.num_requests - pool.num_connections, 0)
+        for entry in stats.values():
+            for field in total:
+                total[field] += entry[field]
+        stats['total'] = total
+        return stats
+
+    def close(self):
+        '''Closes all pooled connections'''
+        with self._lock:
+            adapters = list(self._adapters.values())
+            self._adapters = {}
+            self._local = threading.local()
+        for adapter in adapters:
+            adapter.close()
+
+
+def create_ca_context(ca_certificate_file):
+    '''Returns an SSLContext that verifies against a CA file or directory'''
+    context = create_urllib3_context()
+    if os.path.isdir(ca_certificate_file):
+        context.load_verify_locations(capath=ca_certificate_file)
+    else:
+        context.load_verify_locations(cafile=ca_certificate_file)
+    return context
+
+
+_default_transport = None
+_default_transport_lock = threading.Lock()
+
+def default_transport():
+    '''Returns a process-wide transport used when a client is not given one explicitly'''
+    global _default_transport
+    with _default_transport_lock:
+        if _default_transport is None:
+            _default_transport = HttpTransport()
+    return _default_transport
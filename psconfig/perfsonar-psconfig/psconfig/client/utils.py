@@ -1,4 +1,10 @@
-from requests import Request, Session
+from requests import Request
+from .transport import default_transport
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+import codecs
+import datetime
+import isodate
 import json
 from urllib.parse import urlparse, urlunparse
 import urllib3
@@ -8,18 +14,58 @@ import re
 
 class Utils(object):
     def __init__(self):
-        #default interface without bind address (if same object needs to be used with multiple local bind addresses)
-        self.urllib_create_connection = urllib3.util.connection.create_connection ######## check if this is global and causes issues with threading
         urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
     def send_http_request(self, **kwargs):
-        url = kwargs.get('url')
+        args = http_request_args(**kwargs)
+        url = args['url']
+        params = args['params']
+        timeout = args['timeout']
+        bind_address = args['bind_address']
+
+        #use the shared pooled transport so connections to the same lead are kept alive.
+        #The transport binds each new connection itself (pools are keyed by bind address),
+        #so nothing process-wide is changed and requests can run from multiple threads.
+        transport = kwargs.get('transport')
+        if transport is None:
+            transport = default_transport()
+
+        #check for ca cert verification examples
+        ##### handle errors max retires and max redirects
+        req = Request(kwargs.get('connection_type'),\
+            url,
+            params=params,
+            json=kwargs.get('data'),
+            headers=kwargs.get('headers'),
+            )
+        prepped = req.prepare()
+        try:
+            resp = transport.send(prepped,\
+                bind_address=bind_address,
+                ca_certificate_file=kwargs.get('ca_certificate_file'),
+                verify=kwargs.get('ca_certificate_file', kwargs.get('verify_hostname', False)),
+                timeout=timeout,
+                allow_redirects=kwargs.get('allow_redirects', True),
+                stream=kwargs.get('stream', False)
+                )
+            
+            return {'response': resp, 'exception': None}
+        except Exception as e:
+            return {'response': None, 'exception': e}
+    
+def http_request_args(**kwargs):
+    '''
+    Resolves the arguments of send_http_request that don't depend on the HTTP library:
+    the URL after address mapping, JSON encoded GET parameters, the timeout and the
+    local address to bind to. Shared by the synchronous and asyncio clients.
+    '''
+    url = kwargs.get('url')
 #        param_count = 0
-        params = {}
+    params = {}
 
-        if kwargs.get('get_params'):
-            for key in kwargs.get('get_params').keys():
-                params[key] = json.dumps(kwargs['get_params'][key])
+    if kwargs.get('get_params'):
+        for key in kwargs.get('get_params').keys():
+            params[key] = json.dumps(kwargs['get_params'][key])
 
 #        if kwargs.get('get_params'):
 #            if len(kwargs.get('get_params')):
@@ -30,75 +76,174 @@ class Utils(object):
 #                    url += '{}='.format(key) + kwargs['get_params'][key]
 #                    param_count += 1
 
-        if kwargs.get('timeout'):
-            timeout = kwargs['timeout']
-        else:
-            timeout = 120
-
-        #set default redirects to something greater than 0
-        #max_redirects = 3
-        #if kwargs.get('max_redirects'):
-        #    max_redirects = kwargs['max_redirects']
-
-        #lookup address if map provided
-        if kwargs.get('address_map'):
-            url_obj = urlparse(url)
-            host = url_obj.hostname
-            if isinstance(kwargs.get('address_map'), dict):
-                if kwargs.get('address_map').get(host):
-                    url_obj = url_obj._replace(netloc=url_obj.netloc.replace(url_obj.hostname, kwargs.get('address_map').get(host)))
-                    url = urlunparse(url_obj)
-        
-        #determine where to bind locally, if needed ############check this!!
-        bind_address = ''
-        if isinstance(kwargs.get('bind_map'), dict):
-            url_obj = urlparse(url)
-            host = url_obj.hostname
-            if kwargs.get('bind_map').get(host):
-                bind_address = kwargs.get('bind_map').get(host)
-                
-
-            elif kwargs.get('bind_map').get('_default'):
-                if not (ip_address(host).is_loopback or host.startswith('localhost')):
-                        bind_address = kwargs.get('bind_map').get('_default')
-            
-        #what if the host is loopback and passed local_address is loopback? valid case? then dont check for loopback host
-        if (not bind_address) and kwargs.get('local_address'):
-            bind_address = kwargs['local_address']
-        
-        if bind_address:
-            conn = urllib3.util.connection.create_connection
+    if kwargs.get('timeout'):
+        timeout = kwargs['timeout']
+    else:
+        timeout = 120
 
-            def set_src_addr(address, timeout, *args, **kwargs):
-                source_address = (bind_address, 0) ########should configure port?
-                return conn(address, timeout=timeout, source_address=source_address)
-            urllib3.util.connection.create_connection = set_src_addr
+    #set default redirects to something greater than 0
+    #max_redirects = 3
+    #if kwargs.get('max_redirects'):
+    #    max_redirects = kwargs['max_redirects']
+
+    #lookup address if map provided
+    if kwargs.get('address_map'):
+        url_obj = urlparse(url)
+        host = url_obj.hostname
+        if isinstance(kwargs.get('address_map'), dict):
+            if kwargs.get('address_map').get(host):
+                url_obj = url_obj._replace(netloc=url_obj.netloc.replace(url_obj.hostname, kwargs.get('address_map').get(host)))
+                url = urlunparse(url_obj)
+    
+    #determine where to bind locally, if needed ############check this!!
+    bind_address = ''
+    if isinstance(kwargs.get('bind_map'), dict):
+        url_obj = urlparse(url)
+        host = url_obj.hostname
+        if kwargs.get('bind_map').get(host):
+            bind_address = kwargs.get('bind_map').get(host)
             
-        else:
-            urllib3.util.connection.create_connection = self.urllib_create_connection
+
+        elif kwargs.get('bind_map').get('_default'):
+            if not is_loopback_host(host):
+                    bind_address = kwargs.get('bind_map').get('_default')
         
-            
-        #check for ca cert verification examples
-        ##### handle errors max retires and max redirects
-        with Session() as s:
-            req = Request(kwargs.get('connection_type'),\
-                url,
-                params=params,
-                json=kwargs.get('data'),
-                headers=kwargs.get('headers'),
-                )
-            prepped = req.prepare()
-            try:
-                resp = s.send(prepped,\
-                    verify=kwargs.get('ca_certificate_file', kwargs.get('verify_hostname', False)),
-                    timeout=timeout,
-                    allow_redirects=kwargs.get('allow_redirects', True)
-                    )
-                
-                return {'response': resp, 'exception': None}
-            except Exception as e:
-                return {'response': None, 'exception': e}
-    
+    #what if the host is loopback and passed local_address is loopback? valid case? then dont check for loopback host
+    if (not bind_address) and kwargs.get('local_address'):
+        bind_address = kwargs['local_address']
+
+    return {'url': url, 'params': params, 'timeout': timeout, 'bind_address': bind_address}
+
+def is_loopback_host(host):
+    '''Returns True if host is a loopback IP or a localhost name'''
+    if not host:
+        return False
+    if host.startswith('localhost'):
+        return True
+    try:
+        return ip_address(host).is_loopback
+    except ValueError:
+        #hostname, not an IP
+        return False
+
+_JSON_WHITESPACE = ' \t\n\r'
+
+def iter_json_array(chunks):
+    '''
+    Yields the elements of a JSON array read from an iterable of bytes (or str) chunks,
+    such as requests' Response.iter_content(). Only the element being parsed is kept in
+    memory, so the size of the whole array doesn't matter. Raises ValueError if the
+    document is not a JSON array.
+    '''
+    parser = JsonArrayParser()
+    for chunk in chunks:
+        yield from parser.feed(chunk)
+    yield from parser.close()
+
+class JsonArrayParser(object):
+    '''
+    Incremental parser behind iter_json_array() for callers that are handed chunks instead
+    of pulling them, such as the asyncio clients. feed() each chunk of bytes (or str) and
+    then call close(). Both return the list of elements completed so far and raise
+    ValueError if the document is not a JSON array.
+    '''
+
+    def __init__(self):
+        self._decoder = json.JSONDecoder()
+        self._utf8 = codecs.getincrementaldecoder('utf-8')()
+        self._buf = ''
+        #expecting one of: start, first (value or ]), value, separator (, or ]), end
+        self._state = 'start'
+
+    def feed(self, chunk):
+        self._buf += self._utf8.decode(chunk) if isinstance(chunk, bytes) else chunk
+        return self._parse(False)
+
+    def close(self):
+        self._buf += self._utf8.decode(b'', final=True)
+        elements = self._parse(True)
+        if self._state != 'end':
+            raise ValueError("JSON array is incomplete")
+        return elements
+
+    def _parse(self, final):
+        elements = []
+        buf = self._buf
+        pos = 0
+        while True:
+            while pos < len(buf) and buf[pos] in _JSON_WHITESPACE:
+                pos += 1
+            if pos >= len(buf):
+                break
+            c = buf[pos]
+            if self._state == 'start':
+                if c != '[':
+                    raise ValueError("Expected a JSON array, got '{}'".format(c))
+                pos += 1
+                self._state = 'first'
+            elif self._state == 'first' and c == ']':
+                pos += 1
+                self._state = 'end'
+            elif self._state in ('first', 'value'):
+                try:
+                    obj, end = self._decoder.raw_decode(buf, pos)
+                except ValueError:
+                    if final:
+                        raise
+                    #element not complete yet, wait for more data
+                    break
+                if (not final and isinstance(obj, (int, float))
+                        and (end == len(buf) or buf[end] not in _JSON_WHITESPACE + ',]')):
+                    #a number at the end of the buffer might continue in the next chunk
+                    break
+                elements.append(obj)
+                pos = end
+                self._state = 'separator'
+            elif self._state == 'separator':
+                if c == ',':
+                    self._state = 'value'
+                elif c == ']':
+                    self._state = 'end'
+                else:
+                    raise ValueError("Expected ',' or ']' in JSON array, got '{}'".format(c))
+                pos += 1
+            else:
+                raise ValueError("Extra data after JSON array")
+        self._buf = buf[pos:]
+        return elements
+
+def iso_to_ts(iso_str):
+    '''Converts an ISO 8601 datetime to epoch seconds, returns None if not set'''
+    if not iso_str:
+        return
+    return isodate.parse_datetime(iso_str).timestamp()
+
+def ts_to_iso(ts):
+    '''Converts epoch seconds to an ISO 8601 UTC datetime without microseconds'''
+    return datetime.datetime.fromtimestamp(ts, datetime.timezone.utc).replace(microsecond=0, tzinfo=None).isoformat() + 'Z'
+
+def iter_concurrent(fn, items, workers=8):
+    '''
+    Yields fn(item) for each item in order while running up to workers calls at once in a
+    thread pool. Only about twice as many calls as workers are started ahead of the one
+    being yielded, so items can be a long or lazy iterable.
+    '''
+    workers = max(1, workers)
+    items = iter(items)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = deque()
+        try:
+            for item in items:
+                futures.append(executor.submit(fn, item))
+                if len(futures) >= workers * 2:
+                    yield futures.popleft().result()
+            while futures:
+                yield futures.popleft().result()
+        finally:
+            #consumer stopped early, don't start anything else
+            for future in futures:
+                future.cancel()
+
 def build_err_msg(http_response):
     errmsg = ''
     errmsg += '{}.'.format(http_response.reason)
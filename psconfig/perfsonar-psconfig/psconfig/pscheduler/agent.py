@@ -3,6 +3,10 @@
 
 from ..client.pscheduler.task_manager import TaskManager
 from ..client.psconfig.parsers.task_generator import TaskGenerator
+from ..client.pscheduler.participants_cache import ParticipantsCache
+from ..client.pscheduler.capability_cache import CapabilityCache
+from ..client.transport import HttpTransport
+from ..client.happy_eyeballs import FamilyCache
 from .config_connect import ConfigConnect
 from ..utilities.iso8601 import duration_to_seconds
 from ..base_agent import BaseAgent
@@ -20,7 +24,20 @@ class Agent(BaseAgent):
         self.pscheduler_fails = kwargs.get('pscheduler_fails', 0)
         self.max_pscheduler_attempts = kwargs.get('max_pscheduler_attempts', 5)
         self.task_min_ttl_seconds = kwargs.get('task_min_ttl_seconds', 86400)
+        self.task_renewal_window_seconds = kwargs.get('task_renewal_window_seconds', 0)
+        #seconds commit may spend creating tasks even if the run is already over time
+        self.min_commit_budget = kwargs.get('min_commit_budget', 60)
+        #seconds commit may spend creating tasks, None for the time until the next run and 0 for no limit
+        self.commit_budget_seconds = kwargs.get('commit_budget_seconds', None)
         self.task_manager = kwargs.get('task_manager', None)
+        self.transport = kwargs.get('transport', None)
+        self.participants_cache = kwargs.get('participants_cache', None)
+        #pairs of a task waiting on participant counts before they are looked up together
+        self.participants_batch_size = kwargs.get('participants_batch_size', 1000)
+        #address family that won the connection race for each lead, kept across runs
+        self.family_cache = kwargs.get('family_cache', FamilyCache())
+        #pScheduler metadata such as lead hostnames, kept across runs
+        self.capability_cache = kwargs.get('capability_cache', CapabilityCache())
         self.logf = kwargs.get('logf', LoggingUtils())
 
         self.logger = logging.getLogger(__name__)
@@ -78,6 +95,22 @@ class Agent(BaseAgent):
             self.logger.debug(self.logf.format( "No task-renewal-fudge-factor specified. Defaulting to {}".format(default) ))
             agent_conf.task_renewal_fudge_factor(default)
         
+        #spreading renewals changes start and expiration times of tasks, so it is opt-in
+        self.task_renewal_window_seconds = 0
+        if agent_conf.task_renewal_window():
+            try:
+                self.task_renewal_window_seconds = int(duration_to_seconds(agent_conf.task_renewal_window()))
+            except Exception as e:
+                self.logger.error(self.logf.format("Error parsing task-renewal-window. Defaulting to " + str(self.task_renewal_window_seconds) + " seconds: {}".format(e)))
+        self.logger.debug(self.logf.format("task_renewal_window is " + str(self.task_renewal_window_seconds) + " seconds"))
+        
+        self.commit_budget_seconds = None
+        if agent_conf.pscheduler_commit_budget():
+            try:
+                self.commit_budget_seconds = int(duration_to_seconds(agent_conf.pscheduler_commit_budget()))
+            except Exception as e:
+                self.logger.error(self.logf.format("Error parsing pscheduler-commit-budget. Defaulting to the time until the next run: {}".format(e)))
+        
         # Set cache directory per agent. Will not work to share since agents may
         #  have different permissions
         if not agent_conf.cache_directory():
@@ -112,6 +145,14 @@ class Agent(BaseAgent):
         old_task_deadline = int(time.time()) + self.check_interval_seconds ####oldtask deadline from current time?
         task_manager = None
 
+        ##
+        # One pooled transport per run so all pScheduler requests reuse connections
+        if self.transport:
+            self.transport.close()
+        self.transport = HttpTransport(family_cache=self.family_cache)
+        #participant counts may change with pscheduler upgrades, so only trust them for a run
+        self.participants_cache = ParticipantsCache()
+
         
         try:
             task_manager = TaskManager(
@@ -124,11 +165,20 @@ class Agent(BaseAgent):
                 new_task_min_runs=agent_conf.task_min_runs(),
                 old_task_deadline=old_task_deadline,
                 task_renewal_fudge_factor=agent_conf.task_renewal_fudge_factor(),
+                renewal_window=self.task_renewal_window_seconds,
+                renewal_slices=agent_conf.task_renewal_slices() or 1,
                 bind_map=agent_conf.pscheduler_bind_map(),
                 lead_address_map={}, #\%pscheduler_addr_map,
                 debug=self.debug,
                 logger=self.transaction_logger,
-                agent_hostname=os.uname().nodename
+                agent_hostname=os.uname().nodename,
+                transport=self.transport,
+                capability_cache=self.capability_cache,
+                use_asyncio=bool(agent_conf.pscheduler_use_asyncio()),
+                list_rate=agent_conf.pscheduler_list_rate(),
+                lead_rate=agent_conf.pscheduler_lead_rate(),
+                mutate_rate=agent_conf.pscheduler_mutate_rate(),
+                rate_burst=agent_conf.pscheduler_rate_burst() or 10
             )
             task_manager.logf.guid = self.logf.guid # make logging guids consistent'''
         except Exception as e:
@@ -164,50 +214,96 @@ class Agent(BaseAgent):
             
             self.logf.global_context['task_name'] = task_name
 
-            tg = TaskGenerator(
-                psconfig=psconfig,
-                pscheduler_url=self.pscheduler_url,
-                task_name=task_name,
-                match_addresses=self.match_addresses,
-                default_archives=self.default_archives,
-                use_psconfig_archives=configure_archives,
-                bind_map=agent_conf.pscheduler_bind_map()
-            )
+            tg = self._task_generator(psconfig, task_name, agent_conf, configure_archives)
 
             if not tg.start():
                 self.logger.error(self.logf.format("Error initializing task iterator: " + str(tg.error)))
                 return
 
+            #participant counts pscheduler has to be asked for are looked up together, the
+            # pairs that need them are expanded again once they are cached
+            participant_specs = {}
+            pending_pairs = []
+            if self.participants_cache:
+                tg.defer_participants(participant_specs)
+
             #pair = []
             #while pair := tg.next(): ########################needs python>=3.8
             while tg.next():
-
-                #check for errors expanding task
-                if tg.error:
-                    self.logger.error(tg.error)
+                #expansion errors may come from the placeholder count, so wait for the real one
+                if tg.participants_pending:
+                    pending_pairs.append(tg.pair())
+                    if len(pending_pairs) >= self.participants_batch_size:
+                        self._add_pending_pairs(tg, participant_specs, pending_pairs)
                     continue
-                #build pscheduler
-                psc_task = tg.pscheduler_task()
-
-                if not psc_task:
-                    self.logger.error(self.logf.format("Error converting task to pscheduler: " + str(tg.error)))
-                    continue
-
-                self.task_manager.add_task(task=psc_task)
-                #log task to task log. Do here because even if was not added, want record that
-                # it is a task that this host manages
-                self.task_logger.info(self.logf.format_task(psc_task))
+                self._add_task(tg)
+            self._add_pending_pairs(tg, participant_specs, pending_pairs)
             tg.stop()
             
         
         self.logger.debug(self.logf.format('Successfully processed task.'))
     
+    def _add_pending_pairs(self, tg, participant_specs, pending_pairs):
+        ##
+        # Looks up the participant counts recorded while walking a task, then expands and
+        # adds the pairs that were waiting on them. Empties both.
+        if not pending_pairs:
+            return
+        errors = self.participants_cache.prefetch(self.pscheduler_url + '/tests', participant_specs, transport=self.transport)
+        for error in errors.values():
+            self.logger.debug(self.logf.format("Unable to prefetch number of participants: {}".format(error)))
+        participant_specs.clear()
+
+        #anything the prefetch couldn't get is looked up one at a time like before
+        tg.defer_participants(None)
+        for pair in pending_pairs:
+            tg.expand(pair)
+            self._add_task(tg)
+        del pending_pairs[:]
+        tg.defer_participants(participant_specs)
+
+    def _add_task(self, tg):
+        #check for errors expanding task
+        if tg.error:
+            self.logger.error(tg.error)
+            return
+        #build pscheduler
+        psc_task = tg.pscheduler_task()
+
+        if not psc_task:
+            self.logger.error(self.logf.format("Error converting task to pscheduler: " + str(tg.error)))
+            return
+
+        self.task_manager.add_task(task=psc_task)
+        #log task to task log. Do here because even if was not added, want record that
+        # it is a task that this host manages
+        self.task_logger.info(self.logf.format_task(psc_task))
+
+    def _task_generator(self, psconfig, task_name, agent_conf, configure_archives):
+        return TaskGenerator(
+            psconfig=psconfig,
+            pscheduler_url=self.pscheduler_url,
+            task_name=task_name,
+            match_addresses=self.match_addresses,
+            default_archives=self.default_archives,
+            use_psconfig_archives=configure_archives,
+            bind_map=agent_conf.pscheduler_bind_map(),
+            transport=self.transport,
+            participants_cache=self.participants_cache
+        )
+
     def _run_end(self, agent_conf):
         task_manager = self.task_manager
 
         ##
-        #commit tasks
-        task_manager.commit()
+        #commit tasks, leaving what doesn't fit in the budget (by default before the next run) for that run
+        if self.commit_budget_seconds is None:
+            commit_budget = max(self.min_commit_budget, task_manager.old_task_deadline - int(time.time()))
+        elif self.commit_budget_seconds:
+            commit_budget = self.commit_budget_seconds
+        else:
+            commit_budget = None
+        task_manager.commit(budget=commit_budget)
 
         ##
         #Log results
@@ -220,9 +316,26 @@ class Agent(BaseAgent):
         for added_task in task_manager.added_tasks:
             self.logger.debug(self.logf.format("Created task " + str(added_task.uuid) + " on server " + str(added_task.url)))
         
+        if task_manager.deferred_tasks:
+            self.logger.info(self.logf.format("Deferred " + str(len(task_manager.deferred_tasks)) + " new tasks to the next run", {"commit_budget": commit_budget}))
+
         if task_manager.added_tasks or task_manager.deleted_tasks:
             self.logger.info(self.logf.format("Added " + str(len(task_manager.added_tasks)) + " new tasks, and deleted " + str(len(task_manager.deleted_tasks)) + " old tasks"))
 
+        ##
+        #Log connection reuse and release pooled connections until next run
+        pool_stats = task_manager.transport_stats()
+        self.logger.debug(self.logf.format("pScheduler connection pool statistics", {"pool_stats": pool_stats}))
+        lead_cache_stats = task_manager.lead_cache_stats()
+        self.logger.debug(self.logf.format("pScheduler lead cache statistics", {"lead_cache_stats": lead_cache_stats}))
+        latency_stats = task_manager.latency_stats()
+        self.logger.debug(self.logf.format("pScheduler request latency statistics", {"latency_stats": latency_stats}))
+        rate_limit_stats = task_manager.rate_limit_stats()
+        self.logger.debug(self.logf.format("pScheduler rate limit statistics", {"rate_limit_stats": rate_limit_stats}))
+        post_failure_stats = task_manager.post_failure_stats()
+        self.logger.debug(self.logf.format("pScheduler post failure cache statistics", {"post_failure_stats": post_failure_stats}))
+        self.transport.close()
+
     
     def will_retry_pscheduler(self):
 
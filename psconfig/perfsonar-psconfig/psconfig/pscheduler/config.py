@@ -12,6 +12,30 @@ class Config(BaseAgentNode):
             value is the local address to use for binding'''
         return self._field_anyobj('pscheduler-bind-map', val)
     
+    def pscheduler_use_asyncio(self, val=None):
+        '''Sets/gets whether task lists are fetched from pscheduler leads with the asyncio client'''
+        return self._field_bool('pscheduler-use-asyncio', val)
+    
+    def pscheduler_list_rate(self, val=None):
+        '''Sets/gets the requests per second allowed to each lead for listing tasks. 0 or unset is unlimited.'''
+        return self._field_numbernull('pscheduler-list-rate', val)
+    
+    def pscheduler_lead_rate(self, val=None):
+        '''Sets/gets the lead lookups per second allowed to each pscheduler server. 0 or unset is unlimited.'''
+        return self._field_numbernull('pscheduler-lead-rate', val)
+    
+    def pscheduler_mutate_rate(self, val=None):
+        '''Sets/gets the task creations and deletions per second allowed to each lead. 0 or unset is unlimited.'''
+        return self._field_numbernull('pscheduler-mutate-rate', val)
+    
+    def pscheduler_rate_burst(self, val=None):
+        '''Sets/gets the number of requests that may be sent at once before the rate limits apply'''
+        return self._field_cardinal('pscheduler-rate-burst', val)
+    
+    def pscheduler_commit_budget(self, val=None):
+        '''Sets/gets ISO8601 duration creating tasks may take before the rest are deferred to the next run. PT0S means no limit.'''
+        return self._field_duration('pscheduler-commit-budget', val)
+    
     def pscheduler_fail_attempts(self, val=None):
         '''The number of times to try to connect to pscheduler assist server before giving up'''
         return self._field_cardinal('pscheduler-fail-attempts', val)
@@ -48,6 +72,16 @@ class Config(BaseAgentNode):
     def task_renewal_fudge_factor(self, val=None):
         '''The percentage of time before expiration to renew a task.'''
         return self._field_probability('task-renewal-fudge-factor', val)
+    
+    def task_renewal_window(self, val=None):
+        '''The period of time over which expirations and renewals of tasks are spread.
+        Formatted as IS8601 duration.'''
+        return self._field_duration('task-renewal-window', val)
+    
+    def task_renewal_slices(self, val=None):
+        '''The number of slices tasks are split into for rolling renewal. Each run renews
+        tasks of one slice ahead of time.'''
+        return self._field_cardinal('task-renewal-slices', val)
         
     def schema(self):
         '''Returns the JSON schema for this config'''
@@ -40,6 +40,30 @@ class Schema(object):
                     "$ref": "#/pSConfig/AddressMap",
                     "description": "Maps a remote pscheduler address to the local address to use when trying to communicate with aforementioned remote address. Remote address is key and local address is value. Special key _default is used if no address matches. If no _default and no remote address matches a key then uses local routing table."
                 },
+                "pscheduler-use-asyncio": {
+                    "type": "boolean",
+                    "description": "Boolean indicating that task lists should be fetched from pScheduler leads with the asyncio client, which keeps requests to all leads in flight from a single thread. Requires aiohttp, the agent falls back to threads if it is not installed. Default is false."
+                },
+                "pscheduler-list-rate": {
+                    "$ref": "#/pSConfig/RequestRate",
+                    "description": "Maximum number of requests per second sent to each pScheduler lead when listing its tasks. Default is 0 (unlimited)."
+                },
+                "pscheduler-lead-rate": {
+                    "$ref": "#/pSConfig/RequestRate",
+                    "description": "Maximum number of requests per second sent to each pScheduler server when looking up the lead of a task. Default is 0 (unlimited)."
+                },
+                "pscheduler-mutate-rate": {
+                    "$ref": "#/pSConfig/RequestRate",
+                    "description": "Maximum number of requests per second sent to each pScheduler lead when creating and deleting tasks. Default is 0 (unlimited). A limit of 10 keeps a large configuration change from overloading a lead, but creating 2000 tasks then takes at least 200 seconds."
+                },
+                "pscheduler-rate-burst": {
+                    "$ref": "#/pSConfig/Cardinal",
+                    "description": "Number of requests of each kind that may be sent to a pScheduler lead at once before pscheduler-list-rate, pscheduler-lead-rate and pscheduler-mutate-rate apply. Only used when one of those is set. Default is 10."
+                },
+                "pscheduler-commit-budget": {
+                    "$ref": "#/pSConfig/Duration",
+                    "description": "ISO8601 indicating how long the agent may spend creating tasks each run. Tasks are created most urgent first and those not started in time are deferred to the next run. Default is the time left until the next run, but at least 1 minute. Set to PT0S to create every task in the same run however long it takes."
+                },
                 "include-directory": {
                     "type": "string",
                     "description": "Directory with local pSConfig files to be processed. Default is /etc/psconfig/pscheduler.d"
@@ -84,6 +108,14 @@ class Schema(object):
                     "$ref": "#/pSConfig/Probability",
                     "description": "The percentage of time before a task expires that a new task will be created. Default is 25% (specified as .25)"
                 },
+                "task-renewal-window": {
+                    "$ref": "#/pSConfig/Duration",
+                    "description": "ISO8601 indicating the period of time over which expirations and renewals of tasks are spread, so tasks created at the same time are not all renewed at the same time. Each task is given a fixed offset within the window based on its checksum: the first run of a new repeating task is delayed by up to the window (at most one repeat interval), its expiration is extended by up to the window and it may be renewed up to the window early. Default is PT0S (disabled). A window of task-min-ttl times task-renewal-fudge-factor spreads renewals across the whole renewal period."
+                },
+                "task-renewal-slices": {
+                    "$ref": "#/pSConfig/Cardinal",
+                    "description": "The number of slices tasks are split into by checksum for rolling renewal. Each run renews the tasks of one slice far enough ahead to last until the slice's next turn, so each run does about 1/N of the renewal work. Tasks in other slices are only renewed if they would otherwise expire before the run after next. Default is 1 (every task is renewed when it gets within task-renewal-fudge-factor of expiring)."
+                },
                 "disable-cache": {
                     "type": "boolean",
                     "description": "Boolean indicating that if a template cannot be accessed or is invalid, a cached version should NOT be used if exists. The cache prevents inaccessible or invalid templates from causing tasks to be deleted immediately. Items in cache expire, so it will only protect tasks from deletion while cache entry is valid. Default is false."
@@ -177,6 +209,10 @@ class Schema(object):
                     "minimum": 0.0,
                     "maximum": 1.0
                 },
+                "RequestRate": {
+                    "type": "number",
+                    "minimum": 0
+                },
                 "RemoteSpecification": {
                     "type": "object",
                     "properties": {
@@ -36,6 +36,7 @@ setup(
                       'pyinotify',
                       'dnspython==2.2.1',
                       "jinja2"],
+    extras_require={'async': ['aiohttp']},
 
     include_package_data=True,
     package_data={},
@@ -0,0 +1,70 @@
+'''
+Stub pScheduler servers shared by the tests that talk to pScheduler over HTTP
+'''
+
+from unittest import TestCase
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import json
+import threading
+
+from psconfig.client.transport import HttpTransport
+
+class StubHandler(BaseHTTPRequestHandler):
+    '''Base for stub pScheduler handlers, keeps connections alive and doesn't log requests'''
+    protocol_version = 'HTTP/1.1'
+
+    def send_body(self, body, status=200, content_type='application/json'):
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        self.send_response(status)
+        if content_type:
+            self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, obj, status=200):
+        self.send_body(json.dumps(obj), status)
+
+    def base_url(self):
+        return 'http://{}:{}/pscheduler'.format(*self.server.server_address)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_stub_server(test_case, handler, request_queue_size=None, **attrs):
+    '''
+    Serves handler on a free port of 127.0.0.1 from a daemon thread until test_case is
+    cleaned up. attrs are set on the server for the handler to use. The pScheduler API
+    url of the server is in its url attribute.
+    '''
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler, bind_and_activate=False)
+    server.daemon_threads = True
+    if request_queue_size:
+        server.request_queue_size = request_queue_size
+    server.server_bind()
+    server.server_activate()
+    for name, value in attrs.items():
+        setattr(server, name, value)
+    server.url = 'http://127.0.0.1:{}/pscheduler'.format(server.server_port)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    test_case.addCleanup(server.server_close)
+    test_case.addCleanup(server.shutdown)
+    return server
+
+class StubServerTestCase(TestCase):
+    '''
+    Starts a stub server for handler before each test. The server is in server, its
+    pScheduler API url in url and an HttpTransport for talking to it in transport.
+    '''
+    handler = StubHandler
+
+    def server_attrs(self):
+        '''Attributes set on the server before it starts, override to give each test its own state'''
+        return {}
+
+    def setUp(self) -> None:
+        self.server = start_stub_server(self, self.handler, **self.server_attrs())
+        self.url = self.server.url
+        self.transport = HttpTransport()
+        self.addCleanup(self.transport.close)
@@ -0,0 +1,230 @@
+from unittest import IsolatedAsyncioTestCase, skipIf
+from urllib.parse import urlparse
+import asyncio
+import json
+import os
+import socket
+import tempfile
+import time
+
+from psconfig.client import async_transport
+from psconfig.client.async_transport import AsyncHttpTransport
+from psconfig.client.pscheduler.api_connect import ApiConnect
+from psconfig.client.pscheduler.async_api_connect import AsyncApiConnect
+from psconfig.client.pscheduler.async_task import AsyncTask
+from psconfig.client.pscheduler.capability_cache import CapabilityCache
+from psconfig.client.pscheduler.task_manager import TaskManager
+from stub_server import StubHandler, StubServerTestCase, start_stub_server
+
+TASK_UUIDS = ['00000000-0000-0000-0000-00000000000{}'.format(i) for i in range(4)]
+
+class StubPSchedulerHandler(StubHandler):
+    '''Stub pScheduler answering the calls made by the asyncio client'''
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        base = self.base_url()
+        if path == '/pscheduler/':
+            self.send_json('This is the pScheduler API server')
+        elif path == '/pscheduler/hostname':
+            self.send_json(self.client_address[0])
+        elif path in ['/pscheduler/tests', '/pscheduler/tools']:
+            self.send_json(['{}{}/{}'.format(base, path[len('/pscheduler'):], name) for name in ['latency', 'rtt']])
+        elif path.startswith('/pscheduler/tests/') and path.count('/') == 3:
+            self.send_json({'name': path.rsplit('/', 1)[-1], 'scheduling-class': 'background'})
+        elif path.startswith('/pscheduler/tools/'):
+            self.send_json({'name': path.rsplit('/', 1)[-1], 'tests': ['latency']})
+        elif path == '/pscheduler/tasks':
+            #only half of the tasks include the detail
+            tasks = []
+            for i, task_uuid in enumerate(TASK_UUIDS):
+                href = '{}/tasks/{}'.format(base, task_uuid)
+                if i % 2:
+                    tasks.append({'href': href})
+                else:
+                    tasks.append({'test': {'type': 'latency', 'spec': {}}, 'detail': {'href': href, 'enabled': True}})
+            if getattr(self.server, 'truncate_tasks', False):
+                #connection drops halfway through the list
+                body = json.dumps(tasks).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body[:len(body) // 2])
+                self.close_connection = True
+                return
+            self.send_json(tasks)
+        elif path.startswith('/pscheduler/tasks/') and path.endswith('/runs'):
+            self.send_json(['{}{}/{}'.format(base, path[len('/pscheduler'):], run_uuid) for run_uuid in TASK_UUIDS[1:]])
+        elif '/runs/' in path:
+            self.send_json({'state': 'finished', 'href': path, 'start-time': '2026-01-01T00:00:0{}Z'.format(path[-1])})
+        elif path.startswith('/pscheduler/tasks/'):
+            self.send_json({'test': {'type': 'latency', 'spec': {}}, 'detail': {'href': path, 'enabled': True}})
+        elif path == '/pscheduler/tests/latency/participants':
+            self.send_json({'participants': [None]})
+        else:
+            self.send_json('Not found', status=404)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        json.loads(self.rfile.read(length))
+        self.send_json('{}/tasks/{}'.format(self.base_url(), TASK_UUIDS[0]))
+
+    def do_DELETE(self):
+        self.send_body('Deleted', content_type=None)
+
+@skipIf(async_transport.aiohttp is None, "aiohttp not installed")
+class TestAsyncApiConnect(IsolatedAsyncioTestCase):
+
+    def setUp(self) -> None:
+        self.server = start_stub_server(self, StubPSchedulerHandler, request_queue_size=1024)
+        self.url = self.server.url
+
+    async def asyncSetUp(self):
+        self.transport = AsyncHttpTransport(limit=100)
+
+    async def asyncTearDown(self):
+        await self.transport.close()
+
+    async def test_concurrent_hostnames(self):
+        bind_addresses = ['127.0.0.{}'.format(i % 4 + 1) for i in range(300)]
+        clients = [AsyncApiConnect(url=self.url, bind_address=b, transport=self.transport) for b in bind_addresses]
+        hostnames = await asyncio.gather(*[c.get_hostname() for c in clients])
+        self.assertEqual(bind_addresses, hostnames)
+        self.assertEqual([''] * len(clients), [c.error for c in clients])
+
+    async def test_get_tasks(self):
+        client = AsyncApiConnect(url=self.url, transport=self.transport)
+        tasks = await client.get_tasks()
+        self.assertFalse(client.error)
+        self.assertEqual(sorted(TASK_UUIDS), sorted(t.uuid for t in tasks))
+        self.assertTrue(all(isinstance(t, AsyncTask) for t in tasks))
+
+        #same parsing as the synchronous client
+        sync_tasks = ApiConnect(url=self.url).get_tasks()
+        self.assertEqual(sorted(t.checksum() for t in sync_tasks), sorted(t.checksum() for t in tasks))
+
+    async def test_task_calls(self):
+        task = AsyncTask(url=self.url, transport=self.transport)
+        task.test_type('latency')
+        task.test_spec({'dest': '127.0.0.1'})
+        #a lead of None means the local pScheduler, so the url is kept
+        self.assertIsNone(await task.refresh_lead(scheme='http'))
+        self.assertEqual(self.url, task.url)
+        self.assertFalse(task.error)
+
+        self.assertEqual(0, await task.post_task())
+        self.assertEqual(TASK_UUIDS[0], task.uuid)
+        runs = await task.runs()
+        self.assertEqual(3, len(runs))
+        self.assertEqual(0, await task.delete_task())
+
+    async def test_connection_error(self):
+        #nothing listens on a port right after it is released
+        with socket.socket() as s:
+            s.bind(('127.0.0.1', 0))
+            port = s.getsockname()[1]
+        client = AsyncApiConnect(url='http://127.0.0.1:{}/pscheduler'.format(port), transport=self.transport)
+        self.assertIsNone(await client.get_hostname())
+        self.assertTrue(client.error)
+
+    async def test_capabilities(self):
+        cache = CapabilityCache()
+        client = AsyncApiConnect(url=self.url, transport=self.transport, capability_cache=cache)
+        self.assertTrue(await client.ping())
+        self.assertEqual(['latency', 'rtt'], [t.name() for t in await client.get_tests()])
+        self.assertEqual(['latency', 'rtt'], [t.name() for t in await client.get_tools()])
+        self.assertEqual('background', (await client.get_test('latency')).scheduling_class())
+        self.assertFalse(client.error)
+
+        #answered from the cache the second time, same as the synchronous client
+        self.assertEqual('127.0.0.1', await client.get_hostname())
+        self.assertFalse(client.cache_hit)
+        self.assertEqual('127.0.0.1', await client.get_hostname())
+        self.assertTrue(client.cache_hit)
+        sync_tests = ApiConnect(url=self.url).get_tests()
+        self.assertEqual([t.data for t in sync_tests], [t.data for t in await client.get_tests()])
+
+    async def test_iter_tasks(self):
+        client = AsyncApiConnect(url=self.url, transport=self.transport)
+        streamed = [task async for task in client.iter_tasks(chunk_size=16)]
+        self.assertFalse(client.error)
+        self.assertFalse(client.listing_failed)
+        self.assertTrue(all(isinstance(t, AsyncTask) for t in streamed))
+        listed = await client.get_tasks()
+        self.assertEqual(sorted(t.checksum() for t in listed), sorted(t.checksum() for t in streamed))
+
+    async def test_iter_tasks_truncated(self):
+        self.server.truncate_tasks = True
+        client = AsyncApiConnect(url=self.url, transport=self.transport)
+        streamed = [task async for task in client.iter_tasks(chunk_size=16)]
+        self.assertTrue(len(streamed) < len(TASK_UUIDS))
+        self.assertTrue(client.error)
+        self.assertTrue(client.listing_failed)
+
+    async def test_iter_run_records(self):
+        task = AsyncTask(url=self.url, uuid=TASK_UUIDS[0], transport=self.transport)
+        records = [record async for record in task.iter_run_records(workers=1, chunk_size=16)]
+        self.assertFalse(task.error)
+        self.assertEqual([r.uuid for r in await task.run_records()], [r.uuid for r in records])
+        #stopping early is fine
+        async for record in task.iter_run_records():
+            break
+        self.assertFalse(task.error)
+
+    async def test_run_records(self):
+        task = AsyncTask(url=self.url, uuid=TASK_UUIDS[0], transport=self.transport)
+        records = await task.run_records()
+        self.assertEqual(TASK_UUIDS[1:], [r.uuid for r in records])
+        self.assertEqual(['finished'] * 3, [r.state for r in records])
+        #filtered by start time even though the server doesn't
+        records = await task.run_records(start=records[1].start_ts)
+        self.assertEqual(TASK_UUIDS[2:], [r.uuid for r in records])
+
+@skipIf(async_transport.aiohttp is None, "aiohttp not installed")
+class TestAsyncTaskManager(StubServerTestCase):
+    handler = StubPSchedulerHandler
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self) -> None:
+        self.tmpdir.cleanup()
+
+    def _task_manager(self, use_asyncio, stream_tasks=True):
+        return TaskManager(
+            pscheduler_url=self.url,
+            tracker_file=os.path.join(self.tmpdir.name, 'tracker.json'),
+            client_uuid_file=os.path.join(self.tmpdir.name, 'client-uuid'),
+            reference_label='psconfig',
+            user_agent='psconfig-pscheduler-agent',
+            new_task_min_ttl=86400,
+            new_task_min_runs=2,
+            old_task_deadline=int(time.time()) + 3600,
+            use_asyncio=use_asyncio,
+            stream_tasks=stream_tasks,
+            logger=None
+        )
+
+    def _uuids(self, task_manager):
+        return sorted(uuid for cmap in task_manager.existing_task_map.values() for tmap in cmap.values() for uuid in tmap)
+
+    def test_list_leads(self):
+        task_manager = self._task_manager(True)
+        self.assertEqual([], task_manager.errors)
+        self.assertEqual(sorted(TASK_UUIDS), self._uuids(task_manager))
+        #same tasks as listing with threads or reading the list whole
+        self.assertEqual(self._uuids(self._task_manager(False)), self._uuids(task_manager))
+        self.assertEqual(self._uuids(self._task_manager(True, stream_tasks=False)), self._uuids(task_manager))
+        #existing tasks are deleted with the synchronous transport
+        for cmap in task_manager.existing_task_map.values():
+            for tmap in cmap.values():
+                for record in tmap.values():
+                    self.assertIs(task_manager.transport, record.transport)
+
+    def test_truncated_listing(self):
+        self.server.truncate_tasks = True
+        task_manager = self._task_manager(True)
+        self.assertEqual({}, task_manager.existing_task_map)
+        self.assertEqual(1, task_manager.leads[self.url]['failures'])
@@ -0,0 +1,94 @@
+from urllib.parse import urlparse
+import threading
+import time
+
+from psconfig.client.pscheduler.api_connect import ApiConnect
+from psconfig.client.pscheduler.capability_cache import CapabilityCache
+from stub_server import StubHandler, StubServerTestCase
+
+TESTS = ['latency', 'throughput', 'trace', 'rtt']
+
+class StubMetadataHandler(StubHandler):
+    '''Stub pScheduler serving test metadata that counts requests by path'''
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        base = self.base_url()
+        with self.server.lock:
+            self.server.requests[path] = self.server.requests.get(path, 0) + 1
+        if path == '/pscheduler/tests':
+            obj = ['{}/tests/{}'.format(base, t) for t in TESTS]
+        elif path.startswith('/pscheduler/tests/') and path.endswith('/spec/is-valid'):
+            obj = {'valid': True}
+        elif path.startswith('/pscheduler/tests/'):
+            #only answers once every test is being fetched at the same time
+            try:
+                self.server.barrier.wait()
+                obj = {'name': path.split('/')[-1]}
+            except threading.BrokenBarrierError:
+                obj = None
+        elif path == '/pscheduler/hostname':
+            obj = 'lead.example.net'
+        elif path == '/pscheduler/':
+            obj = 'This is the pScheduler API server'
+        else:
+            obj = None
+        self.send_json(obj, 200 if obj else 404)
+
+class TestCapabilityCache(StubServerTestCase):
+    handler = StubMetadataHandler
+
+    def server_attrs(self):
+        return {
+            'requests': {},
+            'lock': threading.Lock(),
+            'barrier': threading.Barrier(len(TESTS), timeout=5)
+        }
+
+    def test_ttl(self):
+        cache = CapabilityCache(ttl=60)
+        cache.set('k', {'a': 1})
+        value = cache.get('k')
+        self.assertEqual({'a': 1}, value)
+        #callers get their own copy
+        value['a'] = 2
+        self.assertEqual({'a': 1}, cache.get('k'))
+        cache._entries['k'] = (time.time() - 120, cache._entries['k'][1])
+        self.assertIs(CapabilityCache.MISSING, cache.get('k', CapabilityCache.MISSING))
+
+    def test_get_tests(self):
+        cache = CapabilityCache()
+        client = ApiConnect(url=self.url, capability_cache=cache)
+        #details are fetched concurrently, the stub fails them otherwise
+        tests = client.get_tests()
+        self.assertFalse(client.error)
+        self.assertEqual(TESTS, [t.uuid for t in tests])
+        self.assertEqual(TESTS, [t.data['name'] for t in tests])
+
+        #second listing from another client is answered from the cache
+        tests = ApiConnect(url=self.url, capability_cache=cache).get_tests()
+        self.assertEqual(TESTS, [t.uuid for t in tests])
+        self.assertEqual(1, self.server.requests['/pscheduler/tests'])
+        self.assertEqual(1, self.server.requests['/pscheduler/tests/latency'])
+
+    def test_lookups(self):
+        cache = CapabilityCache()
+        client = ApiConnect(url=self.url, capability_cache=cache)
+        for i in range(3):
+            self.assertEqual('lead.example.net', client.get_hostname())
+            self.assertEqual({'valid': True}, client.get_test_spec_is_valid('latency', {'dest': 'a'}))
+        self.assertTrue(client.cache_hit)
+        self.assertEqual({'valid': True}, client.get_test_spec_is_valid('latency', {'dest': 'b'}))
+        self.assertFalse(client.cache_hit)
+        self.assertEqual(1, self.server.requests['/pscheduler/hostname'])
+        self.assertEqual(2, self.server.requests['/pscheduler/tests/latency/spec/is-valid'])
+
+    def test_ping_not_cached(self):
+        client = ApiConnect(url=self.url, capability_cache=CapabilityCache())
+        self.assertTrue(client.ping())
+        self.assertTrue(client.ping())
+        self.assertEqual(2, self.server.requests['/pscheduler/'])
+        #nothing listens on port 1
+        client = ApiConnect(url='http://127.0.0.1:1/pscheduler', capability_cache=CapabilityCache())
+        self.assertFalse(client.ping())
+        self.assertTrue(client.error)
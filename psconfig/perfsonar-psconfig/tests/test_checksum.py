@@ -0,0 +1,139 @@
+from unittest import TestCase, mock, skipUnless
+from base64 import b64encode
+from hashlib import md5
+import copy
+import json
+import os
+import time
+
+from psconfig.client.pscheduler.archive import Archive
+from psconfig.client.pscheduler.task import Task
+
+def reference_task_checksum(data):
+    '''Checksum as calculated before it was cached, used to make sure the value did not change'''
+    data_copy = copy.deepcopy(data)
+    data_copy['archives'] = data_copy.get('archives', [])
+    data_copy['schedule'] = data_copy.get('schedule', {})
+    data_copy['schema'] = ''
+    data_copy['test']['spec']['schema'] = ''
+    data_copy['tool'] = ''
+    data_copy['href'] = ''
+    data_copy['schedule']['start'] = ''
+    data_copy['schedule']['until'] = ''
+    data_copy['detail'] = {}
+    for archive in data_copy['archives']:
+        for datum in archive['data'].keys():
+            if datum.startswith('_'):
+                archive['data'][datum] = ''
+    for tparam in data_copy['test']['spec']:
+        if tparam.startswith('_'):
+            data_copy['test']['spec'][tparam] = ''
+    data_copy_canonical = json.dumps(data_copy, sort_keys=True, separators=(',',':')).encode('utf-8')
+    return b64encode(md5(data_copy_canonical).digest()).decode().rstrip('=')
+
+def build_task(i):
+    task = Task(url='https://localhost/pscheduler')
+    task.test_type('throughput')
+    task.test_spec({'source': 'host{}.example.net'.format(i), 'dest': 'host{}.example.net'.format(i + 1), 'duration': 'PT30S', '_key': 'secret'})
+    task.schedule_repeat('PT4H')
+    task.schedule_start('2026-01-01T00:00:00Z')
+    task.add_archive(Archive(name='esmond', data={'url': 'https://archive.example.net/', '_auth-token': 'secret'}))
+    task.reference_param('psconfig', {'created-by': {'uuid': 'abc', 'user-agent': 'psconfig-pscheduler-agent'}})
+    task.detail({'enabled': True, 'runs': i})
+    task.tool('iperf3')
+    return task
+
+class TestTaskChecksum(TestCase):
+
+    def test_matches_reference(self):
+        for i in range(20):
+            task = build_task(i)
+            self.assertEqual(reference_task_checksum(task.data), task.checksum())
+
+    def test_does_not_modify_data(self):
+        task = build_task(1)
+        before = copy.deepcopy(task.data)
+        task.checksum()
+        self.assertEqual(before, task.data)
+
+    def test_setters_invalidate(self):
+        task = build_task(1)
+        checksum = task.checksum()
+        task.test_spec_param('duration', 'PT10S')
+        self.assertNotEqual(checksum, task.checksum())
+        self.assertEqual(reference_task_checksum(task.data), task.checksum())
+        checksum = task.checksum()
+        task.lead_bind('10.0.0.1')
+        self.assertNotEqual(checksum, task.checksum())
+        checksum = task.checksum()
+        task.add_archive(Archive(name='http', data={'url': 'https://other.example.net/'}))
+        self.assertNotEqual(checksum, task.checksum())
+        checksum = task.checksum()
+        task.data = copy.deepcopy(build_task(2).data)
+        self.assertNotEqual(checksum, task.checksum())
+
+    def test_ignored_fields(self):
+        task = build_task(1)
+        checksum = task.checksum()
+        task.schedule_start('2026-06-01T00:00:00Z')
+        task.schedule_until('2026-06-02T00:00:00Z')
+        task.tool('nuttcp')
+        task.schema(2)
+        self.assertEqual(checksum, task.checksum())
+        self.assertEqual(reference_task_checksum(task.data), checksum)
+
+    def test_cached(self):
+        task = build_task(1)
+        with mock.patch('psconfig.client.pscheduler.task.md5', wraps=md5) as md5_mock:
+            checksum = task.checksum()
+            self.assertEqual(checksum, task.checksum())
+            self.assertEqual(1, md5_mock.call_count)
+            #changing the task invalidates the cached value
+            task.test_spec_param('duration', 'PT10S')
+            self.assertNotEqual(checksum, task.checksum())
+            self.assertEqual(2, md5_mock.call_count)
+
+    @skipUnless(os.environ.get('PSCONFIG_BENCHMARK'), 'set PSCONFIG_BENCHMARK=1 to run benchmarks')
+    def test_benchmark_10k_tasks(self):
+        tasks = [build_task(i) for i in range(10000)]
+        datas = [copy.deepcopy(t.data) for t in tasks]
+
+        start = time.perf_counter()
+        for data in datas:
+            reference_task_checksum(data)
+        reference_cost = (time.perf_counter() - start) / len(datas)
+
+        start = time.perf_counter()
+        for task in tasks:
+            task.checksum()
+        first_cost = (time.perf_counter() - start) / len(tasks)
+
+        start = time.perf_counter()
+        for task in tasks:
+            task.checksum()
+        cached_cost = (time.perf_counter() - start) / len(tasks)
+
+        costs = "per-task checksum cost at 10k tasks: deepcopy {:.1f}us, shallow {:.1f}us, cached {:.2f}us".format(
+            reference_cost * 1e6, first_cost * 1e6, cached_cost * 1e6)
+        self.assertLess(first_cost, reference_cost, costs)
+        self.assertLess(cached_cost, first_cost, costs)
+
+class TestArchiveChecksum(TestCase):
+
+    def test_checksums(self):
+        archive = Archive(name='esmond', ttl='PT1H', data={'url': 'https://archive.example.net/', '_auth-token': 'secret'})
+        public_checksum, private_checksum = archive.checksums()
+        self.assertEqual(public_checksum, archive.checksum())
+        self.assertEqual(private_checksum, archive.checksum(include_private=True))
+        self.assertNotEqual(public_checksum, private_checksum)
+        #changing a private field only changes the private checksum
+        archive.data_param('_auth-token', 'other')
+        self.assertEqual(public_checksum, archive.checksum())
+        self.assertNotEqual(private_checksum, archive.checksum(include_private=True))
+        archive.ttl = 'PT2H'
+        self.assertNotEqual(public_checksum, archive.checksum())
+
+    def test_no_private_fields(self):
+        archive = Archive(name='esmond', data={'url': 'https://archive.example.net/'})
+        public_checksum, private_checksum = archive.checksums()
+        self.assertEqual(public_checksum, private_checksum)
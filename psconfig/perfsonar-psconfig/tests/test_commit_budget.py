@@ -0,0 +1,109 @@
+from urllib.parse import urlparse
+import json
+import os
+import tempfile
+import time
+import uuid
+
+from psconfig.client.pscheduler.api_filters import ApiFilters
+from psconfig.client.pscheduler.task import Task
+from psconfig.client.pscheduler.task_manager import TaskManager
+from psconfig.client.pscheduler.task_record import TaskRecord
+from stub_server import StubHandler, StubServerTestCase
+
+class SlowLeadHandler(StubHandler):
+    '''Stub pScheduler lead that takes its time creating tasks'''
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path.endswith('/hostname'):
+            self.send_json('lead.example.net')
+        elif path.endswith('/participants'):
+            self.send_json({'participants': [None]})
+        else:
+            href = self.base_url() + '/tasks/00000000-0000-0000-0000-000000000000'
+            self.send_json([{'test': {'type': 'latency', 'spec': {}}, 'detail': {'href': href, 'enabled': False}}])
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        time.sleep(0.3)
+        self.send_json('{}/tasks/{}'.format(self.base_url(), uuid.uuid4()))
+
+class TestCommitBudget(StubServerTestCase):
+    handler = SlowLeadHandler
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.tracker_file = os.path.join(self.tmpdir.name, 'tracker.json')
+
+    def tearDown(self) -> None:
+        self.tmpdir.cleanup()
+
+    def _task_manager(self):
+        return TaskManager(
+            pscheduler_url=self.url,
+            tracker_file=self.tracker_file,
+            client_uuid_file=os.path.join(self.tmpdir.name, 'client-uuid'),
+            reference_label='psconfig',
+            user_agent='psconfig-pscheduler-agent',
+            new_task_min_ttl=86400,
+            new_task_min_runs=2,
+            old_task_deadline=int(time.time()) + 3600,
+            commit_workers=1,
+            logger=None
+        )
+
+    def _task(self, task_manager, dest, until=None):
+        ##
+        # Returns a new task, and if until is given an existing task for it that ends then
+        task = Task(url=self.url, data={'test': {'type': 'rtt', 'spec': {'dest': dest}}, 'schedule': {'repeat': 'PT1M'}})
+        if until:
+            #same reference add_task sets so the checksums match
+            created_by = dict(task_manager.created_by)
+            created_by['agent-hostname'] = task_manager.hostname
+            task.reference_param(task_manager.reference_label, {'created-by': created_by})
+            task_manager.existing_task_map[task.checksum()] = {'powstream': {str(uuid.uuid4()): TaskRecord(
+                url=self.url, filters=ApiFilters(), checksum=task.checksum(), tool='powstream', until_ts=until,
+                start_ts=int(time.time()) - 600, exclusive=False, multiresult=False, runs_started=1
+            )}}
+        return task
+
+    def test_urgent_first_rest_deferred(self):
+        now = int(time.time())
+        task_manager = self._task_manager()
+        later = self._task(task_manager, '10.0.0.1', until=now + 1200)
+        uncovered = self._task(task_manager, '10.0.0.2')
+        soon = self._task(task_manager, '10.0.0.3', until=now + 600)
+        for task in [later, uncovered, soon]:
+            task_manager.add_task(task=task)
+        self.assertEqual(3, len(task_manager.new_tasks))
+
+        #one worker and slow posts, so only the first task starts within the budget
+        task_manager.commit(budget=0.1)
+        self.assertEqual([uncovered], task_manager.added_tasks)
+        self.assertEqual([soon, later], task_manager.deferred_tasks)
+        self.assertEqual([], task_manager.errors)
+
+        with open(self.tracker_file) as f:
+            deferred = json.load(f)['deferred']
+        self.assertEqual({soon.checksum(), later.checksum()}, set(deferred))
+        self.assertEqual(1, deferred[soon.checksum()]['runs'])
+        since = deferred[soon.checksum()]['since']
+
+        #deferred again on the next run, still counting
+        task_manager = self._task_manager()
+        task_manager.add_task(task=self._task(task_manager, '10.0.0.3', until=now + 600))
+        task_manager.commit(budget=0)
+        with open(self.tracker_file) as f:
+            deferred = json.load(f)['deferred']
+        self.assertEqual(2, deferred[soon.checksum()]['runs'])
+        self.assertEqual(since, deferred[soon.checksum()]['since'])
+        self.assertNotIn(later.checksum(), deferred)
+
+    def test_no_budget(self):
+        task_manager = self._task_manager()
+        task_manager.add_task(task=self._task(task_manager, '10.0.0.1'))
+        task_manager.commit()
+        self.assertEqual(1, len(task_manager.added_tasks))
+        self.assertEqual([], task_manager.deferred_tasks)
@@ -0,0 +1,72 @@
+from unittest import TestCase, mock, skipUnless
+import os
+import time
+
+from psconfig.client.psconfig.config import Config
+from psconfig.client.psconfig.groups.base_group import BaseGroup
+from psconfig.client.psconfig.groups.base_p2p_group import BaseP2PGroup
+
+def build_config(a_count, b_count, **kwargs):
+    addresses = {'host{}'.format(i): {'address': '10.0.{}.{}'.format(i // 256, i % 256)} for i in range(a_count + b_count)}
+    group = {
+        'type': 'disjoint',
+        'a-addresses': [{'name': 'host{}'.format(i)} for i in range(a_count)],
+        'b-addresses': [{'name': 'host{}'.format(i)} for i in range(a_count, a_count + b_count)]
+    }
+    group.update(kwargs)
+    return Config(data={'addresses': addresses, 'groups': {'group': group}})
+
+class TestDisjointIteration(TestCase):
+
+    def _pairs(self, psconfig, limit=None):
+        ##
+        # Returns the selector names of each pair and the seconds it took
+        group = psconfig.group('group')
+        group.start(psconfig)
+        pairs = []
+        start = time.monotonic()
+        while limit is None or len(pairs) < limit:
+            indices = group._next_indices()
+            if not indices:
+                break
+            pairs.append((group._selectors[0][indices[0]].name(), group._selectors[1][indices[1]].name()))
+        elapsed = time.monotonic() - start
+        group.stop()
+        return pairs, elapsed
+
+    def _generic_pairs(self, psconfig, limit=None):
+        with mock.patch.object(BaseP2PGroup, '_next_indices', BaseGroup._next_indices):
+            return self._pairs(psconfig, limit)
+
+    def test_same_pairs(self):
+        a = [{'name': 'host0'}, {'name': 'host1'}, {'name': 'host2'}, {'name': 'host1'}]
+        b = [{'name': 'host3'}, {'name': 'host2'}, {'name': 'host4'}, {'name': 'host3'}, {'name': 'host5'}]
+        excludes = [
+            {'local-address': {'name': 'host0'}, 'target-addresses': [{'name': 'host4'}]},
+            {'local-address': {'name': 'host5'}, 'target-addresses': [{'name': 'host1'}, {'name': 'host9'}]}
+        ]
+        for kwargs in [{}, {'unidirectional': True}, {'excludes': excludes}, {'unidirectional': True, 'excludes': excludes}]:
+            psconfig = build_config(6, 0, **dict(kwargs, **{'a-addresses': a, 'b-addresses': b}))
+            pairs = self._pairs(psconfig)[0]
+            self.assertEqual(self._generic_pairs(psconfig)[0], pairs, kwargs)
+            self.assertEqual(len(set(pairs)), len(pairs))
+
+    def test_large_group(self):
+        psconfig = build_config(200, 2000)
+        pairs = self._pairs(psconfig)[0]
+        #every a with every b, then every b with every a
+        self.assertEqual(2 * 200 * 2000, len(pairs))
+        self.assertEqual(('host0', 'host200'), pairs[0])
+        self.assertEqual(('host2199', 'host199'), pairs[-1])
+        #the generic loop walks all 2200 rows of 2200 combinations, so only compare its first ten rows
+        sample = self._generic_pairs(psconfig, limit=10 * 2000)[0]
+        self.assertEqual(pairs[:len(sample)], sample)
+
+    @skipUnless(os.environ.get('PSCONFIG_BENCHMARK'), 'set PSCONFIG_BENCHMARK=1 to run benchmarks')
+    def test_benchmark(self):
+        psconfig = build_config(200, 2000)
+        pairs, elapsed = self._pairs(psconfig)
+        sample, generic_elapsed = self._generic_pairs(psconfig, limit=10 * 2000)
+        generic_estimate = generic_elapsed * 2200 / 10
+        self.assertLess(elapsed, generic_estimate, 'disjoint 200x2000: {} pairs in {:.2f}s, generic loop {:.2f}s for {} pairs (~{:.0f}s for all)'.format(
+            len(pairs), elapsed, generic_elapsed, len(sample), generic_estimate))
@@ -0,0 +1,117 @@
+from unittest import TestCase, mock
+
+from psconfig.client.psconfig.address_selectors.name_label import NameLabel
+from psconfig.client.psconfig.config import Config
+from psconfig.client.psconfig.groups.base_group import BaseGroup
+from psconfig.client.psconfig.groups.base_p2p_group import BaseP2PGroup
+from psconfig.client.psconfig.parsers.task_generator import TaskGenerator
+
+def build_config(group, scheduled_by=None):
+    ##
+    # Config with a mix of plain, labelled, remote, no-agent and disabled addresses
+    addresses = {}
+    for i in range(8):
+        addresses['host{}'.format(i)] = {'address': '10.0.0.{}'.format(i), 'host': 'host{}'.format(i)}
+    addresses['host1']['no-agent'] = True
+    addresses['host2']['labels'] = {'v6': {'address': 'fc00::2'}}
+    addresses['host3']['remote-addresses'] = {'host4': {'address': '192.168.0.3', 'labels': {'v6': {'address': 'fc00::3', 'no-agent': True}}}}
+    addresses['host5']['disabled'] = True
+    addresses['Host6'] = {'address': 'HOST6.example.net', 'host': 'nohost'}
+    hosts = {'host{}'.format(i): {} for i in range(8)}
+    hosts['host7']['no-agent'] = True
+    task = {'group': 'group', 'test': 'test'}
+    if scheduled_by is not None:
+        task['scheduled-by'] = scheduled_by
+    return Config(data={
+        'addresses': addresses,
+        'hosts': hosts,
+        'groups': {'group': group},
+        'tests': {'test': {'type': 'rtt', 'spec': {'source': '{% address[0] %}', 'dest': '{% address[1] %}'}}},
+        'tasks': {'task': task}
+    })
+
+def selectors(names, label=None):
+    return [dict({'name': name}, **({'label': label} if label else {})) for name in names]
+
+class TestGroupIndex(TestCase):
+
+    def _tasks(self, psconfig, match_addresses):
+        tg = TaskGenerator(psconfig=psconfig, task_name='task', match_addresses=match_addresses, use_psconfig_archives=False)
+        self.assertTrue(tg.start())
+        tasks = []
+        while tg.next():
+            tasks.append((tuple(a.address() for a in tg.addresses), tg.scheduled_by_address.address(), tg.error))
+        tg.stop()
+        return tasks
+
+    def assertSameTasks(self, group):
+        for scheduled_by in [None, 1]:
+            psconfig = build_config(group, scheduled_by)
+            for match in [[], ['10.0.0.0'], ['10.0.0.1'], ['10.0.0.3', '10.0.0.4'], ['host6.example.net'], ['10.0.0.7'], ['192.0.2.1']]:
+                tasks = self._tasks(psconfig, match)
+                #the generic loop over every combination
+                with mock.patch.object(BaseP2PGroup, '_next_indices', BaseGroup._next_indices):
+                    self.assertEqual(self._tasks(psconfig, match), tasks, (scheduled_by, match))
+
+    def test_mesh(self):
+        names = ['host{}'.format(i) for i in range(8)] + ['Host6']
+        self.assertSameTasks({'type': 'mesh', 'addresses': selectors(names)})
+        self.assertSameTasks({'type': 'mesh', 'addresses': selectors(names, 'v6')})
+        self.assertSameTasks({'type': 'mesh', 'addresses': selectors(names), 'excludes-self': 'disabled', 'excludes': [
+            {'local-address': {'name': 'host0'}, 'target-addresses': [{'name': 'host2'}, {'name': 'host1'}]}
+        ]})
+
+    def test_disjoint(self):
+        a_names = ['host0', 'host1', 'host3']
+        b_names = ['host2', 'host4', 'host5', 'Host6', 'host7', 'host0']
+        self.assertSameTasks({'type': 'disjoint', 'a-addresses': selectors(a_names), 'b-addresses': selectors(b_names)})
+        self.assertSameTasks({'type': 'disjoint', 'unidirectional': True, 'a-addresses': selectors(a_names), 'b-addresses': selectors(b_names + ['host1'])})
+
+    def test_skips_unmatched_pairs(self):
+        names = ['host{}'.format(i) for i in range(8)]
+        psconfig = build_config({'type': 'mesh', 'addresses': selectors(names)})
+        group = psconfig.group('group')
+        group.start(psconfig, match_addresses={'10.0.0.0': True}, scheduled_by=0)
+        pairs = []
+        while True:
+            addrs = group.next()
+            if not addrs:
+                break
+            pairs.append(tuple(a.address() for a in addrs))
+        group.stop()
+        #pairs scheduled by 10.0.0.0 plus those from addresses that may be no-agent and flip to it
+        self.assertEqual(
+            [('10.0.0.0', '10.0.0.{}'.format(i)) for i in range(1, 8)] + [('10.0.0.{}'.format(i), '10.0.0.0') for i in [1, 3, 7]],
+            pairs
+        )
+
+    def test_resolved_once(self):
+        names = ['host{}'.format(i) for i in range(8)]
+        for label in [None, 'v6']:
+            psconfig = build_config({'type': 'mesh', 'addresses': selectors(names, label)})
+
+            #select every selector and address for every pair like it used to
+            expected = []
+            group = psconfig.group('group')
+            for a_index in range(len(names)):
+                for b_index in range(len(names)):
+                    addr_sels = [group.address(a_index), group.address(b_index)]
+                    if not group.is_excluded_selectors(addr_sels):
+                        expected.append(group.select_addresses([addr_sel.select(psconfig) for addr_sel in addr_sels]))
+
+            group = psconfig.group('group')
+            with mock.patch.object(NameLabel, 'select', autospec=True, side_effect=NameLabel.select) as select:
+                group.start(psconfig)
+                self.assertEqual(len(names), select.call_count)
+                addresses = []
+                while True:
+                    addrs = group.next()
+                    if not addrs:
+                        break
+                    addresses.append(addrs)
+                group.stop()
+                self.assertEqual(len(names), select.call_count)
+
+            def describe(addrs):
+                return [(a.address(), a._parent_address, a._parent_no_agent, a._parent_disabled, a._parent_host_ref) for a in addrs]
+            self.assertEqual([describe(addrs) for addrs in expected if addrs], [describe(addrs) for addrs in addresses])
@@ -0,0 +1,151 @@
+from unittest import TestCase, mock
+import socket
+import time
+
+from psconfig.client.happy_eyeballs import FamilyCache, create_connection, sort_addresses
+from psconfig.client.transport import HttpTransport
+from psconfig.client.utils import Utils
+from stub_server import StubHandler, start_stub_server
+
+class HostnameHandler(StubHandler):
+
+    def do_GET(self):
+        self.send_json('lead.example.net')
+
+def stalled_ipv6_listener():
+    '''
+    Returns a listening socket on ::1 that never completes new connections, standing in for
+    a broken IPv6 route. With a backlog of 0 and one connection already queued, Linux drops
+    further SYNs.
+    '''
+    listener = socket.socket(socket.AF_INET6, socket.SOCK_STREAM)
+    listener.bind(('::1', 0))
+    listener.listen(0)
+    filler = socket.create_connection(('::1', listener.getsockname()[1]))
+    return listener, filler
+
+class RecordingSocket(socket.socket):
+    '''Socket that records when connections are attempted and sockets are closed'''
+
+    def __init__(self, events, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.events = events
+
+    def connect_ex(self, address):
+        self.events.append(('connect', self.family, time.monotonic()))
+        return super().connect_ex(address)
+
+    def close(self):
+        if self.fileno() != -1:
+            self.events.append(('close', self.family, time.monotonic()))
+        super().close()
+
+class RecordingSocketModule(object):
+    '''Stands in for the socket module in happy_eyeballs so its sockets are RecordingSockets'''
+
+    def __init__(self):
+        self.events = []
+
+    def socket(self, *args, **kwargs):
+        return RecordingSocket(self.events, *args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(socket, name)
+
+def ipv6_available():
+    try:
+        with socket.socket(socket.AF_INET6, socket.SOCK_STREAM) as s:
+            s.bind(('::1', 0))
+        return True
+    except OSError:
+        return False
+
+class TestSortAddresses(TestCase):
+
+    def test_interleave(self):
+        v6 = [(socket.AF_INET6, 0, 0, '', ('::{}'.format(i), 80, 0, 0)) for i in range(3)]
+        v4 = [(socket.AF_INET, 0, 0, '', ('10.0.0.{}'.format(i), 80)) for i in range(2)]
+        families = [a[0] for a in sort_addresses(v4 + v6)]
+        self.assertEqual([socket.AF_INET6, socket.AF_INET, socket.AF_INET6, socket.AF_INET, socket.AF_INET6], families)
+        families = [a[0] for a in sort_addresses(v6 + v4, socket.AF_INET)]
+        self.assertEqual([socket.AF_INET, socket.AF_INET6, socket.AF_INET, socket.AF_INET6, socket.AF_INET6], families)
+
+class TestHappyEyeballs(TestCase):
+
+    def setUp(self) -> None:
+        if not ipv6_available():
+            self.skipTest("IPv6 loopback not available")
+        self.listener, self.filler = stalled_ipv6_listener()
+        self.stalled_port = self.listener.getsockname()[1]
+        self.port = start_stub_server(self, HostnameHandler).server_port
+
+    def tearDown(self) -> None:
+        self.filler.close()
+        self.listener.close()
+
+    def _getaddrinfo(self, host, port, family=0, type=0, proto=0, flags=0):
+        #dual-stack lead whose IPv6 address does not answer
+        addrs = [
+            (socket.AF_INET6, socket.SOCK_STREAM, 6, '', ('::1', self.stalled_port, 0, 0)),
+            (socket.AF_INET, socket.SOCK_STREAM, 6, '', ('127.0.0.1', self.port))
+        ]
+        return [a for a in addrs if family in (0, a[0])]
+
+    def assertRaced(self, events, delay):
+        ##
+        # IPv6 is tried first, IPv4 is started delay seconds later while the IPv6 attempt is
+        # still pending, and the IPv6 attempt is only dropped once IPv4 has won
+        self.assertEqual(
+            [('connect', socket.AF_INET6), ('connect', socket.AF_INET), ('close', socket.AF_INET6)],
+            [(event, family) for event, family, ts in events]
+        )
+        self.assertGreaterEqual(events[1][2] - events[0][2], delay)
+
+    def test_race(self):
+        family_cache = FamilyCache()
+        sockets = RecordingSocketModule()
+        with mock.patch('socket.getaddrinfo', side_effect=self._getaddrinfo), \
+                mock.patch('psconfig.client.happy_eyeballs.socket', sockets):
+            sock = create_connection(('lead.example.net', 80), 5, delay=0.05, family_cache=family_cache)
+        self.assertRaced(sockets.events, 0.05)
+        with sock:
+            self.assertEqual(socket.AF_INET, sock.family)
+            self.assertEqual(5, sock.gettimeout())
+        self.assertEqual(socket.AF_INET, family_cache.get('lead.example.net'))
+
+        #the winner is tried first next time
+        sockets = RecordingSocketModule()
+        with mock.patch('socket.getaddrinfo', side_effect=self._getaddrinfo), \
+                mock.patch('psconfig.client.happy_eyeballs.socket', sockets):
+            sock = create_connection(('lead.example.net', 80), 5, delay=0.05, family_cache=family_cache)
+        sock.close()
+        self.assertEqual([('connect', socket.AF_INET), ('close', socket.AF_INET)], [(e, f) for e, f, ts in sockets.events])
+
+    def test_bind_address_limits_family(self):
+        with mock.patch('socket.getaddrinfo', side_effect=self._getaddrinfo) as getaddrinfo:
+            sock = create_connection(('lead.example.net', 80), 5, source_address=('127.0.0.1', 0))
+        with sock:
+            self.assertEqual(socket.AF_INET, sock.family)
+        self.assertEqual(socket.AF_INET, getaddrinfo.call_args[0][2])
+
+    def test_timeout(self):
+        def stalled_only(*args, **kwargs):
+            return [a for a in self._getaddrinfo(*args, **kwargs) if a[0] == socket.AF_INET6]
+        with mock.patch('socket.getaddrinfo', side_effect=stalled_only):
+            with self.assertRaises(socket.timeout):
+                create_connection(('lead.example.net', 80), 0.2)
+
+    def test_transport(self):
+        transport = HttpTransport(happy_eyeballs_delay=0.05)
+        url = 'http://lead.example.net:{}/pscheduler/hostname'.format(self.port)
+        sockets = RecordingSocketModule()
+        try:
+            with mock.patch('socket.getaddrinfo', side_effect=self._getaddrinfo), \
+                    mock.patch('psconfig.client.happy_eyeballs.socket', sockets):
+                result = Utils().send_http_request(connection_type='GET', url=url, timeout=5, transport=transport)
+                self.assertRaced(sockets.events[:3], 0.05)
+        finally:
+            transport.close()
+        self.assertIsNone(result['exception'])
+        self.assertEqual('lead.example.net', result['response'].json())
+        self.assertEqual({'lead.example.net': 'ipv4'}, transport.family_cache.to_json())
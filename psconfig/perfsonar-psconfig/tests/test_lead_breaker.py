@@ -0,0 +1,187 @@
+from unittest import TestCase
+from urllib.parse import urlparse
+import json
+import os
+import tempfile
+import time
+
+from psconfig.client.pscheduler.lead_breaker import LeadBreaker
+from psconfig.client.pscheduler.task import Task
+from psconfig.client.pscheduler.task_manager import TaskManager
+from stub_server import StubHandler, start_stub_server
+
+class StubLeadHandler(StubHandler):
+    '''Stub pScheduler lead with a single disabled task, whose task listing fails when tasks_status is not 200'''
+    tasks_status = 200
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path.endswith('/hostname'):
+            self.send_json('lead.example.net')
+        elif path.endswith('/participants'):
+            self.send_json({'participants': [None]})
+        elif self.tasks_status == 200:
+            href = self.base_url() + '/tasks/00000000-0000-0000-0000-000000000000'
+            self.send_json([{'test': {'type': 'latency', 'spec': {}}, 'detail': {'href': href, 'enabled': False}}])
+        else:
+            self.send_json('Server error', self.tasks_status)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.server.posts.append(self.path)
+        self.send_json('{}/tasks/{}'.format(self.base_url(), '11111111-1111-1111-1111-111111111111'))
+
+class TestLeadBreaker(TestCase):
+
+    def test_backoff(self):
+        breaker = LeadBreaker(base_backoff=60, max_backoff=3600)
+        self.assertEqual([0, 60, 120, 240, 480, 960, 1920, 3600, 3600], [breaker.backoff(i) for i in range(9)])
+        self.assertEqual(3600, breaker.backoff(1000))
+
+    def test_quarantine_and_probe(self):
+        leads = {}
+        breaker = LeadBreaker(leads=leads, base_backoff=60)
+        url = 'https://dead.example.net/pscheduler'
+        self.assertTrue(breaker.allow(url))
+        breaker.failure(url)
+        self.assertEqual(1, leads[url]['failures'])
+        self.assertFalse(breaker.allow(url))
+        self.assertIn(url, breaker.skipped())
+
+        #quarantine over, only one probe is let through
+        leads[url]['quarantine_until'] = time.time() - 1
+        self.assertTrue(breaker.allow(url))
+        self.assertFalse(breaker.allow(url))
+
+        #failed probe doubles the backoff
+        breaker.failure(url)
+        self.assertEqual(2, leads[url]['failures'])
+        self.assertAlmostEqual(time.time() + 120, leads[url]['quarantine_until'], delta=2)
+
+        #successful probe closes the breaker
+        leads[url]['quarantine_until'] = time.time() - 1
+        self.assertTrue(breaker.allow(url))
+        breaker.success(url)
+        self.assertNotIn('failures', leads[url])
+        self.assertNotIn('quarantine_until', leads[url])
+        self.assertTrue(breaker.allow(url))
+        self.assertTrue(breaker.allow(url))
+
+class TestTaskManagerBreaker(TestCase):
+
+    def setUp(self) -> None:
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.tracker_file = os.path.join(self.tmpdir.name, 'tracker.json')
+        self.uuid_file = os.path.join(self.tmpdir.name, 'client-uuid')
+
+    def tearDown(self) -> None:
+        self.tmpdir.cleanup()
+
+    def _stub_lead(self, tasks_status):
+        handler = type('Handler', (StubLeadHandler,), {'tasks_status': tasks_status})
+        server = start_stub_server(self, handler, posts=[])
+        self.posts = server.posts
+        return server.server_port
+
+    def _end_quarantine(self, urls):
+        with open(self.tracker_file) as f:
+            tracker = json.load(f)
+        for url in urls:
+            tracker['leads'][url]['quarantine_until'] = int(time.time()) - 1
+        with open(self.tracker_file, 'w') as f:
+            json.dump(tracker, f)
+
+    def _task_manager(self, url):
+        return TaskManager(
+            pscheduler_url=url,
+            tracker_file=self.tracker_file,
+            client_uuid_file=self.uuid_file,
+            reference_label='psconfig',
+            user_agent='psconfig-pscheduler-agent',
+            new_task_min_ttl=86400,
+            new_task_min_runs=2,
+            old_task_deadline=int(time.time()) + 3600,
+            logger=None
+        )
+
+    def test_dead_lead(self):
+        #nothing listens on port 1
+        url = 'http://127.0.0.1:1/pscheduler'
+        task_manager = self._task_manager(url)
+        self.assertEqual(1, task_manager.leads[url]['failures'])
+        self.assertEqual(1, len(task_manager.errors))
+        task_manager.commit()
+
+        #the quarantine is persisted and the lead is skipped on the next run
+        with open(self.tracker_file) as f:
+            tracker = json.load(f)
+        self.assertEqual(1, tracker['leads'][url]['failures'])
+        task_manager = self._task_manager(url)
+        self.assertEqual([], task_manager.errors)
+        self.assertIn(url, task_manager.skipped_leads())
+        self.assertLessEqual(task_manager.skipped_leads()[url], 60)
+
+    def test_listing_failure_escalates(self):
+        #the lead answers /hostname but can't list its tasks
+        url = 'http://127.0.0.1:{}/pscheduler'.format(self._stub_lead(500))
+        for failures in [1, 2, 3]:
+            task_manager = self._task_manager(url)
+            self.assertEqual(failures, task_manager.leads[url]['failures'])
+            task_manager.commit()
+            self._end_quarantine([url])
+
+    def test_duplicate_hostname_probe(self):
+        port = self._stub_lead(200)
+        url = 'http://127.0.0.1:{}/pscheduler'.format(port)
+        alias_url = 'http://localhost:{}/pscheduler'.format(port)
+        with open(self.tracker_file, 'w') as f:
+            json.dump({'leads': {url: {}, alias_url: {'failures': 1, 'quarantine_until': int(time.time()) - 1}}}, f)
+
+        #the alias is probed, turns out to be the same server and is closed once it lists
+        task_manager = self._task_manager(url)
+        self.assertEqual([], task_manager.errors)
+        self.assertFalse(task_manager.lead_breaker.probing(alias_url))
+        self.assertNotIn('failures', task_manager.leads[alias_url])
+        self.assertTrue(task_manager.lead_breaker.allow(alias_url))
+
+    def test_bind_lookup_skips_quarantined_lead(self):
+        #nothing listens on port 1, so the lead is quarantined while listing
+        url = 'http://127.0.0.1:1/pscheduler'
+        task_manager = self._task_manager(url)
+        self.assertFalse(task_manager.lead_breaker.allow(url))
+        lookups = []
+        task = Task(url=url, data={'test': {'type': 'latency', 'spec': {}}}, bind_map={'_default': '127.0.0.1'})
+        task.refresh_lead = lambda *args: lookups.append(args)
+        self.assertTrue(task.needs_bind_addresses())
+
+        #the bind address lookup goes through the breaker and never reaches the lead
+        task_manager._need_new_task(task)
+        self.assertEqual([], lookups)
+        self.assertEqual(task_manager.lead_breaker.skip_message(url), task.error)
+
+    def test_unlisted_lead_not_posted_to(self):
+        #the lead is in quarantine when tasks are listed, so its existing tasks are unknown
+        url = 'http://127.0.0.1:{}/pscheduler'.format(self._stub_lead(200))
+        with open(self.tracker_file, 'w') as f:
+            json.dump({'leads': {url: {'failures': 1, 'quarantine_until': int(time.time()) + 60}}}, f)
+        task_manager = self._task_manager(url)
+        self.assertIn(url, task_manager.skipped_leads())
+        task_manager.add_task(task=Task(url=url, data={'test': {'type': 'rtt', 'spec': {'dest': '10.0.0.1'}}}))
+        self.assertEqual(1, len(task_manager.new_tasks))
+
+        #the quarantine ends before commit, the lead is still not probed or posted to
+        task_manager.leads[url]['quarantine_until'] = int(time.time()) - 1
+        task_manager.commit()
+        self.assertEqual([], self.posts)
+        self.assertEqual([], task_manager.added_tasks)
+        self.assertEqual(1, len(task_manager.deferred_tasks))
+        self.assertFalse(task_manager.lead_breaker.probing(url))
+        self.assertEqual(1, task_manager.leads[url]['failures'])
+
+        #the next run lists the lead and creates the task
+        task_manager = self._task_manager(url)
+        self.assertNotIn('failures', task_manager.leads[url])
+        task_manager.add_task(task=Task(url=url, data={'test': {'type': 'rtt', 'spec': {'dest': '10.0.0.1'}}}))
+        task_manager.commit()
+        self.assertEqual(1, len(self.posts))
+        self.assertEqual(1, len(task_manager.added_tasks))
@@ -0,0 +1,54 @@
+from unittest import TestCase
+import json
+import time
+
+from psconfig.client.pscheduler.lead_cache import LeadCache
+
+class TestLeadCache(TestCase):
+
+    def test_key_is_normalized(self):
+        key1 = LeadCache.key('https://a/pscheduler/tests/latency/participants', {'source': 'a', 'dest': 'b'})
+        key2 = LeadCache.key('https://a/pscheduler/tests/latency/participants', {'dest': 'b', 'source': 'a'})
+        key3 = LeadCache.key('https://a/pscheduler/tests/latency/participants', {'dest': 'b', 'source': 'a'}, lead_bind='10.0.0.1')
+        self.assertEqual(key1, key2)
+        self.assertNotEqual(key1, key3)
+
+    def test_hit_and_miss(self):
+        cache = LeadCache()
+        self.assertIs(LeadCache.MISSING, cache.get('k', LeadCache.MISSING))
+        cache.set('k', 'lead.example.net')
+        self.assertEqual('lead.example.net', cache.get('k'))
+        #a lead of None is a valid cached value
+        cache.set('local', None)
+        self.assertIsNone(cache.get('local', LeadCache.MISSING))
+        stats = cache.stats()
+        self.assertEqual(2, stats['hits'])
+        self.assertEqual(1, stats['misses'])
+        self.assertAlmostEqual(2.0 / 3, stats['hit_rate'])
+
+    def test_ttl(self):
+        cache = LeadCache(ttl=60)
+        cache.set('k', 'lead.example.net')
+        cache._entries['k']['time'] = time.time() - 120
+        self.assertIsNone(cache.get('k'))
+        self.assertEqual(0, len(cache))
+
+    def test_lru_eviction(self):
+        cache = LeadCache(max_size=2)
+        cache.set('a', 'a.example.net')
+        cache.set('b', 'b.example.net')
+        cache.get('a')
+        cache.set('c', 'c.example.net')
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual('a.example.net', cache.get('a'))
+        self.assertEqual(1, cache.stats()['evictions'])
+
+    def test_persist(self):
+        cache = LeadCache()
+        cache.set('k', 'lead.example.net')
+        data = json.loads(json.dumps(cache.to_json()))
+        restored = LeadCache(data=data)
+        self.assertEqual('lead.example.net', restored.get('k'))
+        #expired entries are not restored
+        expired = LeadCache(ttl=60, data={'old': {'lead': 'x', 'time': int(time.time()) - 120}, 'bad': 'x'})
+        self.assertEqual(0, len(expired))
@@ -0,0 +1,124 @@
+from unittest import TestCase
+from urllib.parse import urlparse
+import json
+import os
+import tempfile
+import time
+
+from psconfig.client.pscheduler.lead_latency import LeadLatency
+from psconfig.client.pscheduler.task import Task
+from psconfig.client.pscheduler.task_manager import TaskManager
+from stub_server import StubHandler, StubServerTestCase
+
+class StubLeadHandler(StubHandler):
+    '''Stub pScheduler lead with a single disabled task'''
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path.endswith('/hostname'):
+            self.send_json('lead.example.net')
+        else:
+            href = self.base_url() + '/tasks/00000000-0000-0000-0000-000000000000'
+            self.send_json([{'test': {'type': 'latency', 'spec': {}}, 'detail': {'href': href, 'enabled': False}}])
+
+class TestLeadLatency(TestCase):
+
+    def test_default_until_enough_samples(self):
+        latency = LeadLatency(min_samples=5)
+        for i in range(4):
+            latency.record('a', 'listing', 2.0)
+        self.assertEqual(60, latency.timeout('a', 'listing', 60))
+        latency.record('a', 'listing', 2.0)
+        self.assertEqual(6.0, latency.timeout('a', 'listing', 60))
+        #other leads and classes are independent
+        self.assertEqual(60, latency.timeout('a', 'post', 60))
+        self.assertEqual(60, latency.timeout('b', 'listing', 60))
+
+    def test_percentile(self):
+        latency = LeadLatency(min_samples=1, window=100)
+        for i in range(1, 101):
+            latency.record('a', 'listing', i / 10.0)
+        self.assertEqual(5.0, latency.latency('a', 'listing', 0.5))
+        self.assertEqual(9.9, latency.latency('a', 'listing', 0.99))
+
+    def test_bounds(self):
+        latency = LeadLatency(floor=5, ceiling=300, min_samples=1)
+        #a fast lead fails fast, but not faster than the floor
+        latency.record('fast', 'post', 0.1)
+        self.assertEqual(5, latency.timeout('fast', 'post', 60))
+        #a slow lead gets more time than the default, up to the ceiling
+        latency.record('slow', 'listing', 90)
+        self.assertEqual(270, latency.timeout('slow', 'listing', 60))
+        latency.record('slow', 'listing', 200)
+        self.assertEqual(300, latency.timeout('slow', 'listing', 60))
+
+    def test_window(self):
+        latency = LeadLatency(min_samples=1, window=3)
+        for seconds in [100, 1, 1, 1]:
+            latency.record('a', 'delete', seconds)
+        self.assertEqual(1.0, latency.latency('a', 'delete', 1.0))
+
+    def test_persist(self):
+        latency = LeadLatency(min_samples=1)
+        latency.record('a', 'listing', 2.5)
+        latency.record('b', 'listing', 2.5)
+        data = json.loads(json.dumps(latency.to_json(['a'])))
+        self.assertEqual({'a': {'listing': [2500]}}, data)
+        restored = LeadLatency(min_samples=1, data=data)
+        self.assertEqual(2.5, restored.latency('a', 'listing'))
+        #malformed entries are ignored
+        restored = LeadLatency(min_samples=1, data={'a': {'listing': ['x', -1, 10]}, 'b': 'x'})
+        self.assertEqual(0.01, restored.latency('a', 'listing'))
+
+class TestTaskManagerLatency(StubServerTestCase):
+    handler = StubLeadHandler
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.tracker_file = os.path.join(self.tmpdir.name, 'tracker.json')
+
+    def tearDown(self) -> None:
+        self.tmpdir.cleanup()
+
+    def _task_manager(self):
+        return TaskManager(
+            pscheduler_url=self.url,
+            tracker_file=self.tracker_file,
+            client_uuid_file=os.path.join(self.tmpdir.name, 'client-uuid'),
+            reference_label='psconfig',
+            user_agent='psconfig-pscheduler-agent',
+            new_task_min_ttl=86400,
+            new_task_min_runs=2,
+            old_task_deadline=int(time.time()) + 3600,
+            logger=None
+        )
+
+    def test_latency_persisted(self):
+        for i in range(2):
+            task_manager = self._task_manager()
+            self.assertEqual([], task_manager.errors)
+            task_manager.commit()
+
+        with open(self.tracker_file) as f:
+            tracker = json.load(f)
+        self.assertEqual(2, len(tracker['latency'][self.url]['hostname']))
+        self.assertEqual(2, len(tracker['latency'][self.url]['listing']))
+
+    def test_participants_cache_hit(self):
+        task_manager = self._task_manager()
+        task = Task(url=self.url, lead_cache=task_manager.lead_cache)
+        task.test_type('latency')
+        task.test_spec({'dest': '10.0.0.1'})
+        task_manager.lead_cache.set(task._lead_cache_key(*task._lead_request()), None)
+        #the breaker is half-open, so the call is let through as its probe
+        task_manager.leads[self.url] = {'failures': 1, 'quarantine_until': int(time.time()) - 1}
+
+        for i in range(2):
+            task_manager._call_lead(task, task.refresh_lead, 'participants')
+            self.assertTrue(task.cache_hit)
+            self.assertFalse(task.error)
+            #answered without asking the lead, so no sample and the breaker is left alone
+            self.assertIsNone(task_manager.lead_latency.latency(self.url, 'participants'))
+            self.assertFalse(task_manager.lead_breaker.probing(self.url))
+            self.assertEqual(1, task_manager.leads[self.url]['failures'])
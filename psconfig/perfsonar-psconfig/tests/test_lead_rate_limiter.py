@@ -0,0 +1,54 @@
+from unittest import TestCase
+from concurrent.futures import ThreadPoolExecutor
+import time
+
+from psconfig.client.pscheduler.lead_rate_limiter import LeadRateLimiter, TokenBucket
+
+class TestTokenBucket(TestCase):
+
+    def test_burst_then_rate(self):
+        bucket = TokenBucket(10, burst=3)
+        self.assertEqual([0, 0, 0], [bucket.reserve() for i in range(3)])
+        #each further reservation waits another tenth of a second
+        waits = [bucket.reserve() for i in range(3)]
+        for expected, wait in zip([0.1, 0.2, 0.3], waits):
+            self.assertAlmostEqual(expected, wait, delta=0.02)
+
+    def test_refill(self):
+        bucket = TokenBucket(100, burst=1)
+        self.assertEqual(0, bucket.reserve())
+        time.sleep(0.05)
+        self.assertEqual(0, bucket.reserve())
+
+class TestLeadRateLimiter(TestCase):
+
+    def test_concurrent_requests_are_spread(self):
+        limiter = LeadRateLimiter(mutate_rate=50, burst=1)
+        start = time.monotonic()
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(lambda i: limiter.acquire('a', 'mutate'), range(11)))
+        #first request is free, the other ten are spaced 20ms apart
+        self.assertGreaterEqual(time.monotonic() - start, 0.19)
+        stats = limiter.stats()
+        self.assertEqual(10, stats['requests'])
+        self.assertEqual(10, stats['kinds']['mutate']['requests'])
+        self.assertEqual(0, stats['kinds']['list']['requests'])
+        self.assertAlmostEqual(1.1, stats['seconds'], delta=0.1)
+        self.assertEqual(10, stats['leads']['a']['mutate']['requests'])
+
+    def test_independent_buckets(self):
+        limiter = LeadRateLimiter(list_rate=1, lead_rate=1, mutate_rate=1, burst=1)
+        for url in ['a', 'b']:
+            for kind in LeadRateLimiter.KINDS:
+                self.assertEqual(0, limiter.acquire(url, kind))
+        self.assertEqual(0, limiter.stats()['requests'])
+
+    def test_unlimited(self):
+        limiter = LeadRateLimiter(mutate_rate=None, burst=1)
+        for i in range(100):
+            self.assertEqual(0, limiter.acquire('a', 'mutate'))
+        #every class is unlimited unless given a rate
+        limiter = LeadRateLimiter(list_rate=0, burst=1)
+        for kind in LeadRateLimiter.KINDS:
+            for i in range(100):
+                self.assertEqual(0, limiter.acquire('a', kind))
@@ -0,0 +1,96 @@
+from unittest import TestCase
+import os
+import tempfile
+import threading
+import time
+
+from psconfig.client.pscheduler.task_manager import TaskManager
+
+class TestLeadWorkers(TestCase):
+
+    def setUp(self) -> None:
+        self.tmpdir = tempfile.TemporaryDirectory()
+        #nothing listens on port 1, so listing the local lead fails right away
+        self.task_manager = TaskManager(
+            pscheduler_url='http://127.0.0.1:1/pscheduler',
+            tracker_file=os.path.join(self.tmpdir.name, 'tracker.json'),
+            client_uuid_file=os.path.join(self.tmpdir.name, 'client-uuid'),
+            reference_label='psconfig',
+            user_agent='psconfig-pscheduler-agent',
+            new_task_min_ttl=86400,
+            new_task_min_runs=2,
+            old_task_deadline=int(time.time()) + 3600,
+            lead_workers=2,
+            lead_deadline=0.2,
+            logger=None
+        )
+
+    def tearDown(self) -> None:
+        self.tmpdir.cleanup()
+
+    def test_deadline_per_lead(self):
+        #two leads hang and hold both workers, the rest queue behind them
+        release = threading.Event()
+        started = []
+        def fetch(url):
+            started.append(url)
+            if url.startswith('hung'):
+                release.wait(5)
+            return url, None
+        urls = ['hung1', 'hung2', 'ok1', 'ok2', 'ok3']
+        try:
+            results = self.task_manager._run_lead_workers(fetch, {url: url for url in urls})
+        finally:
+            release.set()
+
+        #queued leads are still contacted and don't inherit the hung leads' timeouts
+        self.assertEqual(urls, started)
+        self.assertEqual((None, "Timed out after 0.2 seconds"), results['hung1'])
+        self.assertEqual((None, "Timed out after 0.2 seconds"), results['hung2'])
+        for url in ['ok1', 'ok2', 'ok3']:
+            self.assertEqual((url, None), results[url])
+
+    def test_straggler_threads_capped(self):
+        #hung leads keep their threads, new leads wait for one once too many are hung
+        self.task_manager.lead_max_stragglers = 1
+        release = threading.Event()
+        lock = threading.Lock()
+        active = []
+        max_active = []
+        def fetch(url):
+            with lock:
+                active.append(url)
+                max_active.append(len(active))
+            if url.startswith('hung'):
+                release.wait(5)
+            with lock:
+                active.remove(url)
+            return url, None
+        urls = ['hung1', 'hung2', 'hung3', 'ok1']
+        timer = threading.Timer(0.8, release.set)
+        timer.start()
+        try:
+            results = self.task_manager._run_lead_workers(fetch, {url: url for url in urls})
+        finally:
+            release.set()
+            timer.cancel()
+
+        #lead_workers plus one straggler
+        self.assertEqual(3, max(max_active))
+        for url in ['hung1', 'hung2', 'hung3']:
+            self.assertEqual((None, "Timed out after 0.2 seconds"), results[url])
+        self.assertEqual(('ok1', None), results['ok1'])
+
+    def test_deadlines(self):
+        def fetch(url):
+            if url == 'slow':
+                time.sleep(0.4)
+            return url, None
+        results = self.task_manager._run_lead_workers(fetch, {'slow': 'slow', 'fast': 'fast'}, {'slow': 1})
+        self.assertEqual({'slow': ('slow', None), 'fast': ('fast', None)}, results)
+
+    def test_exception(self):
+        def fetch(url):
+            raise ValueError(url)
+        error = self.task_manager._run_lead_workers(fetch, {'a': 'a'})['a'][1]
+        self.assertIsInstance(error, ValueError)
@@ -0,0 +1,105 @@
+from urllib.parse import urlparse, parse_qs
+
+from psconfig.client.psconfig.config import Config
+from psconfig.client.psconfig.parsers.task_generator import TaskGenerator
+from psconfig.client.pscheduler.participants_cache import ParticipantsCache
+from stub_server import StubHandler, StubServerTestCase
+
+class ParticipantsHandler(StubHandler):
+    '''Stub pScheduler that counts participants requests and returns two participants unless the test is single-ended'''
+    requests = 0
+
+    def do_GET(self):
+        ParticipantsHandler.requests += 1
+        if parse_qs(urlparse(self.path).query).get('single-ended') == ['true']:
+            self.send_json({'participants': ['a']})
+        else:
+            self.send_json({'participants': ['a', 'b']})
+
+class TestParticipantsCache(StubServerTestCase):
+    HOSTS = ['host{}.example.net'.format(i) for i in range(10)]
+    handler = ParticipantsHandler
+
+    def setUp(self) -> None:
+        ParticipantsHandler.requests = 0
+        super().setUp()
+        self.psconfig = Config(data={
+            'addresses': {h: {'address': h, 'contexts': ['netns']} for h in self.HOSTS},
+            'contexts': {'netns': {'context': 'linuxnns', 'data': {'namespace': 'test'}}},
+            'groups': {'mesh': {'type': 'mesh', 'addresses': [{'name': h} for h in self.HOSTS]}},
+            'tests': {'throughput': {'type': 'throughput', 'spec': {'source': '{% address[0] %}', 'dest': '{% address[1] %}'}}},
+            'tasks': {'task': {'group': 'mesh', 'test': 'throughput'}}
+        })
+
+    def _task_generator(self, cache):
+        return TaskGenerator(psconfig=self.psconfig, task_name='task', pscheduler_url=self.url,
+                             transport=self.transport, participants_cache=cache)
+
+    def _expanded(self, tg):
+        return [a.address() for a in tg.addresses], tg.expanded_test, tg.expanded_contexts
+
+    def test_one_lookup_per_template(self):
+        cache = ParticipantsCache()
+        tg = self._task_generator(cache)
+        tg.start()
+        pairs = 0
+        while tg.next():
+            self.assertFalse(tg.error)
+            self.assertEqual(2, len(tg.expanded_contexts))
+            pairs += 1
+        tg.stop()
+        self.assertEqual(len(self.HOSTS) * (len(self.HOSTS) - 1), pairs)
+        self.assertEqual(1, ParticipantsHandler.requests)
+
+    def test_deferred(self):
+        cache = ParticipantsCache()
+        tg = self._task_generator(cache)
+        expected = []
+        tg.start()
+        while tg.next():
+            expected.append(self._expanded(tg))
+        tg.stop()
+        ParticipantsHandler.requests = 0
+
+        cache = ParticipantsCache()
+        tg = self._task_generator(cache)
+        specs = {}
+        pending = []
+        tg.start()
+        tg.defer_participants(specs)
+        while tg.next():
+            self.assertTrue(tg.participants_pending)
+            pending.append(tg.pair())
+        self.assertEqual(1, len(specs))
+        self.assertEqual(0, ParticipantsHandler.requests)
+        self.assertEqual({}, cache.prefetch(self.url + '/tests', specs, transport=self.transport))
+        self.assertEqual(1, ParticipantsHandler.requests)
+        #already cached so nothing to fetch
+        cache.prefetch(self.url + '/tests', specs, transport=self.transport)
+
+        tg.defer_participants(None)
+        expanded = []
+        for pair in pending:
+            self.assertTrue(tg.expand(pair))
+            self.assertFalse(tg.participants_pending)
+            self.assertEqual(2, len(tg.expanded_contexts))
+            expanded.append(self._expanded(tg))
+        tg.stop()
+        self.assertEqual(expected, expanded)
+        self.assertEqual(1, ParticipantsHandler.requests)
+
+    def test_jq_changes_count(self):
+        #only tests from host0 are single-ended, so they have one participant
+        self.psconfig.data['tests']['throughput']['spec']['single-ended'] = \
+            '{% jq if .addresses[0].address == "host0.example.net" then "true" else "false" end %}'
+        tg = self._task_generator(ParticipantsCache())
+        counts = {}
+        tg.start()
+        while tg.next():
+            self.assertFalse(tg.error)
+            single_ended = tg.expanded_test['spec']['single-ended']
+            counts.setdefault(single_ended, set()).add(len(tg.expanded_contexts))
+        tg.stop()
+        self.assertEqual({'true': {1}, 'false': {2}}, counts)
+        #one lookup for each value of the jq variable
+        self.assertEqual(2, ParticipantsHandler.requests)
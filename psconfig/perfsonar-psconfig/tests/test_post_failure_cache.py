@@ -0,0 +1,132 @@
+from unittest import TestCase
+from urllib.parse import urlparse
+import json
+import os
+import tempfile
+import time
+
+from psconfig.client.pscheduler.post_failure_cache import PostFailureCache
+from psconfig.client.pscheduler.task import Task
+from psconfig.client.pscheduler.task_manager import TaskManager
+from stub_server import StubHandler, StubServerTestCase
+
+class StubLeadHandler(StubHandler):
+    '''Stub pScheduler lead that is its own lead for every task and refuses all POSTs'''
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path.endswith('/hostname'):
+            self.send_json('lead.example.net')
+        elif path.endswith('/participants'):
+            self.send_json({'participants': [None]})
+        else:
+            href = self.base_url() + '/tasks/00000000-0000-0000-0000-000000000000'
+            self.send_json([{'test': {'type': 'latency', 'spec': {}}, 'detail': {'href': href, 'enabled': False}}])
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.server.posts += 1
+        self.send_body('Invalid test specification', self.server.post_status)
+
+class TestPostFailureCache(TestCase):
+
+    def test_transient_backoff(self):
+        cache = PostFailureCache(base_backoff=300, max_backoff=1000)
+        self.assertIsNone(cache.blocked('abc'))
+        entry = cache.failure('abc', http_status=503, error='Service Unavailable')
+        self.assertFalse(entry['permanent'])
+        self.assertAlmostEqual(time.time() + 300, entry['retry_time'], delta=2)
+        self.assertEqual(1, cache.blocked('abc')['failures'])
+        entry = cache.failure('abc', http_status=503)
+        self.assertAlmostEqual(time.time() + 600, entry['retry_time'], delta=2)
+        entry = cache.failure('abc', http_status=429)
+        self.assertAlmostEqual(time.time() + 1000, entry['retry_time'], delta=2)
+        cache.success('abc')
+        self.assertIsNone(cache.blocked('abc'))
+
+    def test_permanent(self):
+        cache = PostFailureCache(base_backoff=300, permanent_backoff=86400)
+        for status in [400, 403, 404, 422]:
+            self.assertTrue(PostFailureCache.is_permanent(status))
+        for status in [None, 408, 429, 500, 503]:
+            self.assertFalse(PostFailureCache.is_permanent(status))
+        entry = cache.failure('abc', http_status=400)
+        self.assertTrue(entry['permanent'])
+        self.assertAlmostEqual(time.time() + 86400, entry['retry_time'], delta=2)
+
+    def test_persist(self):
+        cache = PostFailureCache()
+        cache.failure('a', http_status=400, error='bad', task='rtt(self->x)')
+        data = json.loads(json.dumps(cache.to_json()))
+        restored = PostFailureCache(data=data)
+        self.assertEqual('rtt(self->x)', restored.blocked('a')['task'])
+        #entries not looked up again are dropped unless asked for
+        restored = PostFailureCache(data=dict(data, b={'failures': 1, 'retry_time': 0}, c='x'))
+        self.assertEqual(['a', 'b'], sorted(restored.to_json(seen_only=False)))
+        restored.blocked('a')
+        self.assertEqual(['a'], list(restored.to_json()))
+        #expired entries don't block but are kept so the backoff keeps growing
+        self.assertIsNone(restored.blocked('b'))
+        self.assertEqual(2, restored.failure('b', http_status=500)['failures'])
+
+    def test_clear(self):
+        cache = PostFailureCache()
+        cache.failure('a', http_status=400)
+        cache.failure('b', http_status=400)
+        self.assertEqual(1, cache.clear('a'))
+        self.assertEqual(0, cache.clear('a'))
+        self.assertEqual(1, cache.clear())
+        self.assertEqual({}, cache.entries())
+
+class TestTaskManagerPostFailures(StubServerTestCase):
+    handler = StubLeadHandler
+
+    def server_attrs(self):
+        return {'posts': 0, 'post_status': 400}
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.tracker_file = os.path.join(self.tmpdir.name, 'tracker.json')
+
+    def tearDown(self) -> None:
+        self.tmpdir.cleanup()
+
+    def _run(self, spec):
+        task_manager = TaskManager(
+            pscheduler_url=self.url,
+            tracker_file=self.tracker_file,
+            client_uuid_file=os.path.join(self.tmpdir.name, 'client-uuid'),
+            reference_label='psconfig',
+            user_agent='psconfig-pscheduler-agent',
+            new_task_min_ttl=86400,
+            new_task_min_runs=2,
+            old_task_deadline=int(time.time()) + 3600,
+            logger=None
+        )
+        task = Task(url=self.url, data={'test': {'type': 'rtt', 'spec': spec}, 'schedule': {'repeat': 'PT1M'}})
+        task_manager.add_task(task=task)
+        task_manager.commit()
+        return task_manager, task
+
+    def test_rejected_task_not_retried(self):
+        task_manager, task = self._run({'dest': '10.0.0.1'})
+        self.assertEqual(1, self.server.posts)
+        self.assertEqual(1, len(task_manager.errors))
+        with open(self.tracker_file) as f:
+            entry = json.load(f)['post_failures'][task.checksum()]
+        self.assertEqual(400, entry['http_status'])
+        self.assertTrue(entry['permanent'])
+
+        #the same task is skipped on the next run, a changed one is still posted
+        task_manager, task = self._run({'dest': '10.0.0.1'})
+        self.assertEqual(1, self.server.posts)
+        self.assertEqual([task], task_manager.blocked_tasks)
+        self.assertEqual([], task_manager.errors)
+        self.assertEqual({'entries': 1, 'permanent': 1, 'skipped': 1}, task_manager.post_failure_stats())
+        task_manager, task = self._run({'dest': '10.0.0.2'})
+        self.assertEqual(2, self.server.posts)
+
+        #entries of tasks no longer generated are dropped
+        with open(self.tracker_file) as f:
+            self.assertEqual([task.checksum()], list(json.load(f)['post_failures']))
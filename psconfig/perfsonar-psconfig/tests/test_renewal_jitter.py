@@ -0,0 +1,118 @@
+from unittest import TestCase
+import os
+import tempfile
+import time
+import uuid
+
+from psconfig.client.pscheduler.task import Task
+from psconfig.client.pscheduler.task_manager import TaskManager
+from psconfig.client.pscheduler.task_record import TaskRecord, iso_to_ts
+
+class TestTaskRenewal(TestCase):
+
+    def setUp(self) -> None:
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self) -> None:
+        self.tmpdir.cleanup()
+
+    def _task_manager(self, renewal_window, renewal_slices=1):
+        #nothing listens on port 1, no existing tasks are needed here
+        return TaskManager(
+            pscheduler_url='http://127.0.0.1:1/pscheduler',
+            tracker_file=os.path.join(self.tmpdir.name, 'tracker.json'),
+            client_uuid_file=os.path.join(self.tmpdir.name, 'client-uuid'),
+            reference_label='psconfig',
+            user_agent='psconfig-pscheduler-agent',
+            new_task_min_ttl=86400,
+            new_task_min_runs=2,
+            old_task_deadline=int(time.time()) + 3600,
+            task_renewal_fudge_factor=0.25,
+            renewal_window=renewal_window,
+            renewal_slices=renewal_slices,
+            logger=None
+        )
+
+    def _record(self, checksum, until_ts):
+        return TaskRecord(uuid=str(uuid.uuid4()), checksum=checksum, until_ts=int(until_ts),
+                          start_ts=int(time.time()) - 600, exclusive=False, multiresult=False, runs_started=1)
+
+    def _renews(self, task_manager, record):
+        return task_manager._evaluate_task({record.uuid: record}, True, None)[0]
+
+    def _task(self, dest):
+        return Task(url='http://127.0.0.1:1/pscheduler', data={'test': {'type': 'rtt', 'spec': {'dest': dest}}, 'schedule': {'repeat': 'PT10M'}})
+
+    def test_jitter(self):
+        task_manager = self._task_manager(21600)
+        jitters = [task_manager._renewal_jitter('checksum{}'.format(i), 'ttl') for i in range(1000)]
+        self.assertEqual(jitters, [task_manager._renewal_jitter('checksum{}'.format(i), 'ttl') for i in range(1000)])
+        self.assertTrue(all(0 <= j < 21600 for j in jitters))
+        #roughly even over the window
+        for quarter in range(4):
+            count = len([j for j in jitters if quarter * 5400 <= j < (quarter + 1) * 5400])
+            self.assertGreater(count, 200)
+        #kinds are independent
+        self.assertNotEqual(jitters[:10], [task_manager._renewal_jitter('checksum{}'.format(i), 'renew') for i in range(10)])
+        self.assertEqual(0, self._task_manager(0)._renewal_jitter('checksum', 'ttl'))
+
+    def test_new_tasks_spread(self):
+        now = int(time.time())
+        task_manager = self._task_manager(21600)
+        untils = set()
+        for i in range(20):
+            task = self._task('10.0.0.{}'.format(i))
+            task_manager.add_task(task=task)
+            until = iso_to_ts(task.schedule_until())
+            self.assertAlmostEqual(now + 86400 + task_manager._renewal_jitter(task.checksum(), 'ttl'), until, delta=2)
+            untils.add(until)
+            #first run is delayed by less than the repeat interval
+            self.assertLess(iso_to_ts(task.schedule_start()) - now, 600 + 2)
+        self.assertGreater(len(untils), 15)
+
+        #no window keeps the old behavior
+        task_manager = self._task_manager(0)
+        task = self._task('10.0.0.1')
+        task_manager.add_task(task=task)
+        self.assertIsNone(task.schedule_start())
+        self.assertAlmostEqual(now + 86400, iso_to_ts(task.schedule_until()), delta=2)
+
+    def test_renew_early(self):
+        task_manager = self._task_manager(21600)
+        checksum = 'checksum'
+        jitter = task_manager._renewal_jitter(checksum, 'renew')
+        threshold = task_manager.old_task_deadline + 86400 * 0.25
+        record = self._record(checksum, threshold + jitter + 60)
+        self.assertEqual((False, None), task_manager._evaluate_task({record.uuid: record}, True, None))
+        #within the task's own share of the window it is renewed early, starting when the old one ends
+        record.until_ts = int(threshold + jitter - 60)
+        self.assertEqual((True, record.until_ts), task_manager._evaluate_task({record.uuid: record}, True, None))
+
+    def test_rolling_renewal(self):
+        task_manager = self._task_manager(0, renewal_slices=4)
+        checksums = ['checksum{}'.format(i) for i in range(400)]
+        slices = [task_manager._renewal_slice_of(c) for c in checksums]
+        for i in range(4):
+            self.assertGreater(slices.count(i), 70)
+        in_slice = [c for c, i in zip(checksums, slices) if i == task_manager.renewal_slice]
+        off_slice = [c for c, i in zip(checksums, slices) if i != task_manager.renewal_slice]
+
+        deadline = task_manager.old_task_deadline
+        #would be renewed without slices
+        due = deadline + 86400 * 0.25 - 60
+        self.assertTrue(self._renews(self._task_manager(0), self._record(off_slice[0], due)))
+        self.assertTrue(self._renews(task_manager, self._record(in_slice[0], due)))
+        self.assertFalse(self._renews(task_manager, self._record(off_slice[0], due)))
+        #the slice whose turn it is gets renewed far enough ahead to last until its next turn
+        self.assertTrue(self._renews(task_manager, self._record(in_slice[0], due + 3 * 3600)))
+        self.assertFalse(self._renews(task_manager, self._record(in_slice[0], due + 3 * 3600 + 120)))
+        #anything that would lapse before the run after next is always renewed
+        self.assertTrue(self._renews(task_manager, self._record(off_slice[0], deadline + 3600 - 60)))
+
+    def test_rolling_renewal_turns(self):
+        seen = []
+        for i in range(5):
+            task_manager = self._task_manager(0, renewal_slices=4)
+            seen.append(task_manager.renewal_slice)
+            task_manager.commit()
+        self.assertEqual([0, 1, 2, 3, 0], seen)
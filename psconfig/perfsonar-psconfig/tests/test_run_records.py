@@ -0,0 +1,125 @@
+from urllib.parse import urlparse, parse_qs
+import threading
+import time
+
+from psconfig.client.pscheduler.task import Task
+from psconfig.client.pscheduler.run_record import RunRecord
+from psconfig.client.utils import iter_concurrent, iso_to_ts, ts_to_iso
+from stub_server import StubHandler, StubServerTestCase
+
+TASK_UUID = '00000000-0000-0000-0000-000000000000'
+RUN_UUIDS = ['00000000-0000-0000-0000-{:012d}'.format(i + 1) for i in range(200)]
+FIRST_START = 1790899200
+
+def run_json(i):
+    start = FIRST_START + i * 60
+    return {
+        'state': 'finished',
+        'start-time': ts_to_iso(start),
+        'end-time': ts_to_iso(start + 10),
+        'duration': 'PT10S',
+        'participant': 0,
+        'result-merged': {'succeeded': True},
+        'result-full': [{'succeeded': True, 'raw': 'x' * 100}]
+    }
+
+class StubRunsHandler(StubHandler):
+    '''Stub pScheduler serving the runs of a single task'''
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        path = parsed.path
+        runs_path = '/pscheduler/tasks/{}/runs'.format(TASK_UUID)
+        base = 'http://{}:{}'.format(*self.server.server_address)
+        status = 200
+        if path == runs_path:
+            query = parse_qs(parsed.query)
+            self.server.queries.append(query)
+            obj = ['{}{}/{}'.format(base, runs_path, u) for u in RUN_UUIDS]
+        elif path.startswith(runs_path + '/') and path.split('/')[-1] in RUN_UUIDS:
+            with self.server.lock:
+                self.server.in_flight += 1
+                self.server.max_in_flight = max(self.server.max_in_flight, self.server.in_flight)
+                self.server.run_requests += 1
+                wait = self.server.run_requests <= self.server.concurrent_runs
+            #the first runs are only answered once that many are being fetched at the same time
+            if wait:
+                try:
+                    self.server.barrier.wait()
+                except threading.BrokenBarrierError:
+                    pass
+            with self.server.lock:
+                self.server.in_flight -= 1
+            if path.split('/')[-1] == self.server.broken_run or (wait and self.server.barrier.broken):
+                status = 500
+                obj = 'broken'
+            else:
+                obj = run_json(RUN_UUIDS.index(path.split('/')[-1]))
+        else:
+            status = 404
+            obj = 'Not found'
+        self.send_json(obj, status)
+
+class TestRunRecords(StubServerTestCase):
+    handler = StubRunsHandler
+
+    def server_attrs(self):
+        return {
+            'queries': [],
+            'broken_run': None,
+            'lock': threading.Lock(),
+            'in_flight': 0,
+            'max_in_flight': 0,
+            'run_requests': 0,
+            'concurrent_runs': 0
+        }
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.task = Task(url=self.url, uuid=TASK_UUID)
+
+    def test_iter_concurrent(self):
+        self.assertEqual([i * 2 for i in range(50)], list(iter_concurrent(lambda i: i * 2, iter(range(50)), 4)))
+        #stopping early doesn't wait for the rest of the items
+        gen = iter_concurrent(lambda i: i, range(1000000), 4)
+        self.assertEqual(0, next(gen))
+        gen.close()
+
+    def test_records(self):
+        self.server.concurrent_runs = 16
+        self.server.barrier = threading.Barrier(16, timeout=5)
+        records = self.task.run_records(workers=16)
+        self.assertFalse(self.task.error)
+        self.assertEqual(RUN_UUIDS, [r.uuid for r in records])
+        #up to workers runs are fetched at once, never more
+        self.assertEqual(16, self.server.max_in_flight)
+        record = records[1]
+        self.assertEqual('finished', record.state)
+        self.assertEqual(FIRST_START + 60, record.start_ts)
+        self.assertEqual(FIRST_START + 70, record.end_ts)
+        self.assertNotIn('result-full', record.data())
+        self.assertEqual({'succeeded': True}, record.run().result_merged())
+
+    def test_time_window(self):
+        records = self.task.run_records(start=FIRST_START + 600, end=FIRST_START + 1200, full=True)
+        self.assertEqual(RUN_UUIDS[10:21], [r.uuid for r in records])
+        self.assertIn('result-full', records[0].data())
+        self.assertEqual({'start': [ts_to_iso(FIRST_START + 600)], 'end': [ts_to_iso(FIRST_START + 1200)]}, self.server.queries[-1])
+
+    def test_failed_run_skipped(self):
+        self.server.broken_run = RUN_UUIDS[5]
+        records = list(self.task.iter_run_records())
+        self.assertEqual(len(RUN_UUIDS) - 1, len(records))
+        self.assertTrue(self.task.error)
+        #runs() keeps returning None if any run fails
+        self.assertIsNone(self.task.runs())
+
+    def test_runs(self):
+        runs = self.task.runs(workers=16)
+        self.assertEqual(RUN_UUIDS, [r.uuid for r in runs])
+        self.assertEqual(iso_to_ts(runs[0].start_time()), FIRST_START)
+
+    def test_record_slots(self):
+        record = RunRecord.from_json(run_json(0))
+        with self.assertRaises(AttributeError):
+            record.extra = 1
@@ -0,0 +1,123 @@
+from unittest import TestCase
+from urllib.parse import urlparse
+import json
+import os
+import tempfile
+import time
+
+from psconfig.client.pscheduler.api_connect import ApiConnect
+from psconfig.client.pscheduler.task_manager import TaskManager
+from psconfig.client.utils import iter_json_array
+from stub_server import StubHandler, StubServerTestCase
+
+TASK_COUNT = 500
+
+def listed_task(i):
+    uuid = '00000000-0000-4000-8000-{:012d}'.format(i)
+    return {
+        'test': {'type': 'latencybg', 'spec': {'source': 'host{}.example.net'.format(i), 'dest': 'b.example.net'}},
+        'tool': 'powstream',
+        'schedule': {'until': '2026-10-02T00:00:00Z'},
+        'detail': {'enabled': True, 'href': 'https://lead.example.net/pscheduler/tasks/' + uuid}
+    }
+
+class TasksHandler(StubHandler):
+    '''Stub pScheduler that sends a task list in small chunks'''
+
+    def do_GET(self):
+        body = json.dumps([listed_task(i) for i in range(TASK_COUNT)]).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        for i in range(0, len(body), 1000):
+            chunk = body[i:i+1000]
+            self.wfile.write('{:x}\r\n'.format(len(chunk)).encode('ascii') + chunk + b'\r\n')
+        self.wfile.write(b'0\r\n\r\n')
+
+class TruncatedTasksHandler(StubHandler):
+    '''Stub pScheduler lead whose connection drops halfway through the task list'''
+
+    def do_GET(self):
+        if urlparse(self.path).path.endswith('/hostname'):
+            self.send_json('lead.example.net')
+            return
+        body = json.dumps([listed_task(i) for i in range(TASK_COUNT)]).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body[:len(body) // 2])
+        self.wfile.flush()
+        self.close_connection = True
+
+class TestIterJsonArray(TestCase):
+
+    def _split(self, doc, size):
+        data = doc.encode('utf-8')
+        return (data[i:i+size] for i in range(0, len(data), size))
+
+    def test_any_chunk_size(self):
+        doc = json.dumps([{'n': i, 's': 'é' * i} for i in range(30)] + [1, 2.5e3, None, True, 'a,]', [1, [2]]])
+        for size in (1, 2, 3, 7, 64, 4096):
+            self.assertEqual(json.loads(doc), list(iter_json_array(self._split(doc, size))))
+
+    def test_empty(self):
+        self.assertEqual([], list(iter_json_array([b' [ ] '])))
+
+    def test_invalid(self):
+        for doc in [b'{}', b'[1 2]', b'[1,', b'[1]x', b'']:
+            with self.assertRaises(ValueError):
+                list(iter_json_array([doc]))
+
+class TestIterTasks(StubServerTestCase):
+    handler = TasksHandler
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.psc_client = ApiConnect(url=self.url, transport=self.transport)
+
+    def test_matches_get_tasks(self):
+        streamed = list(self.psc_client.iter_tasks(chunk_size=512))
+        self.assertFalse(self.psc_client.error)
+        listed = self.psc_client.get_tasks()
+        self.assertEqual(TASK_COUNT, len(streamed))
+        self.assertEqual([t.uuid for t in listed], [t.uuid for t in streamed])
+        self.assertEqual([t.checksum() for t in listed], [t.checksum() for t in streamed])
+
+class TestTruncatedListing(StubServerTestCase):
+    handler = TruncatedTasksHandler
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self) -> None:
+        self.tmpdir.cleanup()
+
+    def test_iter_tasks(self):
+        psc_client = ApiConnect(url=self.url, transport=self.transport)
+        streamed = list(psc_client.iter_tasks(chunk_size=512))
+        #some tasks were read before the connection dropped
+        self.assertTrue(0 < len(streamed) < TASK_COUNT)
+        self.assertTrue(psc_client.error)
+        self.assertTrue(psc_client.listing_failed)
+
+    def test_lead_failed(self):
+        task_manager = TaskManager(
+            pscheduler_url=self.url,
+            tracker_file=os.path.join(self.tmpdir.name, 'tracker.json'),
+            client_uuid_file=os.path.join(self.tmpdir.name, 'client-uuid'),
+            reference_label='psconfig',
+            user_agent='psconfig-pscheduler-agent',
+            new_task_min_ttl=86400,
+            new_task_min_runs=2,
+            old_task_deadline=int(time.time()) + 3600,
+            transport=self.transport,
+            logger=None
+        )
+        #the partial list is not used, so its missing tasks aren't created again
+        self.assertEqual({}, task_manager.existing_task_map)
+        self.assertEqual(1, task_manager.leads[self.url]['failures'])
+        self.assertEqual(1, len(task_manager.errors))
+        self.assertIn('Problem getting existing tests', task_manager.errors[0])
@@ -0,0 +1,156 @@
+from unittest import TestCase, mock, skipUnless
+import os
+import time
+
+from psconfig.client.psconfig.archive import Archive
+from psconfig.client.psconfig.config import Config
+from psconfig.client.psconfig.parsers.task_generator import TaskGenerator
+
+##
+# Lookups as done before they were indexed, to compare against
+def host_of(tg, address):
+    try:
+        return tg.psconfig.host(address.host_ref())
+    except Exception as e:
+        if address._parent_host_ref:
+            return tg.psconfig.host(address._parent_host_ref)
+
+def is_no_agent(tg, address=None):
+    if not address:
+        return
+    host = host_of(tg, address)
+    return bool(address._is_no_agent() or (host and host.no_agent()))
+
+def is_disabled(tg, address=None):
+    if not address:
+        return
+    host = host_of(tg, address)
+    return bool(address._is_disabled() or (host and host.disabled()))
+
+def get_archives(tg, address=None, template=None):
+    archives = []
+    if not address:
+        return archives
+    archive_refs = list(tg.task.archive_refs() or [])
+    host = host_of(tg, address)
+    if host and host.archive_refs():
+        archive_refs += host.archive_refs()
+    archive_tracker = {}
+    for archive_ref in archive_refs:
+        if not tg.psconfig.archive(archive_ref):
+            tg.error = "Unable to find archive defined in task: {}".format(archive_ref)
+            return
+    for archive in [tg.psconfig.archive(archive_ref) for archive_ref in archive_refs] + tg.default_archives:
+        if not archive_tracker.get(archive.checksum()):
+            archive_tracker[archive.checksum()] = True
+            archives.append(archive.data)
+    return archives
+
+def get_hosts(tg):
+    hosts = []
+    for address in tg.addresses:
+        host = host_of(tg, address)
+        hosts.append(host.data if host else {})
+    return hosts
+
+def build_config(count):
+    addresses = {}
+    hosts = {}
+    for i in range(count):
+        name = 'host{}'.format(i)
+        addresses[name] = {'address': '10.0.{}.{}'.format(i // 256, i % 256), 'host': name, 'labels': {'v6': {'address': 'fc00::{:x}'.format(i)}}}
+        hosts[name] = {'archives': ['esmond', 'host-archive{}'.format(i % 3)]}
+    hosts['host1']['no-agent'] = True
+    hosts['host2']['disabled'] = True
+    addresses['host3']['labels']['v6']['no-agent'] = True
+    archives = {'esmond': {'archiver': 'esmond', 'data': {'url': 'https://{% scheduled_by_address %}/esmond'}}}
+    for i in range(3):
+        archives['host-archive{}'.format(i)] = {'archiver': 'http', 'data': {'_url': 'https://archive{}.example.net'.format(i)}}
+    return Config(data={
+        'addresses': addresses,
+        'hosts': hosts,
+        'archives': archives,
+        'groups': {'group': {'type': 'mesh', 'addresses': [{'name': name, 'label': 'v6'} for name in addresses]}},
+        'tests': {'test': {'type': 'rtt', 'spec': {'source': '{% address[0] %}', 'dest': '{% address[1] %}'}}},
+        'tasks': {'task': {'group': 'group', 'test': 'test', 'archives': ['esmond']}}
+    })
+
+class TestTaskGeneratorIndex(TestCase):
+
+    def _tasks(self, psconfig):
+        tg = TaskGenerator(
+            psconfig=psconfig,
+            task_name='task',
+            default_archives=[Archive(data={'archiver': 'syslog', 'data': {}}), Archive(data={'archiver': 'esmond', 'data': {'url': 'https://{% scheduled_by_address %}/esmond'}})]
+        )
+        self.assertTrue(tg.start())
+        tasks = []
+        start = time.monotonic()
+        while tg.next():
+            tasks.append((
+                [a.address() for a in tg.addresses], tg.scheduled_by_address.address() if tg.scheduled_by_address else None,
+                tg.expanded_test, tg.expanded_archives, tg.error
+            ))
+        elapsed = time.monotonic() - start
+        tg.stop()
+        return tasks, elapsed
+
+    def _unindexed_tasks(self, psconfig):
+        with mock.patch.object(TaskGenerator, '_is_no_agent', is_no_agent), \
+                mock.patch.object(TaskGenerator, '_is_disabled', is_disabled), \
+                mock.patch.object(TaskGenerator, '_get_archives', get_archives), \
+                mock.patch.object(TaskGenerator, '_get_hosts', get_hosts):
+            return self._tasks(psconfig)
+
+    def test_same_tasks(self):
+        psconfig = build_config(8)
+        tasks = self._tasks(psconfig)[0]
+        self.assertEqual(self._unindexed_tasks(psconfig)[0], tasks)
+        #disabled host2 is skipped, no-agent host1 flips to the other side
+        self.assertFalse([t for t in tasks if 'fc00::2' in t[0]])
+        self.assertIn((['fc00::1', 'fc00::0'], 'fc00::0'), [(t[0], t[1]) for t in tasks])
+        #task, host and default archives without duplicates
+        self.assertEqual(['esmond', 'http', 'syslog'], [a['archiver'] for a in tasks[0][3]])
+
+        #missing archives are still reported for every pair
+        psconfig.data['hosts']['host4']['archives'].append('missing')
+        tasks = self._tasks(psconfig)[0]
+        self.assertEqual(self._unindexed_tasks(psconfig)[0], tasks)
+        self.assertTrue([t for t in tasks if t[4] and 'Unable to find archive' in t[4]])
+
+    def test_large_mesh(self):
+        psconfig = build_config(60)
+        self.assertEqual(self._unindexed_tasks(psconfig)[0], self._tasks(psconfig)[0])
+
+        #the lookups next() does for each pair
+        tg = TaskGenerator(psconfig=psconfig, task_name='task')
+        tg.start()
+        addrs = tg.next()
+        self.assertEqual((False, True, get_archives(tg, addrs[0])), (tg._is_disabled(addrs[0]), tg._is_no_agent(addrs[1]), tg._get_archives(addrs[0])))
+        self.assertEqual((False, True), (is_disabled(tg, addrs[0]), is_no_agent(tg, addrs[1])))
+        tg.stop()
+
+    @skipUnless(os.environ.get('PSCONFIG_BENCHMARK'), 'set PSCONFIG_BENCHMARK=1 to run benchmarks')
+    def test_benchmark(self):
+        ##
+        # Time a full pass of a 60 address mesh with and without the index
+        psconfig = build_config(60)
+        tasks, elapsed = self._tasks(psconfig)
+        unindexed_elapsed = self._unindexed_tasks(psconfig)[1]
+
+        #just the lookups next() does for each pair
+        tg = TaskGenerator(psconfig=psconfig, task_name='task')
+        tg.start()
+        addrs = tg.next()
+        timings = []
+        for lookups in [
+            lambda: (tg._is_disabled(addrs[0]), tg._is_no_agent(addrs[1]), tg._get_archives(addrs[0])),
+            lambda: (is_disabled(tg, addrs[0]), is_no_agent(tg, addrs[1]), get_archives(tg, addrs[0]))
+        ]:
+            start = time.monotonic()
+            for i in range(2000):
+                lookups()
+            timings.append(time.monotonic() - start)
+        tg.stop()
+        self.assertLess(timings[0], timings[1], 'task generator {} tasks: {:.2f}s indexed, {:.2f}s without index; 2000 lookups: {:.3f}s indexed, {:.3f}s without index'.format(
+            len(tasks), elapsed, unindexed_elapsed, *timings))
@@ -0,0 +1,58 @@
+from unittest import TestCase
+
+from psconfig.client.pscheduler.task import Task
+from psconfig.client.pscheduler.task_record import TaskRecord
+
+class TestTaskRecord(TestCase):
+
+    def _task(self):
+        return Task(
+            url='https://lead.example.net/pscheduler',
+            uuid='f5e4b6f4-8c7e-4a53-b06a-9d0c8f0b3a11',
+            data={
+                'test': {'type': 'latencybg', 'spec': {'source': 'a.example.net', 'dest': 'b.example.net', 'schema': 1}},
+                'tool': 'powstream',
+                'schedule': {'start': '2026-10-01T00:00:00Z', 'until': '2026-10-02T00:00:00Z'},
+                'archives': [{'archiver': 'esmond', 'data': {'url': 'https://archive.example.net/'}}],
+                'detail': {
+                    'enabled': True,
+                    'added': '2026-09-30T23:00:00Z',
+                    'start': '2026-10-01T00:00:00+00:00',
+                    'exclusive': False,
+                    'multi-result': True,
+                    'runs-started': 0,
+                    'href': 'https://lead.example.net/pscheduler/tasks/f5e4b6f4-8c7e-4a53-b06a-9d0c8f0b3a11'
+                }
+            }
+        )
+
+    def test_from_task(self):
+        task = self._task()
+        record = TaskRecord.from_task(task)
+        self.assertEqual(task.checksum(), record.checksum)
+        self.assertEqual('powstream', record.tool)
+        self.assertEqual(1790899200.0, record.until_ts)
+        self.assertEqual(1790812800.0, record.start_ts)
+        self.assertEqual('2026-10-01T00:00:00+00:00', record.start_iso)
+        self.assertFalse(record.exclusive)
+        self.assertTrue(record.multiresult)
+        self.assertEqual(0, record.runs_started)
+        self.assertFalse(record.keep)
+        self.assertFalse(hasattr(record, '__dict__'))
+
+    def test_start_falls_back_to_added(self):
+        task = self._task()
+        del task.data['detail']['start']
+        record = TaskRecord.from_task(task)
+        self.assertEqual('2026-09-30T23:00:00Z', record.start_iso)
+        self.assertEqual(1790809200.0, record.start_ts)
+
+    def test_task_rebuilt_without_detail(self):
+        task = self._task()
+        record = TaskRecord.from_task(task)
+        rebuilt = record.task()
+        self.assertEqual(task.uuid, rebuilt.uuid)
+        self.assertEqual(task.url, rebuilt.url)
+        self.assertNotIn('detail', rebuilt.data)
+        self.assertEqual(task.checksum(), rebuilt.checksum())
+        self.assertEqual('latencybg/powstream(a.example.net->b.example.net)', rebuilt.to_str())
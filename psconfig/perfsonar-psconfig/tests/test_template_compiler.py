@@ -0,0 +1,99 @@
+from unittest import TestCase
+import json
+import random
+
+from psconfig.client.psconfig.addresses.address import Address
+from psconfig.client.psconfig.parsers.template import Template
+
+def build_template(flip=False, jq_obj=None):
+    groups = [
+        Address(data={'address': '10.0.0.1', 'pscheduler-address': 'fc00::1', 'lead-bind-address': '10.1.0.1'}),
+        Address(data={'address': 'fc00::2'})
+    ]
+    if jq_obj is None:
+        jq_obj = {
+            'addresses': [g.data for g in groups],
+            'empty': '',
+            'odd': 'x%{y}"z\\w',
+            'url': 'https://fc00::9/esmond',
+            'task': {'name': 'a-b'}
+        }
+    return Template(groups=groups, scheduled_by_address=groups[0], flip=flip, jq_obj=jq_obj)
+
+TOKENS = [
+    '{% address[0] %}', '{% address[1] %}', '{%  scheduled_by_address %}', '{% flip %}', '{% localhost %}',
+    '{% pscheduler_address[0] %}', '{% lead_bind_address[0] %}', '{% jq .addresses[1].address %}',
+    '{% jq .empty %}', '{% jq .odd %}', '{% jq .url %}', '{% jq .task["name"] %}', '{% address[5] %}',
+    'x', ' ', '"', '\\', '{', '}', '%', '{% ', ' %}', ':', '/', 'https://', 'http://', 'fc00::3', '\n'
+]
+
+def random_obj(rand):
+    def value():
+        return ''.join(rand.choice(TOKENS) for i in range(rand.randint(1, 5)))
+    obj = {value(): value() for i in range(rand.randint(1, 3))}
+    obj['list'] = [value(), rand.randint(0, 9), {'nested': value()}]
+    return obj
+
+class TestCompiledTemplate(TestCase):
+
+    def _expand(self, template, obj, compiled):
+        ##
+        # Returns the expanded JSON or the error or exception, to compare both engines on
+        try:
+            if compiled:
+                result = template.render(template.compile(obj))
+            else:
+                result = template.expand(obj)
+        except Exception as e:
+            return 'exception', type(e).__name__
+        if result is None:
+            return 'error', template.error
+        return 'result', json.dumps(result)
+
+    def assertSameExpansion(self, obj, **kwargs):
+        expected = self._expand(build_template(**kwargs), obj, False)
+        self.assertEqual(expected, self._expand(build_template(**kwargs), obj, True), obj)
+        return expected
+
+    def test_examples(self):
+        test = {'type': 'throughput', 'spec': {
+            'source': '{% address[0] %}', 'dest': '{% address[1] %}', 'source-node': '{% pscheduler_address[0] %}',
+            'url': 'https://{% address[1] %}/{% jq .task["name"] %}', 'flip': '{% flip %}', 'dup': '{% address[0] %}-{% address[0] %}'
+        }}
+        for flip in [False, True]:
+            kind, result = self.assertSameExpansion(test, flip=flip)
+            self.assertEqual('result', kind)
+        self.assertEqual('https://[fc00::2]/a-b', json.loads(result)['spec']['url'])
+        self.assertEqual('10.0.0.1-10.0.0.1', json.loads(result)['spec']['dup'])
+
+        #values that interact with each other or the JSON around them
+        self.assertSameExpansion({'a': '{% jq .empty %}{% address[0] %}'})
+        self.assertSameExpansion({'a': '"{% address[0] %}" {% jq .odd %} {% address[1] %}'})
+        self.assertSameExpansion({'a': '{% x {% address[0] %} y %}', 'b': '{% x 10.0.0.1 y %}'})
+        self.assertEqual(('error', self._expand(build_template(), {'a': '{% localhost %}'}, False)[1]), self.assertSameExpansion({'a': '{% localhost %}'}))
+        self.assertEqual('exception', self.assertSameExpansion({'a': '{% unknown %}'})[0])
+        self.assertEqual(('error', 'Unable to expand variable address[5]: Index is too big in group[5] template variable'), self.assertSameExpansion({'a': '{% address[5] %}'}))
+        self.assertEqual(None, build_template().render(build_template().compile(None)))
+
+    def test_random(self):
+        rand = random.Random(1)
+        for i in range(1000):
+            self.assertSameExpansion(random_obj(rand), flip=bool(i % 2))
+
+    def test_task_templates(self):
+        test = {'type': 'latencybg', 'spec': {
+            'source': '{% address[0] %}', 'dest': '{% address[1] %}', 'source-node': '{% pscheduler_address[0] %}',
+            'dest-node': '{% pscheduler_address[1] %}', 'flip': '{% flip %}', 'data-ports': {'lower': 8760, 'upper': 9960},
+            'packet-interval': 0.1, 'packet-count': 600, 'ip-version': 6
+        }}
+        archive = {'archiver': 'esmond', 'data': {'url': 'https://{% scheduled_by_address %}/esmond/perfsonar/archive/', 'measurement-agent': '{% scheduled_by_address %}'}}
+        rand = random.Random(1)
+        for obj in [test, archive]:
+            #one compiled plan filled for many pairs, like TaskGenerator does
+            plan = build_template().compile(obj)
+            for i in range(500):
+                groups = [Address(data={'address': rand.choice(['10.0.0.{}', 'fc00::{}', 'host{}.example.net']).format(rand.randint(0, 99))}) for j in range(2)]
+                template = Template(groups=groups, scheduled_by_address=groups[i % 2], flip=bool(i % 2), jq_obj={})
+                expanded = template.expand(obj)
+                self.assertIsNotNone(expanded, template.error)
+                self.assertEqual(json.dumps(expanded), json.dumps(template.render(plan)))
@@ -0,0 +1,52 @@
+from concurrent.futures import ThreadPoolExecutor
+import urllib3
+
+from psconfig.client.utils import Utils
+from stub_server import StubHandler, StubServerTestCase
+
+class SourceAddressHandler(StubHandler):
+    '''Stub pScheduler that echoes back the source address of the connection'''
+
+    def do_GET(self):
+        self.send_json(self.client_address[0])
+
+class TestHttpTransport(StubServerTestCase):
+    #all of 127.0.0.0/8 is local on Linux so these can be used as distinct bind addresses
+    BIND_ADDRESSES = ['127.0.0.1', '127.0.0.2', '127.0.0.3', '127.0.0.4']
+    handler = SourceAddressHandler
+
+    def _get(self, bind_address):
+        result = Utils().send_http_request(
+            connection_type='GET',
+            url=self.url + '/hostname',
+            timeout=10,
+            local_address=bind_address,
+            transport=self.transport
+        )
+        if result['exception']:
+            return bind_address, str(result['exception'])
+        return bind_address, result['response'].json()
+
+    def test_connections_reused(self):
+        for i in range(5):
+            self.assertEqual(('127.0.0.2', '127.0.0.2'), self._get('127.0.0.2'))
+        stats = self.transport.stats()
+        self.assertEqual(5, stats['total']['requests'])
+        self.assertEqual(1, stats['total']['misses'])
+        self.assertEqual(4, stats['total']['hits'])
+
+    def test_bind_does_not_patch_urllib3(self):
+        create_connection = urllib3.util.connection.create_connection
+        self._get('127.0.0.3')
+        self.assertIs(create_connection, urllib3.util.connection.create_connection)
+
+    def test_concurrent_mixed_bind_addresses(self):
+        binds = [self.BIND_ADDRESSES[i % len(self.BIND_ADDRESSES)] for i in range(800)]
+        with ThreadPoolExecutor(max_workers=32) as executor:
+            results = list(executor.map(self._get, binds))
+        for bind_address, seen_address in results:
+            self.assertEqual(bind_address, seen_address, 'Request bound to {} arrived from {}'.format(bind_address, seen_address))
+        stats = self.transport.stats()
+        self.assertEqual(len(binds), stats['total']['requests'])
+        #one pool per bind address
+        self.assertEqual(len(self.BIND_ADDRESSES), len(stats) - 1)
@@ -266,6 +266,7 @@ fi
 %config(noreplace) %{config_base}/pscheduler-agent-logger.conf
 %{_unitdir}/psconfig-pscheduler-agent.service
 %attr(0755, perfsonar, perfsonar) %{command_base}/pscheduler-tasks
+%attr(0755, perfsonar, perfsonar) %{command_base}/pscheduler-failed-tasks
 
 %files grafana
 %defattr(0644,perfsonar,perfsonar,0755)